@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import sys, multiprocessing, subprocess, os, shutil, argparse, time, inspect
+import sys, multiprocessing, subprocess, os, shutil, argparse, time, inspect, bisect
 from Bio import SeqIO
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
@@ -52,21 +52,186 @@ def countGFFgenes(input):
                 count += 1
     return count
 
+#partitioning, parts are at most maxPart bp, at least minPart bp, and neighbouring parts overlap
+maxPart = 500000
+minPart = 100000
+overlap = 10000
+#estimated cost of a hint relative to a single unmasked base
+hintCost = 50
+
+def contigHints(input, folder, buffer=100000):
+    '''
+    split hints file into folder/contig.hints.tmp in one pass and return dictionary of contig: number of hints,
+    lines are buffered and appended so only one output file is open at a time
+    '''
+    counts = {}
+    pending = {}
+    count = 0
+    def _flush():
+        for name, lines in pending.items():
+            with open(os.path.join(folder, name+'.hints.tmp'), 'a') as output:
+                output.write(''.join(lines))
+        pending.clear()
+    with open(input, 'rU') as infile:
+        for line in infile:
+            cols = line.split('\t')
+            if len(cols) < 5:
+                continue
+            if not cols[0] in pending:
+                pending[cols[0]] = []
+            pending[cols[0]].append(line)
+            counts[cols[0]] = counts.get(cols[0], 0) + 1
+            count += 1
+            if count >= buffer:
+                _flush()
+                count = 0
+    _flush()
+    return counts
+
+def loadHints(input):
+    '''
+    parse hints file, return dictionary of contig: [(start, end)] sorted by start
+    '''
+    hints = {}
+    with open(input, 'rU') as infile:
+        for line in infile:
+            cols = line.split('\t')
+            if len(cols) < 5:
+                continue
+            if not cols[0] in hints:
+                hints[cols[0]] = []
+            hints[cols[0]].append((int(cols[3]), int(cols[4])))
+    for k in hints:
+        hints[k].sort()
+    return hints
+
+def intergenic(hints):
+    '''
+    merge overlapping hints into clusters, return the gaps between clusters as [(start, end)],
+    these are the best guess at intergenic space where a contig can be cut without splitting a gene
+    '''
+    gaps = []
+    clusterEnd = 0
+    for start, end in hints:
+        if clusterEnd and start > clusterEnd + 1:
+            gaps.append((clusterEnd + 1, start - 1))
+        clusterEnd = max(clusterEnd, end)
+    return gaps
+
+class WorkEstimate(object):
+    '''
+    estimated Augustus work for a region of a contig: unmasked bases plus a fixed cost per hint
+    '''
+    def __init__(self, seq, hints):
+        self.length = len(seq)
+        self.maskStarts = []
+        self.maskCum = [0]
+        for start, end in lib.softmaskedRegions(seq):
+            self.maskStarts.append(start + 1)
+            self.maskCum.append(self.maskCum[-1] + end - start + 1)
+        self.hintStarts = [x[0] for x in hints]
+
+    def masked(self, pos):
+        #number of masked bases in 1..pos
+        i = bisect.bisect_right(self.maskStarts, pos)
+        if i == 0:
+            return 0
+        runStart = self.maskStarts[i-1]
+        runLen = self.maskCum[i] - self.maskCum[i-1]
+        return self.maskCum[i-1] + min(runLen, pos - runStart + 1)
+
+    def work(self, start, end):
+        unmasked = (end - start + 1) - (self.masked(end) - self.masked(start - 1))
+        numHints = bisect.bisect_right(self.hintStarts, end) - bisect.bisect_left(self.hintStarts, start)
+        return unmasked + hintCost * numHints
+
+def partition(estimate, gaps, target):
+    '''
+    split a contig into overlapping [(start, end)] parts of roughly target work, moving each cut
+    into the largest intergenic gap in the last fifth of the part
+    '''
+    parts = []
+    start = 1
+    length = estimate.length
+    while True:
+        if length - start + 1 < 2 * minPart or (length - start + 1 <= maxPart and estimate.work(start, length) <= target):
+            parts.append((start, length))
+            break
+        #smallest end with enough work, capped at the maximum part length
+        lo = start + minPart
+        hi = min(start + maxPart, length)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if estimate.work(start, mid) >= target:
+                hi = mid
+            else:
+                lo = mid + 1
+        end = lo
+        window = max(start + minPart, end - (end - start) // 5)
+        candidates = [x for x in gaps if window <= (x[0] + x[1]) // 2 <= end]
+        if candidates:
+            best = max(candidates, key=lambda x: x[1] - x[0])
+            end = (best[0] + best[1]) // 2
+        if length - end < minPart:
+            parts.append((start, length))
+            break
+        parts.append((start, end))
+        start = end - overlap
+    return parts
+
+def splitHints(input, chunks, ranges, folder, buffer=100000):
+    '''
+    write the hints overlapping each chunk to folder/chunk.hints.gff in one pass over the hints file,
+    lines are buffered and appended so only one output file is open at a time
+    '''
+    byContig = {}
+    for x in chunks:
+        contig, start, end = ranges[x]
+        if not contig in byContig:
+            byContig[contig] = []
+        byContig[contig].append((start or 1, end or sys.maxint, x))
+        open(os.path.join(folder, x+'.hints.gff'), 'w').close()
+    starts = {}
+    for k, v in byContig.items():
+        v.sort()
+        starts[k] = [x[0] for x in v]
+    pending = {}
+    count = 0
+    def _flush():
+        for name, lines in pending.items():
+            with open(os.path.join(folder, name+'.hints.gff'), 'a') as output:
+                output.write(''.join(lines))
+        pending.clear()
+    with open(input, 'rU') as infile:
+        for line in infile:
+            cols = line.split('\t')
+            if len(cols) < 5 or not cols[0] in byContig:
+                continue
+            hintStart, hintEnd = int(cols[3]), int(cols[4])
+            parts = byContig[cols[0]]
+            #parts are sorted and only overlap their neighbours, so walk back from the last part starting before hint end
+            i = bisect.bisect_right(starts[cols[0]], hintEnd) - 1
+            while i >= 0 and parts[i][1] >= hintStart:
+                if not parts[i][2] in pending:
+                    pending[parts[i][2]] = []
+                pending[parts[i][2]].append(line)
+                count += 1
+                i -= 1
+            if count >= buffer:
+                _flush()
+                count = 0
+    _flush()
+
 def runAugustus(Input):
-    if '_part' in Input:
-        chr = Input.split('_part')[0]
-    else:
-        chr = Input
+    chr, start, end = ranges.get(Input)
     species='--species='+args.species
-    hints_input = '--hintsfile='+args.hints
+    hints_input = '--hintsfile='+os.path.join(tmpdir, Input+'.hints.gff')
     aug_out = os.path.join(tmpdir, Input+'.augustus.gff3')
     core_cmd = ['augustus', species, '--softmasking=1', '--gff3=on', '--UTR=off', '--stopCodonExcludedFromCDS=False', os.path.join(tmpdir, chr+'.fa')]
     if args.hints:
         core_cmd.insert(2, extrinsic)
         core_cmd.insert(3, hints_input)
-    if Input in ranges:
-        start = ranges.get(Input)[0]
-        end = ranges.get(Input)[1]
+    if start:
         core_cmd.insert(2, '--predictionStart='+str(start))
         core_cmd.insert(3, '--predictionEnd='+str(end))
     #try using library module
@@ -86,65 +251,76 @@ lib.log.debug(cmd_args)
 lib.log.debug("Splitting contigs and hints files")
 tmpdir = 'augustus_tmp_'+str(os.getpid())
 os.makedirs(tmpdir)
-scaffolds = []
 global ranges
 ranges = {}
+if args.hints:
+    hintCounts = contigHints(args.hints, tmpdir)
+else:
+    hintCounts = {}
+#first pass writes each contig to tmpdir and estimates its work from unmasked length and number of hints
+contigs = []
 with open(args.input, 'rU') as InputFasta:
     for record in SeqIO.parse(InputFasta, 'fasta'):
-        contiglength = len(record.seq)
-        if contiglength > 500000: #split large contigs
-            num_parts = contiglength / 500000 + 1
-            chunks = contiglength / num_parts
-            for i in range(0,num_parts):
-                name = str(record.id)+'_part'+str(i+1)
-                scaffolds.append(name)
-                outputfile = os.path.join(tmpdir, str(record.id)+'.fa')
-                if i == 0: #this is first record
-                    start = 1
-                    end = chunks + 10000
-                else:
-                    start = end - 10000
-                    end = start + chunks + 10000
-                if end > contiglength:
-                    end = contiglength
-                if not name in ranges:
-                    ranges[name] = (start, end)
-                with open(outputfile, 'w') as output:
-                    SeqIO.write(record, output, 'fasta')     
-        else:
-            name = str(record.id)
-            scaffolds.append(name)
-            outputfile = os.path.join(tmpdir, name+'.fa')
-            with open(outputfile, 'w') as output:
-                SeqIO.write(record, output, 'fasta')
-
-'''
-#if hints file passed, split it up by scaffold
-if args.hints:
-    for i in scaffolds:
-        if '_part' in i:
-            i = i.split('_part')[0]
-        if not os.path.isfile(os.path.join(tmpdir, i+'.hints.gff')):
-            with open(os.path.join(tmpdir, i+'.hints.gff'), 'w') as output:
-                with open(args.hints, 'rU') as hintsfile:
-                    for line in hintsfile:
-                        cols = line.split('\t')
-                        if cols[0] == i:
-                            output.write(line)
-'''
+        name = str(record.id)
+        with open(os.path.join(tmpdir, name+'.fa'), 'w') as output:
+            SeqIO.write(record, output, 'fasta')
+        seq = str(record.seq)
+        unmasked = len(seq) - sum(end - start + 1 for start, end in lib.softmaskedRegions(seq))
+        contigs.append((name, len(seq), unmasked + hintCost * hintCounts.get(name, 0)))
+totalWork = sum(x[2] for x in contigs)
+#aim for several tasks per cpu so the largest-first queue can balance the tail
+target = max(totalWork // (args.cpus * 4), 1)
+#second pass partitions one contig at a time, only contigs that need splitting are read back in,
+#each chunk gets only the hints that overlap it rather than every job parsing the whole file
+tasks = []
+chunks = []
+for name, length, work in contigs:
+    hintsTmp = os.path.join(tmpdir, name+'.hints.tmp')
+    if args.hints and not name in hintCounts:
+        open(hintsTmp, 'w').close()
+    if length < 2 * minPart or (length <= maxPart and work <= target):
+        parts = [(1, length)]
+    else:
+        hints = []
+        if args.hints:
+            hints = loadHints(hintsTmp).get(name, [])
+        estimate = WorkEstimate(str(SeqIO.read(os.path.join(tmpdir, name+'.fa'), 'fasta').seq), hints)
+        parts = partition(estimate, intergenic(hints), target)
+        partWork = [estimate.work(start, end) for start, end in parts]
+        del estimate, hints
+    if len(parts) == 1:
+        ranges[name] = (name, None, None)
+        tasks.append((work, name))
+        chunks.append(name)
+        if args.hints:
+            os.rename(hintsTmp, os.path.join(tmpdir, name+'.hints.gff'))
+    else:
+        partNames = []
+        for i, (start, end) in enumerate(parts):
+            part = name+'_part'+str(i+1)
+            ranges[part] = (name, start, end)
+            tasks.append((partWork[i], part))
+            partNames.append(part)
+        chunks += partNames
+        if args.hints:
+            splitHints(hintsTmp, partNames, ranges, tmpdir)
+            os.remove(hintsTmp)
+#largest tasks first, the pool hands out the next task as each worker finishes
+tasks.sort(key=lambda x: x[0], reverse=True)
+scaffolds = [x[1] for x in tasks]
 
 #now loop through each scaffold running augustus
 if args.cpus > len(scaffolds):
     num = len(scaffolds)
 else:
     num = args.cpus
-lib.log.debug("Running Augustus on %i chunks, using %i CPUs" % (len(scaffolds), num))
+lib.log.debug("Running Augustus on %i chunks, using %i CPUs, largest chunk is %.1f%% of estimated work" % (len(scaffolds), num, tasks[0][0] * 100.0 / max(totalWork, 1)))
 lib.runMultiProgress(runAugustus, scaffolds, num)
 
 
 lib.log.debug("Augustus prediction is finished, now concatenating results")
 with open(os.path.join(tmpdir, 'augustus_all.gff3'), 'w') as output:
-    for file in scaffolds:
+    for file in chunks:
         file = os.path.join(tmpdir, file+'.augustus.gff3')
         with open(file) as input:
             output.write(input.read())
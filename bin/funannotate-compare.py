@@ -3,7 +3,7 @@ from __future__ import division
 
 import sys, os, subprocess, inspect, shutil, argparse, shutil, warnings
 from datetime import datetime
-from goatools import obo_parser
+from StringIO import StringIO
 from Bio import SeqIO
 from natsort import natsorted
 import pandas as pd
@@ -186,14 +186,21 @@ for i in range(0,num_input):
     if not GBK: #check this
         lib.log.error("Error, was not able to find appropriate GenBank file in the annotate_results folder")
     gbkfilenames.append(GBK)
-    #now run genome routines
-    genomeStats = lib.genomeStats(GBK)
+
+#parse each GenBank file once (stats, functional annotation, GO terms, proteinortho inputs), genomes in parallel
+def parseGBK(input):
+    i, GBK = input
+    return i, lib.compareGBK(GBK, FUNDB, protortho, 'genome_'+str(i))
+
+parsed = {}
+for i, result in lib.runMultiProgressResults(parseGBK, list(enumerate(gbkfilenames)), min(args.cpus, num_input)):
+    parsed[i] = result
+for i in range(0,num_input):
+    genomeStats, functional, GOterms = parsed[i]
     if int(genomeStats[9].replace(',', '')) == 0:
         lib.log.error("%s contains 0 gene models, exiting script" % genomeStats[0])
         sys.exit(1)
     stats.append(genomeStats)
-    #this function will return list of dictionaries for each functional category
-    functional = lib.getGBKannotation(GBK, FUNDB)
     #split those dictionaries and append to master list for each group of annotation
     pfam.append(functional[0])
     ipr.append(functional[1])
@@ -218,8 +225,9 @@ for i in range(0,num_input):
             name = base+'-'+str(num+1)
         else:
             name = name+'-1'
-    lib.parseGOterms(GBK, go_folder, name)
-    lib.gb2proteinortho(GBK, protortho, name)
+    lib.writeGOterms(GOterms, go_folder, name)
+    for x in ['.gff', '.faa', '.transcripts.fa']:
+        os.rename(os.path.join(protortho, 'genome_'+str(i)+x), os.path.join(protortho, name+x))
     scinames.append(name)
 
 #convert busco to dictionary
@@ -684,11 +692,28 @@ if not os.path.isdir(os.path.join(args.out, 'go_enrichment')):
     os.makedirs(os.path.join(args.out, 'go_enrichment'))
     
 def runGOenrichment(input):
+    #goStudy is built once in the parent before the pool forks, workers share it
     basename = os.path.basename(input).replace('.txt', '')
     goa_out = os.path.join(args.out, 'go_enrichment', basename+'.go.enrichment.txt')
     if not lib.checkannotations(goa_out):
-        cmd = ['find_enrichment.py', '--obo', os.path.join(FUNDB, 'go.obo'), '--pval', '0.001', '--alpha', '0.001', '--method', 'fdr', input, os.path.join(go_folder, 'population.txt'), os.path.join(go_folder, 'associations.txt')]
-        lib.runSubprocess2(cmd, '.', lib.log, goa_out)
+        with open(input, 'rU') as infile:
+            study = set([line.rstrip() for line in infile if line.rstrip()])
+        with lib.suppress_stdout_stderr():
+            results = goStudy.run_study(study)
+        #same cutoff as find_enrichment.py --pval 0.001
+        results = [r for r in results if r.p_uncorrected < 0.001]
+        if results:
+            #goatools writes the header as '# GO\tNS...', drop the '# ' so it reads like find_enrichment.py output
+            table = StringIO()
+            goStudy.prt_tsv(table, results)
+            table = table.getvalue()
+            if table.startswith('# '):
+                table = table[2:]
+            with open(goa_out, 'w') as outfile:
+                outfile.write(table)
+        else:
+            with open(goa_out, 'w') as outfile:
+                outfile.write('# no GO terms with uncorrected p-value < 0.001\n')
 
 def GO_safe_run(*args, **kwargs):
     """Call run(), catch exceptions."""
@@ -706,6 +731,17 @@ if len(args.input) > 1:
                 with open(file) as input:
                     pop.write(input.read())
 
+    #load the ontology, associations, and population once, this is what find_enrichment.py did for every genome
+    from goatools.obo_parser import GODag
+    from goatools.associations import read_associations
+    from goatools.go_enrichment import GOEnrichmentStudy
+    with open(os.path.join(go_folder, 'population.txt'), 'rU') as infile:
+        population = set([line.rstrip() for line in infile if line.rstrip()])
+    with lib.suppress_stdout_stderr():
+        goDAG = GODag(os.path.join(FUNDB, 'go.obo'))
+        goAssoc = read_associations(os.path.join(go_folder, 'associations.txt'))
+        goStudy = GOEnrichmentStudy(population, goAssoc, goDAG, propagate_counts=True, alpha=0.001, methods=['fdr'])
+
     #now loop through each genome comparing to population
     file_list = []
     for f in os.listdir(go_folder):
@@ -1003,8 +1039,7 @@ if len(args.input) > 1:
                 orthoDict[i] = col[0]
             
 #get GO associations into dictionary as well
-with lib.suppress_stdout_stderr():
-    goLookup = obo_parser.GODag(os.path.join(FUNDB, 'go.obo'))
+goLookup = lib.dbIndex(os.path.join(FUNDB, 'go.obo'))
 goDict = {}
 go_errors = []
 with open(os.path.join(go_folder, 'associations.txt'), 'rU') as input:
@@ -1015,7 +1050,7 @@ with open(os.path.join(go_folder, 'associations.txt'), 'rU') as input:
         goList = []
         for i in gos:
             try:
-                description = i+' '+goLookup[i].name
+                description = i+' '+goLookup[i].split('\t')[0]
             except KeyError:
                 go_errors.append(i)
                 #print '%s not found in go.obo, try to download updated go file' % i
@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
-import sys, subprocess, os, itertools, argparse, signal
+import sys, subprocess, os, itertools, argparse, signal, inspect
 from multiprocessing import Pool
 from Bio import SeqIO
 from Bio.SeqIO.FastaIO import SimpleFastaParser
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+import lib.library as lib
 
 #setup menu with argparse
 class MyFormatter(argparse.ArgumentDefaultsHelpFormatter):
@@ -48,18 +52,7 @@ def calcN50(input):
     with open(input, 'rU') as infile:
         for id, sequence in SimpleFastaParser(infile):
             lengths.append(len(sequence))
-    #now get N50
-    lengths.sort()
-    nlist = []
-    for x in lengths:
-        nlist += [x]*x
-    if len(nlist) % 2 == 0:
-        medianpos = int(len(nlist) / 2)
-        N50 = int((nlist[medianpos] + nlist[medianpos-1]) / 2)
-    else:
-        medianpos = int(len(nlist) / 2)
-        N50 = int(nlist[medianpos])
-    return N50
+    return lib.AssemblyStats(lengths).nx(50)[0]
 
 def Sortbysize(input, n50):
     #sort records and return a list of scaffolds in descending size order
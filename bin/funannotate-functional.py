@@ -85,10 +85,10 @@ def combineHmmerOutputs(inputList, output):
  
 def multiPFAMsearch(inputList, cpus, tmpdir, output):
     #run hmmerscan multithreaded by running at same time
-    #input is a list of files, run multiprocessing on them
+    #input is a list of files, each worker thread waits on its own hmmsearch process
     pfam_results = os.path.join(os.path.dirname(tmpdir), 'pfam.txt')
     pfam_filtered = os.path.join(os.path.dirname(tmpdir), 'pfam.filtered.txt')
-    lib.runMultiNoProgress(safe_run, inputList, cpus)
+    lib.runThreads(safe_run, inputList, cpus)
     
     #now grab results and combine, kind of tricky as there are header and footers for each
     resultList = [os.path.join(tmpdir, f) for f in os.listdir(tmpdir) if os.path.isfile(os.path.join(tmpdir, f)) and f.endswith('.pfam.txt')]
@@ -133,7 +133,7 @@ def dbCANsearch(inputList, cpus, evalue, tmpdir, output):
     #run hmmerscan
     dbCAN_out = os.path.join(tmpdir, 'dbCAN.txt')
     dbCAN_filtered = os.path.join(tmpdir, 'dbCAN.filtered.txt')
-    lib.runMultiNoProgress(safe_run2, inputList, cpus)
+    lib.runThreads(safe_run2, inputList, cpus)
     #cmd = ['hmmscan', '--domtblout', dbCAN_out, '--cpu', str(cpus), '-E', str(evalue), HMM, input]
     #lib.runSubprocess3(cmd, '.', lib.log)
     
@@ -616,48 +616,151 @@ if not os.path.isdir(protDir):
 lib.fasta2chunks(Proteins, args.cpus, os.path.join(outputdir, 'annotate_misc'), 'split_prots')
 splitProts = [os.path.join(protDir, f) for f in os.listdir(protDir) if os.path.isfile(os.path.join(protDir, f))]
 
-#run PFAM-A search
+#paths of the search results
 pfam_results = os.path.join(outputdir, 'annotate_misc', 'annotations.pfam.txt')
-if not lib.checkannotations(pfam_results):
-    lib.log.info("Running HMMer search of PFAM version %s" % versDB.get('pfam'))
-    multiPFAMsearch(splitProts, args.cpus, protDir, pfam_results)
-else:
-    lib.log.info('Existing Pfam-A results found: {:}'.format(pfam_results))
-num_annotations = lib.line_count(pfam_results)
-lib.log.info('{0:,}'.format(num_annotations) + ' annotations added')
+eggnog_out = os.path.join(outputdir, 'annotate_misc', 'annotations.eggnog.txt')
+eggnog_result = os.path.join(outputdir, 'annotate_misc', 'eggnog.emapper.annotations')
+merops_out = os.path.join(outputdir, 'annotate_misc', 'annotations.merops.txt')
+dbCAN_out = os.path.join(outputdir, 'annotate_misc', 'annotations.dbCAN.txt')
+busco_out = os.path.join(outputdir, 'annotate_misc', 'annotations.busco.txt')
+buscoDB = os.path.join(FUNDB, args.busco_db)
+phobius_out = os.path.join(outputdir, 'annotate_misc', 'phobius.results.txt')
+phobiusLog = os.path.join(outputdir, 'logfiles', 'phobius.log')
+signalp_out = os.path.join(outputdir, 'annotate_misc', 'signalp.results.txt')
+secreted_out = os.path.join(outputdir, 'annotate_misc', 'annotations.secretome.txt')
+membrane_out = os.path.join(outputdir, 'annotate_misc', 'annotations.transmembrane.txt')
 
 #initiate Gene Name/Product dictionary
 GeneProducts = {}
+EggNog = {}
 
-#run SwissProt Blast search
-lib.log.info("Running Diamond blastp search of UniProt DB version %s" % versDB.get('uniprot'))
-blast_out = os.path.join(outputdir, 'annotate_misc', 'annotations.swissprot.txt')
-SwissProtBlast(Proteins, args.cpus, 1e-5, os.path.join(outputdir, 'annotate_misc'), GeneProducts)
+#each search is a stage, independent stages run at the same time sharing the --cpus budget
+def cpuShare(fraction):
+    return max(1, int(round(args.cpus * fraction)))
 
-#Check for EggNog annotations, parse if present
-eggnog_out = os.path.join(outputdir, 'annotate_misc', 'annotations.eggnog.txt')
-eggnog_result = os.path.join(outputdir, 'annotate_misc', 'eggnog.emapper.annotations')
-if args.eggnog:
-    if os.path.isfile(eggnog_result):
-        os.remove(eggnog_result)
-    shutil.copyfile(args.eggnog, eggnog_result)
-if not lib.checkannotations(eggnog_result):
-    if lib.which('emapper.py'): #eggnog installed, so run it
-        lib.log.info("Running Eggnog-mapper")
-        cmd = ['emapper.py', '-m', 'diamond', '-i', Proteins, '-o', 'eggnog', '--cpu', str(args.cpus)]
-        lib.runSubprocess(cmd, os.path.join(outputdir, 'annotate_misc'), lib.log)
+def runPfam(cpus):
+    if not lib.checkannotations(pfam_results):
+        lib.log.info("Running HMMer search of PFAM version %s" % versDB.get('pfam'))
+        multiPFAMsearch(splitProts, cpus, protDir, pfam_results)
     else:
-        lib.log.info("Install eggnog-mapper or use webserver to improve functional annotation: https://github.com/jhcepas/eggnog-mapper")
-else:
-    lib.log.info('Existing Eggnog-mapper results found: {:}'.format(eggnog_result)) 
-if lib.checkannotations(eggnog_result):
-    lib.log.info("Parsing EggNog Annotations")
-    EggNog = parseEggNoggMapper(eggnog_result, eggnog_out, GeneProducts)
-    num_annotations = lib.line_count(eggnog_out)
-    lib.log.info('{0:,}'.format(num_annotations) + ' COG and EggNog annotations added')            
-else:
-    lib.log.error("No Eggnog-mapper results found.")
-    EggNog = {}
+        lib.log.info('Existing Pfam-A results found: {:}'.format(pfam_results))
+    num_annotations = lib.line_count(pfam_results)
+    lib.log.info('{0:,}'.format(num_annotations) + ' PFAM annotations added')
+
+def runUniProt(cpus):
+    lib.log.info("Running Diamond blastp search of UniProt DB version %s" % versDB.get('uniprot'))
+    SwissProtBlast(Proteins, cpus, 1e-5, os.path.join(outputdir, 'annotate_misc'), GeneProducts)
+
+def runEggNog(cpus):
+    if args.eggnog:
+        if os.path.isfile(eggnog_result):
+            os.remove(eggnog_result)
+        shutil.copyfile(args.eggnog, eggnog_result)
+    if not lib.checkannotations(eggnog_result):
+        if lib.which('emapper.py'): #eggnog installed, so run it
+            lib.log.info("Running Eggnog-mapper")
+            cmd = ['emapper.py', '-m', 'diamond', '-i', Proteins, '-o', 'eggnog', '--cpu', str(cpus)]
+            lib.runSubprocess(cmd, os.path.join(outputdir, 'annotate_misc'), lib.log)
+        else:
+            lib.log.info("Install eggnog-mapper or use webserver to improve functional annotation: https://github.com/jhcepas/eggnog-mapper")
+    else:
+        lib.log.info('Existing Eggnog-mapper results found: {:}'.format(eggnog_result))
+
+def parseEggNog():
+    #runs after UniProt so that UniProt names stay first in GeneProducts
+    if lib.checkannotations(eggnog_result):
+        lib.log.info("Parsing EggNog Annotations")
+        EggNog.update(parseEggNoggMapper(eggnog_result, eggnog_out, GeneProducts))
+        num_annotations = lib.line_count(eggnog_out)
+        lib.log.info('{0:,}'.format(num_annotations) + ' COG and EggNog annotations added')
+    else:
+        lib.log.error("No Eggnog-mapper results found.")
+
+def runMEROPS(cpus):
+    if not lib.checkannotations(merops_out):
+        lib.log.info("Running Diamond blastp search of MEROPS version %s" % versDB.get('merops'))
+        MEROPSBlast(Proteins, cpus, 1e-5, os.path.join(outputdir, 'annotate_misc'), merops_out)
+    else:
+        lib.log.info('Existing MEROPS results found: {:}'.format(merops_out))
+    num_annotations = lib.line_count(merops_out)
+    lib.log.info('{0:,}'.format(num_annotations) + ' MEROPS annotations added')
+
+def runDbCAN(cpus):
+    if not lib.checkannotations(dbCAN_out):
+        lib.log.info("Annotating CAZYmes using HMMer search of dbCAN version %s" % versDB.get('dbCAN'))
+        dbCANsearch(splitProts, cpus, 1e-17, protDir, dbCAN_out)
+    else:
+        lib.log.info('Existing CAZYme results found: {:}'.format(dbCAN_out))
+    num_annotations = lib.line_count(dbCAN_out)
+    lib.log.info('{:,} CAZyme annotations added'.format(num_annotations))
+
+def runBUSCO(cpus):
+    if not lib.checkannotations(busco_out):
+        lib.log.info("Annotating proteins with BUSCO %s models" % args.busco_db)
+        lib.runBUSCO(Proteins, buscoDB, cpus, os.path.join(outputdir, 'annotate_misc'), busco_out)
+    else:
+        lib.log.info('Existing BUSCO2 results found: {:}'.format(busco_out))
+    num_annotations = lib.line_count(busco_out)
+    lib.log.info('{0:,}'.format(num_annotations) + ' BUSCO annotations added')
+
+def runPhobius(cpus):
+    #run Phobius if local is installed, otherwise you will have to use funannotate remote
+    if args.phobius:
+        if os.path.isfile(phobius_out):
+            os.remove(phobius_out)
+        shutil.copyfile(args.phobius, phobius_out)
+    if not lib.checkannotations(phobius_out):
+        if lib.which('phobius.pl'):
+            lib.log.info("Predicting secreted and transmembrane proteins using Phobius")
+            subprocess.call([os.path.join(parentdir, 'util', 'phobius-multiproc.py'), '-i', Proteins, '-o', phobius_out, '-l', phobiusLog, '--cpus', str(cpus)])
+        else:
+            lib.log.info("Skipping phobius predictions, try funannotate remote -m phobius")
+    else:
+        lib.log.info('Existing Phobius results found: {:}'.format(phobius_out))
+
+def runSignalP(cpus):
+    #run signalP if installed, have to manually install, so test if exists first
+    if lib.which('signalp'):
+        if not lib.checkannotations(signalp_out):
+            lib.log.info("Predicting secreted proteins with SignalP")
+            lib.signalP(Proteins, os.path.join(outputdir, 'annotate_misc'), signalp_out, cpus)
+        else:
+            lib.log.info('Existing SignalP results found: {:}'.format(signalp_out))
+
+def parseSecretome():
+    if lib.which('signalp'):
+        if lib.checkannotations(phobius_out):
+            lib.parsePhobiusSignalP(phobius_out, signalp_out, membrane_out, secreted_out)
+        else:
+            lib.parseSignalP(signalp_out, secreted_out)
+    else:
+        if not lib.checkannotations(phobius_out):
+            lib.log.info("Skipping secretome: neither SignalP nor Phobius searches were run")
+        else:
+            lib.log.info("SignalP not installed, secretome prediction less accurate using only Phobius")
+            lib.parsePhobiusSignalP(phobius_out, False, membrane_out, secreted_out)
+    if lib.checkannotations(secreted_out):
+        num_secreted = lib.line_count(secreted_out)
+    else:
+        num_secreted = 0
+    if lib.checkannotations(membrane_out):
+        num_mem = lib.line_count(membrane_out)
+    else:
+        num_mem = 0
+    lib.log.info('{0:,}'.format(num_secreted) + ' secretome and '+ '{0:,}'.format(num_mem) + ' transmembane annotations added')
+
+stages = lib.StageExecutor(args.cpus)
+stages.add('pfam', runPfam, [cpuShare(0.5)], cpus=cpuShare(0.5))
+stages.add('uniprot', runUniProt, [cpuShare(0.5)], cpus=cpuShare(0.5))
+stages.add('eggnog', runEggNog, [cpuShare(0.5)], cpus=cpuShare(0.5))
+stages.add('eggnog-parse', parseEggNog, after=['uniprot', 'eggnog'])
+stages.add('dbcan', runDbCAN, [cpuShare(0.25)], cpus=cpuShare(0.25))
+stages.add('busco', runBUSCO, [cpuShare(0.25)], cpus=cpuShare(0.25))
+stages.add('merops', runMEROPS, [cpuShare(0.25)], cpus=cpuShare(0.25))
+stages.add('phobius', runPhobius, [cpuShare(0.25)], cpus=cpuShare(0.25))
+stages.add('signalp', runSignalP, [cpuShare(0.25)], cpus=cpuShare(0.25))
+stages.add('secretome', parseSecretome, after=['phobius', 'signalp'])
+stages.run()
 
 RawProductNames = os.path.join(outputdir, 'annotate_misc', 'uniprot_eggnog_raw_names.txt')
 #GeneDict[ID] = [{'name': passname, 'product': final_desc}]
@@ -669,46 +772,21 @@ with open(RawProductNames, 'w') as uniprottmp:
 #combine the results from UniProt and Eggnog to parse Gene names and product descriptions
 #load curated list
 lib.log.info("Combining UniProt/EggNog gene and product names using Gene2Product version %s" % versDB.get('gene2product'))
-CuratedNames = {}
-with open(os.path.join(FUNDB, 'ncbi_cleaned_gene_products.txt'), 'rU') as input:
-    for line in input:
-        line = line.strip()
-        if line.startswith('#'):
-            continue
-        ID, product = line.split('\t')
-        if not ID in CuratedNames:
-            CuratedNames[ID] = product
+CuratedNames = lib.ProductNames(os.path.join(FUNDB, 'ncbi_cleaned_gene_products.txt'))
 
 GeneSeen = {}
 NeedCurating = {}
 NotInCurated = {}
-thenots = []
+thenots = set()
 for k,v in natsorted(GeneProducts.items()):
-    GeneName = None
-    GeneProduct = None
-    for x in v:
-        if x['name'] in CuratedNames:
-            GeneProduct = CuratedNames.get(x['name'])
-            GeneName = x['name']
-        elif x['name'].lower() in CuratedNames:
-            GeneProduct = CuratedNames.get(x['name'].lower())
-            GeneName = x['name']    
+    GeneName, GeneProduct = CuratedNames.lookup([x['name'] for x in v])
     if not GeneName: #taking first one will default to swissprot if products for both
         GeneName = v[0]['name']
         GeneProduct = v[0]['product']
         OriginalProd = GeneProduct
-        thenots.append(GeneName)
-        #if not GeneName in NotInCurated:
-        #    NotInCurated[GeneName] = GeneProduct
+        thenots.add(GeneName)
     #now attempt to clean the product name
-    rep = {'potential': 'putative', 'possible': 'putative', 'probable': 'putative', 'predicted': 'putative', 
-           'uncharacterized': 'putative', 'uncharacterised': 'putative', 'homolog': '', 'EC': '', 'COG': '', 
-           'inactivated': '', 'related': '', 'family': '', 'gene': 'protein', 'homologue': '','open reading frame': '',
-           'frame': '', 'yeast': '', 'Drosophila': '', 'Yeast': '', 'drosophila': ''}
-    # replace words in dictionary, from https://stackoverflow.com/questions/6116978/python-replace-multiple-strings
-    rep = dict((re.escape(k), v) for k, v in rep.iteritems())
-    pattern = re.compile("|".join(rep.keys()))
-    GeneProduct = pattern.sub(lambda m: rep[re.escape(m.group(0))], GeneProduct)
+    GeneProduct = CuratedNames.clean(GeneProduct)
     #if gene name in product, convert to lowercase
     if GeneName in GeneProduct:
         GeneProduct = GeneProduct.replace(GeneName, GeneName.lower())
@@ -722,12 +800,8 @@ for k,v in natsorted(GeneProducts.items()):
                 NeedCurating[GeneName] = [(OriginalProd, GeneProduct)]
             else:
                 NeedCurating[GeneName].append((OriginalProd, GeneProduct))
-    #make sure not multiple spaces
-    GeneProduct = ' '.join(GeneProduct.split())
-    GeneProduct = GeneProduct.replace('()', '')
-    if '(' in GeneProduct and not ')' in GeneProduct:
-        GeneProduct = GeneProduct.split('(')[0].rstrip()
-    GeneProduct = GeneProduct.replace(' ,', ',')
+    #make sure not multiple spaces, no empty or unclosed parentheses
+    GeneProduct = CuratedNames.tidy(GeneProduct)
     #populate dictionary of NotInCurated
     if GeneName in thenots:
         if not GeneName in NotInCurated:
@@ -756,85 +830,6 @@ with open(os.path.join(outputdir, 'annotate_misc', 'annotations.genes-products.t
 num_annotations = int(lib.line_count(os.path.join(outputdir, 'annotate_misc', 'annotations.genes-products.txt')) / 2)
 lib.log.info('{:,} gene name and product description annotations added'.format(num_annotations))
 
-#run MEROPS Blast search
-blast_out = os.path.join(outputdir, 'annotate_misc', 'annotations.merops.txt')
-merops_results = os.path.join(outputdir, 'annotate_misc', 'merops.xml')
-if not lib.checkannotations(blast_out):
-    lib.log.info("Running Diamond blastp search of MEROPS version %s" % versDB.get('merops'))
-    MEROPSBlast(Proteins, args.cpus, 1e-5, os.path.join(outputdir, 'annotate_misc'), blast_out)
-else:
-    lib.log.info('Existing MEROPS results found: {:}'.format(blast_out))
-num_annotations = lib.line_count(blast_out)
-lib.log.info('{0:,}'.format(num_annotations) + ' annotations added')
-
-#run dbCAN search
-dbCAN_out = os.path.join(outputdir, 'annotate_misc', 'annotations.dbCAN.txt')
-if not lib.checkannotations(dbCAN_out):
-    lib.log.info("Annotating CAZYmes using HMMer search of dbCAN version %s" % versDB.get('dbCAN'))
-    dbCANsearch(splitProts, args.cpus, 1e-17, protDir, dbCAN_out)
-else:
-    lib.log.info('Existing CAZYme results found: {:}'.format(dbCAN_out))
-num_annotations = lib.line_count(dbCAN_out)
-lib.log.info('{:,} annotations added'.format(num_annotations))
-
-#run BUSCO OGS search
-busco_out = os.path.join(outputdir, 'annotate_misc', 'annotations.busco.txt')
-buscoDB = os.path.join(FUNDB, args.busco_db)
-if not lib.checkannotations(busco_out):
-    lib.log.info("Annotating proteins with BUSCO %s models" % args.busco_db)
-    lib.runBUSCO(Proteins, buscoDB, args.cpus, os.path.join(outputdir, 'annotate_misc'), busco_out)
-else:
-    lib.log.info('Existing BUSCO2 results found: {:}'.format(busco_out))
-num_annotations = lib.line_count(busco_out)
-lib.log.info('{0:,}'.format(num_annotations) + ' annotations added')
-
-#run Phobius if local is installed, otherwise you will have to use funannotate remote
-phobius_out = os.path.join(outputdir, 'annotate_misc', 'phobius.results.txt')
-phobiusLog = os.path.join(outputdir, 'logfiles', 'phobius.log')
-if args.phobius:
-    if os.path.isfile(phobius_out):
-        os.remove(phobius_out)
-    shutil.copyfile(args.phobius, phobius_out)
-if not lib.checkannotations(phobius_out):
-    if lib.which('phobius.pl'):
-        if not lib.checkannotations(phobius_out):
-            lib.log.info("Predicting secreted and transmembrane proteins using Phobius")
-            subprocess.call([os.path.join(parentdir, 'util', 'phobius-multiproc.py'), '-i', Proteins, '-o', phobius_out, '-l', phobiusLog])        
-    else:
-        lib.log.info("Skipping phobius predictions, try funannotate remote -m phobius")
-else:
-    lib.log.info('Existing Phobius results found: {:}'.format(phobius_out))
-        
-#run signalP if installed, have to manually install, so test if exists first, then run it if it does, parse results
-signalp_out = os.path.join(outputdir, 'annotate_misc', 'signalp.results.txt')
-secreted_out = os.path.join(outputdir, 'annotate_misc', 'annotations.secretome.txt')
-membrane_out = os.path.join(outputdir, 'annotate_misc', 'annotations.transmembrane.txt')
-if lib.which('signalp'):
-    if not lib.checkannotations(signalp_out):
-        lib.log.info("Predicting secreted proteins with SignalP")
-        lib.signalP(Proteins, os.path.join(outputdir, 'annotate_misc'), signalp_out)
-    else:
-        lib.log.info('Existing SignalP results found: {:}'.format(signalp_out))
-    if lib.checkannotations(phobius_out):
-        lib.parsePhobiusSignalP(phobius_out, signalp_out, membrane_out, secreted_out)
-    else:
-        lib.parseSignalP(signalp_out, secreted_out)
-else:
-    if not lib.checkannotations(phobius_out):
-        lib.log.info("Skipping secretome: neither SignalP nor Phobius searches were run")
-    else:
-        lib.log.info("SignalP not installed, secretome prediction less accurate using only Phobius")
-        lib.parsePhobiusSignalP(phobius_out, False, membrane_out, secreted_out)
-if lib.checkannotations(secreted_out):
-    num_secreted = lib.line_count(secreted_out)
-else:
-    num_secreted = 0
-if lib.checkannotations(membrane_out):
-    num_mem = lib.line_count(membrane_out)
-else:
-    num_mem = 0
-lib.log.info('{0:,}'.format(num_secreted) + ' secretome and '+ '{0:,}'.format(num_mem) + ' transmembane annotations added')
-
 #interproscan
 IPRCombined = os.path.join(outputdir, 'annotate_misc', 'iprscan.xml')
 IPR_terms = os.path.join(outputdir, 'annotate_misc', 'annotations.iprscan.txt')
@@ -878,27 +873,26 @@ if args.annotations:
     num_annotations = lib.line_count(os.path.join(outputdir, 'annotate_misc', 'annotations.custom.txt'))
     lib.log.info('{0:,}'.format(num_annotations) + ' annotations added')
     
-#now bring all annotations together and annotated genome using gag, remove any duplicate annotations
+#now bring all annotations together into a single store keyed by locus, duplicates are dropped as they are added
+#only keep annotations for the transcripts/genes in the proteome, very large genomes are kept on disk
 ANNOTS = os.path.join(outputdir, 'annotate_misc', 'all.annotations.txt')
-GeneNames = lib.getGeneBasename(Proteins)
+GeneIDs = set()
+with open(Proteins, 'rU') as input:
+    for line in input:
+        if line.startswith('>'):
+            GeneIDs.update(line[1:].split())
+if len(GeneIDs) > 200000:
+    Annotations = lib.AnnotationStore(IDs=GeneIDs, db=os.path.join(outputdir, 'annotate_misc', 'all.annotations.db'))
+else:
+    Annotations = lib.AnnotationStore(IDs=GeneIDs)
 total_annotations = 0
 filtered_annotations = 0
-lines_seen = set()
-with open(ANNOTS, 'w') as output:
-    for file in os.listdir(os.path.join(outputdir, 'annotate_misc')):
-        if file.startswith('annotations'):
-            file = os.path.join(outputdir, 'annotate_misc', file)
-            with open(file) as input:
-                for line in input:
-                    total_annotations += 1
-                    if not line.startswith(tuple(GeneNames)):
-                        continue
-                    if line.count('\t') != 2: #make sure it is 3 columns
-                        continue
-                    if line not in lines_seen:
-                        output.write(line)
-                        lines_seen.add(line)
-                        filtered_annotations += 1
+for file in os.listdir(os.path.join(outputdir, 'annotate_misc')):
+    if file.startswith('annotations'):
+        total, added = Annotations.load(os.path.join(outputdir, 'annotate_misc', file))
+        total_annotations += total
+        filtered_annotations += added
+Annotations.write(ANNOTS)
 ANNOTS = os.path.abspath(ANNOTS)
 diff_annotations = total_annotations - filtered_annotations
 lib.log.info("Found " + '{0:,}'.format(diff_annotations) + " duplicated annotations, adding " + '{0:,}'.format(filtered_annotations) + ' valid annotations')
@@ -910,10 +904,6 @@ os.makedirs(os.path.join(outputdir, 'annotate_misc', 'tbl2asn'))
 TBLOUT = os.path.join(outputdir, 'annotate_misc', 'tbl2asn', 'genome.tbl')
 shutil.copyfile(Scaffolds, os.path.join(outputdir, 'annotate_misc', 'tbl2asn', 'genome.fsa'))
 
-#add annotation to tbl annotation file, generate dictionary of dictionaries with values as a list
-#need to keep multiple transcripts annotations separate, so this approach may have to modified
-Annotations = lib.annotations2dict(ANNOTS)
-
 #to update annotations, user can pass --fix or --remove, update Annotations here
 if args.fix:
     with open(args.fix, 'rU') as fixfile:
@@ -925,8 +915,8 @@ if args.fix:
             if len(cols) < 3: #skip if number of columns isn't correct
                 continue
             if cols[0] in Annotations:
-                Annotations[cols[0]]['name'] = [cols[1]]
-                Annotations[cols[0]]['product'] = [cols[2]]
+                Annotations.replace(cols[0], 'name', [cols[1]])
+                Annotations.replace(cols[0], 'product', [cols[2]])
             if cols[1] in NotInCurated:
                 NotInCurated[cols[1]] = [cols[2]]
             if cols[1] in NeedCurating:
@@ -943,10 +933,8 @@ if args.remove:
                 continue
             cols = line.split('\t')
             if cols[0] in Annotations:
-                if 'name' in Annotations[cols[0]]:
-                    del Annotations[cols[0]]['name']
-                if 'product' in Annotations[cols[0]]:
-                    del Annotations[cols[0]]['product']
+                Annotations.replace(cols[0], 'name', [])
+                Annotations.replace(cols[0], 'product', [])
             if cols[0] in Gene2ProdFinal:
                 del Gene2ProdFinal[cols[0]]
 
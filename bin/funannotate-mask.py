@@ -5,7 +5,6 @@ import os
 import argparse
 import shutil
 import inspect
-from Bio.SeqIO.FastaIO import SimpleFastaParser
 from natsort import natsorted
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
@@ -70,17 +69,8 @@ else:
         sys.exit(1)
 
 #output some stats on %reads masked.
-scaffolds = 0
-maskedSize = 0
-GenomeLength = 0
-with open(args.out, 'rU') as input:
-    for rec, Seq in SimpleFastaParser(input):
-        scaffolds += 1
-        GenomeLength += len(Seq)
-        maskedSize += lib.n_lower_chars(Seq)
-
-percentMask = maskedSize / float(GenomeLength)
-lib.log.info('Repeatmasking finished: \nMasked genome: {:}\nnum scaffolds: {:,}\nassembly size: {:,} bp\nmasked repeats: {:,} bp ({:.2f}%)'.format(os.path.abspath(args.out), scaffolds, GenomeLength, maskedSize, percentMask*100))
+stats = lib.assemblyStats(args.out)
+lib.log.info('Repeatmasking finished: \nMasked genome: {:}\n{:}'.format(os.path.abspath(args.out), stats.summary()))
 if repeats:
     lib.log.info('RepeatModeler library: {:}'.format(repeats))
 #clean up
@@ -25,6 +25,7 @@ parser.add_argument('-t','--tblastn_out', help='Save tblastn output')
 parser.add_argument('--maxintron', default = 3000, help='Maximum intron size')
 parser.add_argument('--logfile', default ='funannotate-p2g.log', help='logfile')
 parser.add_argument('--ploidy', default =1, type=int, help='Ploidy of assembly')
+parser.add_argument('--batch', default=100, type=int, help='Maximum hit regions per protein aligned in a single exonerate call')
 parser.add_argument('--debug', action='store_true', help='Keep intermediate folders if error detected')
 parser.add_argument('-f','--filter', default='diamond', choices=['diamond', 'tblastn'], help='Method to use for pre-filter for exonerate')
 parser.add_argument('--EVM_HOME', help='Path to Evidence Modeler home directory, $EVM_HOME')
@@ -147,57 +148,84 @@ def parseBlast(blastresult):
     return HitList
 
 def runExonerate(input):
-    s = input.split(':::')
-    ProtID = s[0]
-    ScaffID = s[1]
-    ScaffStart = int(s[2])
-    ScaffEnd = int(s[3])
+    '''
+    align one protein to all of its pre-filter hit regions with a single exonerate call,
+    returns the exonerate output already offset back to whole scaffold coordinates
+    '''
+    num, ProtID, hits = input
     #get the protein model
-    query = os.path.join(tmpdir, ProtID+'.'+str(os.getpid())+'.fa')
+    query = os.path.join(tmpdir, ProtID+'.'+str(num)+'.fa')
     with open(query, 'w') as output:
         SeqIO.write(protein_dict[ProtID], output, 'fasta')
-    #now get the genome region, use different variable names for SeqRecords to avoid collision
-    scaffold = os.path.join(tmpdir, ScaffID+'.'+ProtID+'.'+str(ScaffStart)+'-'+str(ScaffEnd)+'.fa')
+    #now get the genome regions from the indexed genome, grab a 3 kb cushion on either side of hit region, careful of scaffold ends
+    #regions get a simple name so that exonerate output can be mapped back to the scaffold and its offset
+    offsets = {}
+    scaffold = os.path.join(tmpdir, ProtID+'.'+str(num)+'.regions.fa')
     with open(scaffold, 'w') as output2:
-        with open(os.path.join(tmpdir, 'scaffolds', ScaffID+'.fa'), 'rU') as fullscaff:
-            for header, Sequence in SimpleFastaParser(fullscaff):
-                #grab a 3 kb cushion on either side of hit region, careful of scaffold ends      
-                start = ScaffStart - 3000
-                if start < 1:
-                    start = 1
-                end = ScaffEnd + 3000
-                if end > len(Sequence):
-                    end = len(Sequence)
-                output2.write('>%s\n%s\n' % (header, Sequence[start:end]))
-    exoname = ProtID+'.'+ScaffID+'__'+str(start)+'__'
-    #check that input files are created and valid
-    exonerate_out = os.path.join(tmpdir, 'exonerate.' + exoname + '.out')
+        for i, (ScaffID, ScaffStart, ScaffEnd) in enumerate(hits):
+            start = ScaffStart - 3000
+            if start < 1:
+                start = 1
+            end = ScaffEnd + 3000
+            if end > genome_index.length(ScaffID):
+                end = genome_index.length(ScaffID)
+            region = 'region_'+str(i)
+            offsets[region] = (ScaffID, start)
+            output2.write('>%s\n%s\n' % (region, genome_index.fetch(ScaffID, start, end)))
     ryo = "AveragePercentIdentity: %pi\n"
     cmd = ['exonerate', '--model', 'p2g', '--showvulgar', 'no', '--showalignment', 'no', 
         '--showquerygff', 'no', '--showtargetgff', 'yes', '--maxintron', str(args.maxintron), '--percent', '80', '--ryo', ryo , query, scaffold]
-    if lib.checkannotations(query) and lib.checkannotations(scaffold):
-        #run exonerate, capture errors
-        with open(exonerate_out, 'w') as output3:
-            proc = subprocess.Popen(cmd, stdout = output3, stderr=subprocess.PIPE)
-        stderr = proc.communicate()
-        if 'WARNING' in stderr[1]:
-            lib.log.debug('Error in input:{:}'.format(input))
-            lib.log.debug('%s, Len=%i, %i-%i; %i-%i' % (header, len(Sequence), ScaffStart, ScaffEnd, start, end))
-            os.rename(query, os.path.join(tmpdir, 'failed', os.path.basename(query)))
-            os.rename(scaffold, os.path.join(tmpdir, 'failed', os.path.basename(scaffold)))
-        else:   
-            for y in [query, scaffold]:
-                try:
-                    lib.SafeRemove(y)
-                except OSError:
-                    lib.log.debug("Error removing %s" % (y))   
-        #check filesize of exonerate output, no hits still have some output data in them, should be safe dropping anything smaller than 500 bytes
-        if lib.getSize(exonerate_out) < 500:
-            os.remove(exonerate_out)
-    else:
-        lib.log.debug('Error in query or scaffold:{:}'.format(input))
+    if not lib.checkannotations(query) or not lib.checkannotations(scaffold):
+        lib.log.debug('Error in query or scaffold:{:} {:}'.format(ProtID, hits))
         lib.SafeRemove(query)
         lib.SafeRemove(scaffold)
+        return ''
+    #run exonerate, capture errors
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    if 'WARNING' in stderr:
+        lib.log.debug('Error in input:{:} {:}'.format(ProtID, hits))
+        os.rename(query, os.path.join(tmpdir, 'failed', os.path.basename(query)))
+        os.rename(scaffold, os.path.join(tmpdir, 'failed', os.path.basename(scaffold)))
+    else:   
+        for y in [query, scaffold]:
+            try:
+                lib.SafeRemove(y)
+            except OSError:
+                lib.log.debug("Error removing %s" % (y))
+    #offset predictions back to whole scaffolds, no hits still have some output data, so only keep if something aligned
+    result = []
+    aligned = False
+    for line in stdout.splitlines(True):
+        if line.startswith('#') or line.startswith('Average') or line.startswith('-- completed'):
+            result.append(line)
+        elif '\t' in line:
+            cols = line.split('\t')
+            ScaffID, offset = offsets[cols[0]]
+            cols[0] = ScaffID
+            cols[3] = str(int(cols[3])+offset)
+            cols[4] = str(int(cols[4])+offset)
+            result.append('\t'.join(cols))
+            aligned = True
+    if aligned:
+        return ''.join(result)
+    return ''
+
+def groupHits(hits, size):
+    '''
+    group the hit:::scaffold:::start:::stop list by protein into work units of at most size hits
+    '''
+    byProtein = {}
+    for x in hits:
+        ProtID, ScaffID, start, end = x.split(':::')
+        if not ProtID in byProtein:
+            byProtein[ProtID] = []
+        byProtein[ProtID].append((ScaffID, int(start), int(end)))
+    units = []
+    for k,v in byProtein.items():
+        for i in range(0, len(v), size):
+            units.append((len(units), k, v[i:i+size]))
+    return units
 
 #count number of proteins to look for
 total = lib.countfasta(args.proteins)
@@ -208,7 +236,6 @@ tmpdir = 'p2g_'+ str(os.getpid())
 if not os.path.isdir(tmpdir):
     os.makedirs(tmpdir)
     os.makedirs(os.path.join(tmpdir, 'failed'))
-    os.makedirs(os.path.join(tmpdir, 'scaffolds'))
 
 if args.filter == 'tblastn':
     lib.log.debug("BLAST v%s; Exonerate v%s" % (blast_version, exo_version))
@@ -232,32 +259,19 @@ else:
     
 lib.log.info('Found {0:,}'.format(len(Hits))+' preliminary alignments')
 
-#index the genome and proteins
+#index the proteins
 protein_dict = SeqIO.index(os.path.abspath(args.proteins), 'fasta') #do index here in case memory problems?
 
-#split genome fasta into individual scaffolds
-with open(os.path.abspath(args.genome), 'rU') as input:
-    for record in SeqIO.parse(input, "fasta"):
-        SeqIO.write(record, os.path.join(tmpdir, 'scaffolds', record.id + ".fa"), "fasta")
-
-#run multiprocessing exonerate
-lib.runMultiProgress(runExonerate, Hits, args.cpus)
+#index the genome once, workers slice regions out of a shared memory map instead of reparsing scaffolds
+genome_index = lib.indexFasta(os.path.abspath(args.genome), tmpdir)
 
-#now need to loop through and offset exonerate predictions back to whole scaffolds
+#group hits by protein, then run multiprocessing exonerate and stream results straight into combined output
+Units = groupHits(Hits, args.batch)
+lib.log.debug('Running exonerate on {:,} protein work units'.format(len(Units)))
 exonerate_raw = os.path.join(tmpdir, 'exonerate.out.combined')
 with open(exonerate_raw, 'w') as output:
-    for file in os.listdir(tmpdir):
-        if file.endswith('.out'):
-            with open(os.path.join(tmpdir, file), 'rU') as exoresult:
-                offset = int(file.split('__')[1])
-                for line in itertools.islice(exoresult, 3, None):
-                    if line.startswith('#') or line.startswith('Average') or line.startswith('-- completed'):
-                        output.write(line)
-                    else:
-                        cols = line.split('\t')
-                        cols[3] = str(int(cols[3])+offset)
-                        cols[4] = str(int(cols[4])+offset)
-                        output.write('\t'.join(cols))
+    for result in lib.runMultiProgressResults(runExonerate, Units, args.cpus):
+        output.write(result)
 
 #convert to GFF3 using ExoConverter from EVM
 with open(args.out, 'w') as output:
@@ -100,6 +100,9 @@ lib.setupLogging(log_name)
 FNULL = open(os.devnull, 'w')
 cmd_args = " ".join(sys.argv)+'\n'
 lib.log.debug(cmd_args)
+
+stages = lib.StageCache(os.path.join(args.out, 'predict_misc', 'stages.json'))
+
 sys.stderr.write("-------------------------------------------------------\n")
 lib.SystemInfo()
 
@@ -430,7 +433,8 @@ if args.input:
         lib.log.error('Error: Genome is not repeat-masked, to ignore use --force. Or soft-mask using `funannotate mask` command or suitable external program.')
         sys.exit(1)
     else:
-        lib.log.info('Genome loaded: {:,} scaffolds; {:,} bp; {:.2%} repeats masked'.format(len(ContigSizes), GenomeLength, percentMask))    
+        N50, L50 = lib.AssemblyStats(ContigSizes.values()).nx(50)
+        lib.log.info('Genome loaded: {:,} scaffolds; {:,} bp; N50 {:,} bp (L50 {:,}); {:.2%} repeats masked'.format(len(ContigSizes), GenomeLength, N50, L50, percentMask))    
     #just copy the input fasta to the misc folder and move on.
     shutil.copyfile(args.input, MaskGenome)
 else:
@@ -547,88 +551,91 @@ else:
     FinalTrainingModels = os.path.join(args.out, 'predict_misc', 'final_training_models.gff3')
     if args.transcript_alignments:
         shutil.copyfile(args.transcript_alignments, trans_out)
-    if not lib.checkannotations(trans_out):
+    if args.transcript_evidence and not args.transcript_alignments:
         #combine transcript evidence into a single file
-        if args.transcript_evidence:
-            if os.path.isfile(trans_temp):
-                lib.SafeRemove(trans_temp)  
-            with open(trans_temp, 'w') as output:
-                for f in args.transcript_evidence:
-                    with open(f) as input:
-                        output.write(input.read())
-            if 'minimap2' in args.aligners:
-                minimapBAM = os.path.join(args.out, 'predict_misc', 'transcripts.minimap2.bam')
-                if not lib.checkannotations(minimapGFF3) or not lib.checkannotations(hintsM):
-                    lib.log.info("Aligning transcript evidence to genome with minimap2")
-                    lib.minimap2Align(trans_temp, MaskGenome, args.cpus, args.max_intronlen, minimapBAM)
-                    minimapCount = lib.bam2ExonsHints(minimapBAM, minimapGFF3, hintsM)
-                    lib.log.info("Found {:,} alignments, wrote GFF3 and Augustus hints to file".format(minimapCount))
-                else:
-                    lib.log.info('Existing minimap2 alignments found: {:} and {:}'.format(minimapGFF3,hintsM))
-            if 'gmap' in args.aligners:
-                #run Gmap of transcripts to genome
-                if not lib.checkannotations(gmapGFF3):
-                    lib.log.info("Aligning transcript evidence to genome with GMAP")
-                    lib.runGMAP(trans_temp, MaskGenome, args.cpus, args.max_intronlen, os.path.join(args.out, 'predict_misc'), gmapGFF3)
-                    gmapCount = lib.countGMAPtranscripts(gmapGFF3)
-                    lib.log.info("Found {:,} alignments, wrote GFF3 to file".format(gmapCount))
-                else:
-                    lib.log.info('Existing gmap alignments found: {:}'.format(gmapGFF3))
-            if 'blat' in args.aligners:
-                if not lib.checkannotations(hintsE):
-                    #now run BLAT for Augustus hints
-                    lib.log.info("Aligning transcript evidence to genome with BLAT")
-                    cmd = ['blat', '-noHead', '-minIdentity=80', maxINT, MaskGenome, trans_temp, blat_out]
-                    lib.runSubprocess(cmd, '.', lib.log)
-                    cmd = ['pslCDnaFilter', '-minId=0.9', '-localNearBest=0.005', '-ignoreNs', '-bestOverlap', blat_out, blat_filt]
-                    lib.runSubprocess(cmd, '.', lib.log)
-                    cmd = ['sort', '-n', '-k', '16,16', blat_filt]
-                    lib.runSubprocess2(cmd, '.', lib.log, blat_sort1)
-                    cmd = ['sort', '-s', '-k', '14,14', blat_sort1]
-                    lib.runSubprocess2(cmd, '.', lib.log, blat_sort2)
-                    #run blat2hints
-                    if lib.which('blat2hints.pl'):
-                        blat2hints = 'blat2hints.pl'
-                    else:
-                        blat2hints = os.path.join(AUGUSTUS_BASE, 'scripts', 'blat2hints.pl')
-                    cmd = [blat2hints, b2h_input, b2h_output, '--minintronlen=20', '--trunkSS']
-                    lib.runSubprocess(cmd, '.', lib.log)
-                    total = lib.line_count(blat_sort2)
-                    lib.log.info('{0:,}'.format(total) + ' filtered BLAT alignments')
+        if os.path.isfile(trans_temp):
+            lib.SafeRemove(trans_temp)  
+        with open(trans_temp, 'w') as output:
+            for f in args.transcript_evidence:
+                with open(f) as input:
+                    output.write(input.read())
+        if 'minimap2' in args.aligners:
+            minimapBAM = os.path.join(args.out, 'predict_misc', 'transcripts.minimap2.bam')
+            stage = {'inputs': [trans_temp, MaskGenome], 'versions': [lib.toolVersion(['minimap2', '--version'])], 'args': [args.max_intronlen], 'outputs': [minimapGFF3, hintsM]}
+            if not stages.valid('minimap2', **stage):
+                lib.log.info("Aligning transcript evidence to genome with minimap2")
+                lib.minimap2Align(trans_temp, MaskGenome, args.cpus, args.max_intronlen, minimapBAM)
+                minimapCount = lib.bam2ExonsHints(minimapBAM, minimapGFF3, hintsM, cpus=args.cpus)
+                lib.log.info("Found {:,} alignments, wrote GFF3 and Augustus hints to file".format(minimapCount))
+                stages.update('minimap2', **stage)
+            else:
+                lib.log.info('Existing minimap2 alignments found: {:} and {:}'.format(minimapGFF3,hintsM))
+        if 'gmap' in args.aligners:
+            #run Gmap of transcripts to genome
+            stage = {'inputs': [trans_temp, MaskGenome], 'versions': [lib.toolVersion(['gmap', '--version'])], 'args': [args.max_intronlen], 'outputs': [gmapGFF3]}
+            if not stages.valid('gmap', **stage):
+                lib.log.info("Aligning transcript evidence to genome with GMAP")
+                lib.runGMAP(trans_temp, MaskGenome, args.cpus, args.max_intronlen, os.path.join(args.out, 'predict_misc'), gmapGFF3)
+                gmapCount = lib.countGMAPtranscripts(gmapGFF3)
+                lib.log.info("Found {:,} alignments, wrote GFF3 to file".format(gmapCount))
+                stages.update('gmap', **stage)
+            else:
+                lib.log.info('Existing gmap alignments found: {:}'.format(gmapGFF3))
+        if 'blat' in args.aligners:
+            stage = {'inputs': [trans_temp, MaskGenome], 'versions': [lib.toolVersion(['blat'])], 'args': [args.max_intronlen], 'outputs': [hintsE]}
+            if not stages.valid('blat', **stage):
+                #now run BLAT for Augustus hints
+                lib.log.info("Aligning transcript evidence to genome with BLAT")
+                cmd = ['blat', '-noHead', '-minIdentity=80', maxINT, MaskGenome, trans_temp, blat_out]
+                lib.runSubprocess(cmd, '.', lib.log)
+                cmd = ['pslCDnaFilter', '-minId=0.9', '-localNearBest=0.005', '-ignoreNs', '-bestOverlap', blat_out, blat_filt]
+                lib.runSubprocess(cmd, '.', lib.log)
+                cmd = ['sort', '-n', '-k', '16,16', blat_filt]
+                lib.runSubprocess2(cmd, '.', lib.log, blat_sort1)
+                cmd = ['sort', '-s', '-k', '14,14', blat_sort1]
+                lib.runSubprocess2(cmd, '.', lib.log, blat_sort2)
+                #run blat2hints
+                if lib.which('blat2hints.pl'):
+                    blat2hints = 'blat2hints.pl'
                 else:
-                    lib.log.info('Existing blat hintsfile found {:}'.format(hintsE))
-                    
-            #combine transcripts for EVM (need to process GMAP ones here)
-            if lib.checkannotations(minimapGFF3) and lib.checkannotations(gmapGFF3):
-                #write function to rename/gmap and combine with minimap data
-                lib.combineTranscripts(minimapGFF3, gmapGFF3, trans_out)
-            elif lib.checkannotations(minimapGFF3):
-                shutil.copyfile(minimapGFF3, trans_out)
-            elif lib.checkannotations(gmapGFF3):
-                lib.combineTranscripts(False, gmapGFF3, trans_out)
-            Transcripts = os.path.abspath(trans_out)
-        else:
-            Transcripts = False
-    else:
+                    blat2hints = os.path.join(AUGUSTUS_BASE, 'scripts', 'blat2hints.pl')
+                cmd = [blat2hints, b2h_input, b2h_output, '--minintronlen=20', '--trunkSS']
+                lib.runSubprocess(cmd, '.', lib.log)
+                total = lib.line_count(blat_sort2)
+                lib.log.info('{0:,}'.format(total) + ' filtered BLAT alignments')
+                stages.update('blat', **stage)
+            else:
+                lib.log.info('Existing blat hintsfile found {:}'.format(hintsE))
+                
+        #combine transcripts for EVM (need to process GMAP ones here)
+        if lib.checkannotations(minimapGFF3) and lib.checkannotations(gmapGFF3):
+            #write function to rename/gmap and combine with minimap data
+            lib.combineTranscripts(minimapGFF3, gmapGFF3, trans_out)
+        elif lib.checkannotations(minimapGFF3):
+            shutil.copyfile(minimapGFF3, trans_out)
+        elif lib.checkannotations(gmapGFF3):
+            lib.combineTranscripts(False, gmapGFF3, trans_out)
+        Transcripts = os.path.abspath(trans_out)
+    elif lib.checkannotations(trans_out):
         lib.log.info('Existing transcript alignments found: {:}'.format(trans_out))
         Transcripts = os.path.abspath(trans_out)
+    else:
+        Transcripts = False
     #check if BAM file passed, if so run bam2hints
     if args.rna_bam and not args.braker:
-        if not lib.checkannotations(hintsBAM):
+        stage = {'inputs': [args.rna_bam, MaskGenome], 'versions': [lib.toolVersion(['augustus', '--version'])], 'args': [], 'outputs': [hintsBAM]}
+        if not stages.valid('bam2hints', **stage):
             lib.log.info("Extracting hints from RNA-seq BAM file using bam2hints")
             bamhintstmp = os.path.join(args.out, 'predict_misc', 'bam_hints.tmp')
             cmd = [BAM2HINTS, '--intronsonly', '--in', args.rna_bam, '--out', bamhintstmp]
             lib.runSubprocess(cmd, '.', lib.log)
-            #sort the hints
-            bamhintssorted = os.path.join(args.out, 'predict_misc', 'bam_hints.sorted.tmp')
-            lib.sortHints(bamhintstmp, bamhintssorted)
-            #join hints
+            #sort and join the hints
             bamjoinedhints = os.path.join(args.out, 'predict_misc', 'bam_hints.joined.tmp')
-            cmd = [JOINHINTS]
-            lib.runSubprocess5(cmd, '.', lib.log, bamhintssorted, bamjoinedhints)
+            lib.sortHints(bamhintstmp, bamjoinedhints, join=True)
             #filter intron hints
             cmd = [os.path.join(parentdir, 'util', 'BRAKER', 'filterIntronsFindStrand.pl'), MaskGenome, bamjoinedhints, '--score']
             lib.runSubprocess2(cmd, '.', lib.log, hintsBAM)
+            stages.update('bam2hints', **stage)
         else:
             lib.log.info("Existing RNA-seq BAM hints found: {:}".format(hintsBAM))
         
@@ -645,9 +652,11 @@ else:
             #run funannotate-p2g to map to genome
             p2g_cmd = [sys.executable, P2G, '-p', prot_temp, '-g', MaskGenome, '-o', Exonerate, '--maxintron', str(args.max_intronlen), '--cpus', str(args.cpus), '--ploidy', str(args.ploidy), '-f', 'diamond', '--tblastn_out', os.path.join(args.out, 'predict_misc', 'p2g.diamond.out'), '--logfile', os.path.join(args.out, 'logfiles', 'funannotate-p2g.log')]
             #check if protein evidence is same as old evidence
-            if not lib.checkannotations(Exonerate):
+            stage = {'inputs': [prot_temp, MaskGenome], 'versions': [lib.toolVersion(['diamond', 'version']), lib.toolVersion(['exonerate', '--version'])], 'args': [args.max_intronlen, args.ploidy], 'outputs': [Exonerate]}
+            if not stages.valid('p2g', **stage):
                 lib.log.info("Mapping proteins to genome using Diamond blastx/Exonerate")
                 subprocess.call(p2g_cmd)
+                stages.update('p2g', **stage)
             else:
                 lib.log.info("Existing protein alignments found: {:}".format(Exonerate))
             Exonerate = os.path.abspath(Exonerate)
@@ -837,11 +846,13 @@ If you can run GeneMark outside funannotate you can add with --genemark_gtf opti
                     lines = input.read().replace("Augustus", "GeneMark")
                     output.write(lines)
         else:
-            if not lib.checkannotations(GeneMarkGFF3):
+            stage = {'inputs': [MaskGenome, args.genemark_mod, hints_all if args.genemark_mode == 'ET' else None], 'versions': [GENEMARKCMD], 'args': [args.genemark_mode, args.max_intronlen, args.soft_mask, args.organism], 'outputs': [GeneMarkGFF3]}
+            if not stages.valid('genemark', **stage):
                 if args.genemark_mode == 'ES':
                     lib.RunGeneMarkES(GENEMARKCMD, MaskGenome, args.genemark_mod, args.max_intronlen, args.soft_mask, args.cpus, os.path.join(args.out, 'predict_misc'), GeneMarkGFF3, args.organism)
                 else:
                     lib.RunGeneMarkET(GENEMARKCMD, MaskGenome, args.genemark_mod, hints_all, args.max_intronlen, args.soft_mask, args.cpus, os.path.join(args.out, 'predict_misc'), GeneMarkGFF3, args.organism)
+                stages.update('genemark', **stage)
             else:
                 lib.log.info("Existing GeneMark annotation found: {:}".format(GeneMarkGFF3))
             if lib.checkannotations(GeneMarkGFF3):
@@ -1058,13 +1069,16 @@ If you can run GeneMark outside funannotate you can add with --genemark_gtf opti
             lib.trainAugustus(AUGUSTUS_BASE, aug_species, trainingset, MaskGenome, args.out, args.cpus, numTrainingSet, args.optimize_augustus)
 
         #now run Augustus multithreaded...
-        if not os.path.isfile(aug_out):
+        aug_params = os.path.join(AUGUSTUS, 'species', aug_species, aug_species+'_exon_probs.pbl')
+        stage = {'inputs': [MaskGenome, hints_all, aug_params], 'versions': [lib.toolVersion(['augustus', '--version'])], 'args': [aug_species], 'outputs': [aug_out]}
+        if not stages.valid('augustus', **stage):
             lib.log.info("Running Augustus gene prediction")
             if os.path.isfile(hints_all):
                 cmd = [AUGUSTUS_PARALELL, '--species', aug_species, '--hints', hints_all, '-i', MaskGenome, '-o', aug_out, '--cpus', str(args.cpus), '--logfile', os.path.join(args.out, 'logfiles', 'augustus-parallel.log')]
             else:
                 cmd = [AUGUSTUS_PARALELL, '--species', aug_species, '-i', MaskGenome, '-o', aug_out, '--cpus', str(args.cpus), '--logfile', os.path.join(args.out, 'logfiles', 'augustus-parallel.log')]
             subprocess.call(cmd)
+            stages.update('augustus', **stage)
         else:
             lib.log.info("Existing Augustus annotations found: {:}".format(aug_out))
         Augustus = os.path.join(args.out, 'predict_misc', 'augustus.evm.gff3')
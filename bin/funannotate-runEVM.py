@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 
-import sys, multiprocessing, subprocess, os, time, shutil, inspect
-from itertools import izip_longest
+import sys, subprocess, os, shutil, inspect, re
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0,parentdir)
 import lib.library as lib
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 
 #get EVM arguments, genome, protein, transcript, min_intron, weights all from command line
 cpus = int(sys.argv[2])
@@ -33,7 +33,6 @@ perl = 'perl'
 EVM = os.environ['EVM_HOME']
 Partition = os.path.join(EVM, 'EvmUtils', 'partition_EVM_inputs.pl')
 Commands = os.path.join(EVM, 'EvmUtils', 'write_EVM_commands.pl')
-Execute = os.path.join(EVM, 'EvmUtils', 'execute_EVM_commands.pl')
 Combine = os.path.join(EVM, 'EvmUtils', 'recombine_EVM_partial_outputs.pl')
 Convert = os.path.join(EVM, 'EvmUtils', 'convert_EVM_outputs_to_GFF3.pl')
 
@@ -57,22 +56,35 @@ del cmd1[-1]
 del cmd1[-1]
 
 
-def grouper(n, iterable, fillvalue=None):
-    "Collect data into fixed-length chunks or blocks"
-    # grouper(3, 'ABCDEFG', 'x') --> ABC DEF Gxx
-    args = [iter(iterable)] * n
-    return izip_longest(fillvalue=fillvalue, *args)
+def partitionSizes(input):
+    '''
+    parse partitions_list.out, return dictionary of partition folder: length in bp,
+    partitioned contigs have folders named contig_start-end, otherwise the whole contig is used
+    '''
+    sizes = {}
+    with open(input, 'rU') as infile:
+        for line in infile:
+            cols = line.rstrip().split('\t')
+            if len(cols) < 4:
+                continue
+            folder = os.path.abspath(os.path.join(tmpdir, cols[3]))
+            match = re.search('_(\d+)-(\d+)$', cols[3])
+            if cols[2] == 'Y' and match:
+                sizes[folder] = int(match.group(2)) - int(match.group(1)) + 1
+            else:
+                sizes[folder] = ContigSizes.get(cols[0], 0)
+    return sizes
 
 def worker(input):
-    logfile = input + '.log'
-    with open(logfile, 'w') as output:
-        subprocess.call([perl, Execute, input], stdout = output, stderr = output)
-
-def safe_run(*args, **kwargs):
-    """Call run(), catch exceptions."""
-    try: worker(*args, **kwargs)
+    '''
+    run a single EVM command (a shell line from commands.list), return (command, exit status)
+    '''
+    try:
+        status = subprocess.call(input, shell=True)
     except Exception as e:
-        print("error: %s run(*%r, **%r)" % (e, args, kwargs))
+        lib.log.debug("error: %s running %s" % (e, input))
+        status = 1
+    return (input, status)
 
 #split partitions
 lib.log.info("Setting up EVM partitions")
@@ -87,45 +99,47 @@ commands = os.path.join(tmpdir, 'commands.list')
 with open(commands, 'w') as output:
     subprocess.call(cmd2, cwd = tmpdir, stdout = output, stderr = FNULL)
 
-#count total lines
-num_lines = sum(1 for line in open(commands))
-#strange thing happens if you try to run with more cpus than commands
-if num_lines < cpus:
-    x = num_lines
-else:
-    x = cpus - 1
+#order commands largest partition first, each is handed to the next free worker
+ContigSizes = {}
+with open(genome_args[1], 'rU') as infile:
+    for title, seq in SimpleFastaParser(infile):
+        ContigSizes[title.split()[0]] = len(seq)
+sizes = partitionSizes(os.path.join(tmpdir, 'partitions_list.out'))
+execdir = re.compile('--exec_dir\s+(\S+)')
+cmdList = []
+with open(commands, 'rU') as infile:
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        match = execdir.search(line)
+        if match:
+            size = sizes.get(os.path.abspath(os.path.join(tmpdir, match.group(1))), 0)
+        else:
+            size = 0
+        cmdList.append((size, line))
+cmdList.sort(key=lambda x: x[0], reverse=True)
+cmdList = [x[1] for x in cmdList]
+x = min(cpus, len(cmdList))
 if x < 1:
     x = 1
-lib.log.info("Running EVM commands with %i CPUs" % (x))
-#print "Splitting over", cpus, "CPUs"
-n = int(round(num_lines / x))
-
-with open(commands, 'rU') as f:
-    for i, g in enumerate(grouper(n, f, fillvalue=''), 1):
-        with open(os.path.join(tmpdir, 'split_{0}'.format(i * n)+'.cmds'), 'w') as fout:
-            fout.writelines(g)
-
-#now launch a process for each split file
-file_list = []
-for file in os.listdir(tmpdir):
-    if file.endswith('cmds'):
-        f = os.path.join(tmpdir, file)
-        file_list.append(f)
-
-p = multiprocessing.Pool(cpus)
-tasks = len(file_list)
-results = []
-for i in file_list:
-    results.append(p.apply_async(safe_run, [i]))
-while True:
-    incomplete_count = sum(1 for x in results if not x.ready())
-    if incomplete_count == 0:
+lib.log.info("Running {:,} EVM commands with {:} CPUs".format(len(cmdList), x))
+failed = []
+for cmd, status in lib.runMultiProgressResults(worker, cmdList, x):
+    if status != 0:
+        failed.append(cmd)
+#retry partitions that failed, these are usually transient (memory/IO) failures
+for attempt in range(1, 3):
+    if len(failed) < 1:
         break
-    sys.stdout.write("     Progress: %.2f%% \r" % (float(tasks - incomplete_count) / tasks * 100))
-    sys.stdout.flush()
-    time.sleep(1)
-p.close()
-p.join()
+    lib.log.info("Retrying {:,} failed EVM partitions (attempt {:})".format(len(failed), attempt))
+    retry = failed
+    failed = []
+    for cmd, status in lib.runMultiProgressResults(worker, retry, min(x, len(retry))):
+        if status != 0:
+            failed.append(cmd)
+if len(failed) > 0:
+    lib.log.error("{:,} EVM partitions failed, their gene models will be missing:\n{:}".format(len(failed), '\n'.join(failed)))
 
 #now combine the paritions
 lib.log.info("Combining partitioned EVM outputs")
@@ -117,6 +117,7 @@ def meropsDB(info, force=False):
         info['merops'] = ('diamond', database, '12.0', '2017-10-04', num_records, md5)
     type, name, version, date, records, checksum = info.get('merops')
     lib.log.info('MEROPS Database: version={:} date={:} records={:,}'.format(version, date, records))
+    lib.dbIndex(filtered)
 
 def uniprotDB(info, force=False):
     '''
@@ -220,6 +221,7 @@ def pfamDB(info, force=False):
         info['pfam'] = ('hmmer3', hmm, pfamvers, pfamdate,  num_records, md5)
     type, name, version, date, records, checksum = info.get('pfam')
     lib.log.info('Pfam Database: version={:} date={:} records={:,}'.format(version, date, records))
+    lib.dbIndex(familyinfo)
 
 def repeatDB(info, force=False):
     fasta = os.path.join(FUNDB, 'funannotate.repeat.proteins.fa')
@@ -287,6 +289,7 @@ def goDB(info, force=False):
         info['go'] = ('text', goOBO, version, version,  num_records, md5)
     type, name, version, date, records, checksum = info.get('go')
     lib.log.info('GO ontology version={:} date={:} records={:,}'.format(version, date, records))
+    lib.dbIndex(goOBO)
         
 def mibigDB(info, force=False):
     fasta = os.path.join(FUNDB, 'mibig.fa')
@@ -331,6 +334,7 @@ def interproDB(info, force=False):
         info['interpro'] = ('xml', iprXML, version, iprdate, num_records, md5)
     type, name, version, date, records, checksum = info.get('interpro')
     lib.log.info('InterProScan XML: version={:} date={:} records={:,}'.format(version, date, records))
+    lib.dbIndex(iprXML)
 
 def curatedDB(info, force=False):
     curatedFile = os.path.join(FUNDB, 'ncbi_cleaned_gene_products.txt')
@@ -356,6 +360,7 @@ def curatedDB(info, force=False):
         info['gene2product'] = ('text', curatedFile, version, curdate, num_records, md5)
     type, name, version, date, records, checksum = info.get('gene2product')
     lib.log.info('Gene2Product: version={:} date={:} records={:,}'.format(version, date, records))
+    lib.dbIndex(curatedFile)
 
 def download_buscos(name, force=False):
     #name is a list
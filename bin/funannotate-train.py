@@ -638,6 +638,9 @@ lib.setupLogging(log_name)
 FNULL = open(os.devnull, 'w')
 cmd_args = " ".join(sys.argv)+'\n'
 lib.log.debug(cmd_args)
+
+stages = lib.StageCache(os.path.join(tmpdir, 'stages.json'))
+
 print "-------------------------------------------------------"
 lib.SystemInfo()
 
@@ -957,12 +960,14 @@ else:
 #convert BAM to GFF3
 allGFF3 = os.path.join(tmpdir, 'transcript.alignments.gff3')
 trinityGFF3 = os.path.join(tmpdir, 'trinity.alignments.gff3')
-if not lib.checkannotations(allGFF3) and lib.checkannotations(allBAM):
+if lib.checkannotations(allBAM) and not stages.valid('bam2gff3', inputs=[allBAM], outputs=[allGFF3]):
     lib.log.info('Converting transcript alignments to GFF3 format')
-    lib.bam2gff3(allBAM, allGFF3)
-if not lib.checkannotations(trinityGFF3) and lib.checkannotations(trinityBAM):
+    lib.bam2gff3(allBAM, allGFF3, cpus=args.cpus)
+    stages.update('bam2gff3', inputs=[allBAM], outputs=[allGFF3])
+if lib.checkannotations(trinityBAM) and not stages.valid('bam2gff3-trinity', inputs=[trinityBAM], outputs=[trinityGFF3]):
     lib.log.info('Converting Trinity transcript alignments to GFF3 format')
-    lib.bam2gff3(trinityBAM, trinityGFF3)
+    lib.bam2gff3(trinityBAM, trinityGFF3, cpus=args.cpus)
+    stages.update('bam2gff3-trinity', inputs=[trinityBAM], outputs=[trinityGFF3])
 
 #now run PASA steps
 PASA_gff = os.path.join(tmpdir, 'funannotate_train.pasa.gff3')
@@ -994,11 +999,14 @@ if all(v is None for v in kallistoreads) and lib.checkannotations(longReadClean)
     cmd = [os.path.join(parentdir, 'util', 'sam2bam.sh'), " ".join(minimap_cmd), str(args.cpus // 2), minimapBAM]
     if not lib.checkannotations(minimapBAM):
         lib.runSubprocess(cmd, '.', lib.log)
-    if not lib.checkannotations(KallistoAbundance):
-        lib.mapCount(minimapBAM, PASAdict, KallistoAbundance)
+    if not stages.valid('mapCount', inputs=[minimapBAM, PASAtranscripts], outputs=[KallistoAbundance]):
+        lib.mapCount(minimapBAM, PASAdict, KallistoAbundance, cpus=args.cpus)
+        stages.update('mapCount', inputs=[minimapBAM, PASAtranscripts], outputs=[KallistoAbundance])
 else:
-    if not lib.checkannotations(KallistoAbundance):
+    stage = {'inputs': [PASA_tmp, genome]+list(kallistoreads), 'versions': [lib.toolVersion(['kallisto', 'version'])], 'args': [args.stranded], 'outputs': [KallistoAbundance]}
+    if not stages.valid('kallisto', **stage):
         runKallisto(PASA_tmp, genome, kallistoreads, args.stranded, args.cpus, os.path.join(tmpdir, 'getBestModel'), KallistoAbundance)
+        stages.update('kallisto', **stage)
     else:
         lib.log.info("Existing Kallisto output found: {:}".format(KallistoAbundance))
     
@@ -170,9 +170,10 @@ def gbk2pasaNEW(input, gff, trnaout, fastaout, spliceout, exonout, proteinsout):
     with open(fastaout, 'w') as fasta:
         with open(input, 'rU') as gbk:
             for record in SeqIO.parse(gbk, 'genbank'):
-                fasta.write(">%s\n%s\n" % (record.id, record.seq))
+                recordSeq = str(record.seq)
+                fasta.write(">%s\n%s\n" % (record.id, recordSeq))
                 for f in record.features:
-                    lib.gb_feature_add2dict(f, record, genes)
+                    lib.gb_feature_add2dict(f, record, genes, recordSeq)
     #out of order mRNA/CDS in genbank files can break this... so try to validate those with multiple transcripts
     warn = False
     for k,v in natsorted(genes.items()):
@@ -1052,7 +1053,7 @@ def GFF2tblCombinedNEW(evm, genome, trnascan, prefix, genenumber, justify, SeqCe
     sortedGenes = OrderedDict(sGenes)
     renamedGenes = {}
     scaff2genes = {}
-    SeqRecords = SeqIO.to_dict(SeqIO.parse(genome, 'fasta'))
+    SeqRecords = lib.genomeStore(genome)
     inter = defaultdict(InterLap)
     skipList = []
     dropped = 0
@@ -1136,25 +1137,21 @@ def gbk2interlap(input):
     Genes = {}
     with open(input, 'rU') as filein:
         for record in SeqIO.parse(filein, 'genbank'):
+            recordSeq = str(record.seq)
             for f in record.features:
                 if f.type == 'gene':
                     locusTag, ID, Parent = lib.getID(f, f.type)
                     start = int(f.location.nofuzzy_start)
                     end = int(f.location.nofuzzy_end)
                     inter[record.id].add((start,end,locusTag))      
-                lib.gb_feature_add2dict(f, record, Genes)
+                lib.gb_feature_add2dict(f, record, Genes, recordSeq)
     return inter, Genes
 
 def gff2interlap(input, fasta):
     '''
     function to parse GFF3 file, construct scaffold/gene interlap dictionary and funannotate standard annotation dictionary
     '''
-    inter = defaultdict(InterLap)
-    Genes = {}
-    Genes = lib.gff2dict(input, fasta, Genes)
-    for k,v in natsorted(Genes.items()):
-        inter[v['contig']].add((v['location'][0],v['location'][1],k))
-    return inter, Genes
+    return lib.gff2interlap(input, fasta)
         
    
 def merge_dicts(x, y):
@@ -1202,17 +1199,51 @@ def message(loc1, loc2, cdsAED, mrnaAED, protMatches, UTRs, no_change, UTR_added
     return final_message, no_change, UTR_added, yardSale, exonChange
   
 def pairwiseAlign(query, ref):
-    from Bio import pairwise2
     '''
     do global alignment and return pident
+    the score of pairwise2.align.globalxx (match 1, no mismatch/gap penalty) is the length of the
+    longest common subsequence, so it is computed directly with the bit-parallel LCS algorithm
+    (Hyyro 2004), one pass over ref with big integer bit vectors the length of query
     '''
     if query == ref:
         return 100.0
-    align = pairwise2.align.globalxx(query, ref)
     length = max(len(query), len(ref))
-    pident = (align[0][2] / float(length)) * 100
+    if not query or not ref:
+        return 0.0
+    #bit mask of the positions of each residue in query
+    masks = {}
+    for i, c in enumerate(query):
+        masks[c] = masks.get(c, 0) | (1 << i)
+    allbits = (1 << len(query)) - 1
+    V = allbits
+    for c in ref:
+        U = V & masks.get(c, 0)
+        V = ((V + U) | (V - U)) & allbits
+    lcs = len(query) - bin(V).count('1')
+    pident = (lcs / float(length)) * 100
     return pident
 
+def locusIdentity(input):
+    '''
+    best pident of each new transcript against any of the old transcripts of a locus, skipping
+    alignments that can't beat the current best given the length ratio
+    '''
+    locus, newProts, oldProts = input
+    protMatches = []
+    for query in newProts:
+        protMatch = None
+        for ref in oldProts:
+            if protMatch and min(len(query), len(ref)) / float(max(len(query), len(ref), 1)) * 100 <= protMatch:
+                continue
+            pident = pairwiseAlign(query, ref)
+            if not protMatch:
+                protMatch = pident
+            else:
+                if pident > protMatch:
+                    protMatch = pident
+        protMatches.append(protMatch)
+    return locus, protMatches
+
 def compareAnnotations2(old, new, output):
     '''
     function takes two GenBank annotated genomes and compares gene models
@@ -1228,6 +1259,21 @@ def compareAnnotations2(old, new, output):
     else:
         oldInter, oldGenes = gbk2interlap(old)
     newInter, newGenes = gbk2interlap(new)
+    #translation pident of every locus in both annotations, loci are compared in parallel
+    identity = []
+    for k,v in newGenes.items():
+        if k in oldGenes and v['type'] == 'mRNA' and oldGenes[k]['type'] == 'mRNA':
+            identity.append((k, v['protein'], oldGenes[k]['protein']))
+    protIdentity = {}
+    for locus, protMatches in lib.runMultiProgressResults(locusIdentity, identity, args.cpus):
+        protIdentity[locus] = protMatches
+    #exon and CDS AED of every locus in both annotations, calculated in one batch
+    shared = [k for k in newGenes if k in oldGenes]
+    exonAED = lib.lociAED([(newGenes[k]['mRNA'], oldGenes[k]['mRNA']) for k in shared])
+    locusAED = dict((k, ['{:.3f}'.format(x), '0.000']) for k, x in zip(shared, exonAED))
+    cdsAED = lib.lociAED([(newGenes[k]['CDS'], oldGenes[k]['CDS']) for k, prots, oldprots in identity])
+    for x, y in zip(identity, cdsAED):
+        locusAED[x[0]][1] = '{:.3f}'.format(y)
     #do the simple stuff first, find models that were deleted
     for contig in oldInter:
         for gene in oldInter[contig]:
@@ -1289,26 +1335,13 @@ def compareAnnotations2(old, new, output):
                     #get the old annotation
                     hitInfo = oldGenes.get(gene[2])
                     
-                    #calculate AED
-                    exonAED = pairwiseAED(newGenes[gene[2]]['mRNA'], hitInfo['mRNA'])
-                    if newGenes[gene[2]]['type'] == 'mRNA' and hitInfo['type'] == 'mRNA':
-                        cdsAED = pairwiseAED(newGenes[gene[2]]['CDS'], hitInfo['CDS'])
-                    else:
-                        cdsAED = '0.000'
+                    #AED was calculated up front
+                    exonAED, cdsAED = locusAED[gene[2]]
                     
                     #check translation, to deal with multiple transcripts, lets loop through new
                     protMatches = []
                     if newGenes[gene[2]]['type'] == 'mRNA' and hitInfo['type'] == 'mRNA':
-                        for i in range(0,len(newGenes[gene[2]]['ids'])):
-                            protMatch = None
-                            for y in range(0,len(oldGenes[gene[2]]['ids'])):
-                                pident = pairwiseAlign(newGenes[gene[2]]['protein'][i], oldGenes[gene[2]]['protein'][y])
-                                if not protMatch:
-                                    protMatch = pident
-                                else:
-                                    if pident > protMatch:
-                                        protMatch = pident
-                            protMatches.append(protMatch)
+                        protMatches = protIdentity[gene[2]]
                     #summarize UTRs
                     UTRs = findUTRs(newGenes[gene[2]]['CDS'], newGenes[gene[2]]['mRNA'], newGenes[gene[2]]['strand'])
                     
@@ -1404,67 +1437,6 @@ def findUTRs(cds, mrna, strand):
         UTRs.append((Fiveprime,Threeprime))
     return UTRs
 
-def pairwiseAED(query, reference):
-    '''
-    takes a multiple transcripts and sums AED from lowest pairwise comparison and then calculates
-    the average based on number of transcripts in the query
-    '''
-    AEDsum = []
-    pAED = [float(getAED(a,b)) for a, b in itertools.product(query, reference)]
-    #split into parts to get lowest AED
-    splitAED = [pAED[i:i+len(query)] for i  in range(0, len(pAED), len(query))]
-    for pair in splitAED:
-        AEDsum.append(min(pair))
-    AEDavg = sum(AEDsum) / len(query)
-    return '{:.3f}'.format(AEDavg)
-
-
-def getAED(query, reference):
-    '''
-    function to calcuate annotation edit distance between two mRNA transcript coordinates
-    AED = 1 - (SN + SP / 2)
-    SN = fraction of ref predicted
-    SP = fraction prediction overlapping the ref
-    '''
-    def _length(listTup):
-        len = 0
-        for i in listTup:
-            l = abs(i[0] - i[1])
-            len += l
-        return len
-    #check if identical
-    if query == reference:
-       return '0.000'
-    #make sure sorted
-    rLen = _length(reference)
-    refInterlap = InterLap(reference)
-    RefPred = 0
-    QueryOverlap = 0
-    qLen = 0
-    for exon in query:
-        qLen += abs(exon[0] - exon[1])
-        if exon in refInterlap: #exon overlaps at least partially with reference
-            hit = list(refInterlap.find(exon))
-            for h in hit:
-                diff = np.subtract(exon,h) #will return array of exon minus hit at each pos
-                if diff[0] <= 0 and diff[1] >= 0: #then query exon covers ref exon
-                    cov = abs(h[0] - h[1])
-                    QueryOverlap += cov
-                elif diff[0] <= 0 and diff[1] < 0: # means query partial covers ref
-                    cov = abs(h[0] - exon[1])
-                    QueryOverlap += cov
-                elif diff[0] > 0 and diff[1] >= 0: #means query partial covers ref
-                    cov = abs(exon[0] - h[1])
-                    QueryOverlap += cov        
-                elif diff[0] > 0 and diff[1] < 1:
-                    cov = abs(exon[0] - exon[1])
-                    QueryOverlap += cov
-    #calculate AED
-    SP = QueryOverlap / float(qLen)
-    SN = QueryOverlap / float(rLen)
-    AED = 1 - ((SN + SP) / 2)
-    return '{:.3f}'.format(AED)
-    
 #create folder structure
 if args.input:
     if os.path.isdir(args.input): #then funannoate folder is passed
@@ -1487,6 +1459,8 @@ else:
 
 #assign temp directory
 tmpdir = os.path.join(args.out, 'update_misc')
+#parsed GFF3 annotation is cached in the output folder, so a re-run doesn't parse it again
+lib.setCacheDir(os.path.join(tmpdir, 'cache'))
 
 #create log file
 log_name = os.path.join(args.out, 'logfiles', 'funannotate-update.log')
@@ -1498,6 +1472,9 @@ lib.setupLogging(log_name)
 FNULL = open(os.devnull, 'w')
 cmd_args = " ".join(sys.argv)+'\n'
 lib.log.debug(cmd_args)
+
+stages = lib.StageCache(os.path.join(tmpdir, 'stages.json'))
+
 print("-------------------------------------------------------")
 lib.SystemInfo()
 
@@ -1901,12 +1878,14 @@ else:
 #convert BAM to GFF3
 allGFF3 = os.path.join(tmpdir, 'transcript.alignments.gff3')
 trinityGFF3 = os.path.join(tmpdir, 'trinity.alignments.gff3')
-if not lib.checkannotations(allGFF3) and lib.checkannotations(allBAM):
+if lib.checkannotations(allBAM) and not stages.valid('bam2gff3', inputs=[allBAM], outputs=[allGFF3]):
     lib.log.info('Converting transcript alignments to GFF3 format')
-    lib.bam2gff3(allBAM, allGFF3)
-if not lib.checkannotations(trinityGFF3) and lib.checkannotations(trinityBAM):
+    lib.bam2gff3(allBAM, allGFF3, cpus=args.cpus)
+    stages.update('bam2gff3', inputs=[allBAM], outputs=[allGFF3])
+if lib.checkannotations(trinityBAM) and not stages.valid('bam2gff3-trinity', inputs=[trinityBAM], outputs=[trinityGFF3]):
     lib.log.info('Converting Trinity transcript alignments to GFF3 format')
-    lib.bam2gff3(trinityBAM, trinityGFF3)   
+    lib.bam2gff3(trinityBAM, trinityGFF3, cpus=args.cpus)
+    stages.update('bam2gff3-trinity', inputs=[trinityBAM], outputs=[trinityGFF3])
     
 #now run PASA steps
 PASA_gff = os.path.join(tmpdir, 'pasa_final.gff3')
@@ -1952,11 +1931,14 @@ if all(v is None for v in kallistoreads) and lib.checkannotations(longReadClean)
     cmd = [os.path.join(parentdir, 'util', 'sam2bam.sh'), " ".join(minimap_cmd), str(args.cpus // 2), minimapBAM]
     if not lib.checkannotations(minimapBAM):
         lib.runSubprocess(cmd, '.', lib.log)
-    if not lib.checkannotations(KallistoAbundance):
-        lib.mapCount(minimapBAM, PASAdict, KallistoAbundance)
+    if not args.kallisto and not stages.valid('mapCount', inputs=[minimapBAM, PASAtranscripts], outputs=[KallistoAbundance]):
+        lib.mapCount(minimapBAM, PASAdict, KallistoAbundance, cpus=args.cpus)
+        stages.update('mapCount', inputs=[minimapBAM, PASAtranscripts], outputs=[KallistoAbundance])
 else:
-    if not lib.checkannotations(KallistoAbundance):
+    stage = {'inputs': [PASA_gff, fastaout]+list(kallistoreads), 'versions': [lib.toolVersion(['kallisto', 'version'])], 'args': [args.stranded], 'outputs': [KallistoAbundance]}
+    if not args.kallisto and not stages.valid('kallisto', **stage):
         runKallisto(PASA_gff, fastaout, kallistoreads, args.stranded, args.cpus, KallistoAbundance)
+        stages.update('kallisto', **stage)
     else:
         lib.log.info("Existing Kallisto output found: {:}".format(KallistoAbundance))
 
@@ -724,6 +724,7 @@ Commands:    compare            Compare annotations to reference (GFF3 or GBK an
              prot2genome        Map proteins to genome generating GFF3 protein alignments
              stringtie2gff3     Convert GTF (stringTIE) to GFF3 format
              quarry2gff3        Convert CodingQuarry output to proper GFF3 format
+             stages             List or invalidate cached pipeline stages
                
 Written by Jon Palmer (2016-2018) nextgenusfs@gmail.com
         """ % (sys.argv[1], version)
@@ -871,6 +872,7 @@ Description: Convert BAM coordsorted transcript alignments to GFF3 format.
     
 Arguments:   -i, --bam           BAM file (coord-sorted)
              -o, --output        GFF3 output file
+             --cpus              Number of CPUs. Default: 1
           
 Written by Jon Palmer (2016-2018) nextgenusfs@gmail.com
         """ % (sys.argv[1], version)
@@ -915,6 +917,27 @@ Written by Jon Palmer (2016-2018) nextgenusfs@gmail.com
                 else:
                     print(help)
                     sys.exit(1)
+            elif subcmd == 'stages':
+                help = """
+Usage:       funannotate %s <arguments>
+version:     %s
+
+Description: List the pipeline stages cached in a funannotate output folder, or
+             invalidate them so they are re-run. Stages are reused automatically
+             only when their input files, tool versions, and options are unchanged.
+    
+Arguments:   -i, --input        funannotate output folder
+             --invalidate       Stage(s) to invalidate, ie p2g augustus
+             --all              Invalidate all stages
+          
+Written by Jon Palmer (2016-2018) nextgenusfs@gmail.com
+        """ % (sys.argv[1], version)
+                arguments = arguments[1:]
+                if len(arguments) > 0:
+                    cmd = os.path.join(script_path, 'util', 'stage_cache.py')
+                else:
+                    print(help)
+                    sys.exit(1)
             else:
                 print(help)
                 sys.exit(1)
@@ -1,9 +1,9 @@
 from __future__ import division
-import os, subprocess, logging, sys, argparse, inspect, csv, time, re, shutil, datetime, platform, multiprocessing, itertools, hashlib, math, types, gzip, operator, textwrap
+import os, subprocess, logging, sys, argparse, inspect, csv, time, re, shutil, datetime, platform, multiprocessing, itertools, hashlib, math, types, gzip, operator, textwrap, string
 import errno
 from natsort import natsorted
 from lib.interlap import InterLap
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import warnings
 from Bio import SeqIO
 with warnings.catch_warnings():
@@ -800,6 +800,114 @@ def sha256_check(file1, file2):
     else:
         return False
 
+toolVersions = {}
+
+def toolVersion(cmd):
+    '''
+    return the first line a program prints for its version command, ie ['minimap2', '--version'],
+    results are cached per run, returns None if the program can't be run
+    '''
+    key = ' '.join(cmd)
+    if not key in toolVersions:
+        try:
+            out = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()[0]
+            lines = [x.strip() for x in out.split('\n') if x.strip()]
+            toolVersions[key] = lines[0] if lines else None
+        except OSError:
+            toolVersions[key] = None
+    return toolVersions[key]
+
+class StageCache(object):
+    '''
+    Manifest of completed pipeline stages, stored as JSON in the output folder. Each stage is keyed on a
+    SHA256 of the content of its input files, the tool versions and the arguments that affect its output,
+    so a stage is reused exactly when those are unchanged and all of its outputs are present. Output paths
+    are stored relative to the manifest, so moving the output folder keeps the cache valid. File hashes are
+    remembered by path/size/mtime so unchanged inputs are only hashed once.
+    '''
+    def __init__(self, manifest):
+        import json
+        self.manifest = os.path.abspath(manifest)
+        self.folder = os.path.dirname(self.manifest)
+        self.data = {'stages': {}, 'files': {}}
+        if os.path.isfile(self.manifest):
+            try:
+                with open(self.manifest, 'rU') as infile:
+                    self.data = json.load(infile)
+            except ValueError:
+                log.debug('Stage cache manifest {:} is corrupt, starting a new one'.format(self.manifest))
+
+    def save(self):
+        import json
+        tmpout = self.manifest+'.tmp'
+        with open(tmpout, 'w') as outfile:
+            json.dump(self.data, outfile, indent=2, sort_keys=True)
+        os.rename(tmpout, self.manifest)
+
+    def digest(self, filename):
+        filename = os.path.realpath(filename)
+        st = os.stat(filename)
+        cached = self.data['files'].get(filename)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+            return cached[2]
+        with open(filename, 'rb') as infile:
+            digest = hashfile(infile, hashlib.sha256()).encode('hex')
+        self.data['files'][filename] = [st.st_size, st.st_mtime, digest]
+        return digest
+
+    def key(self, inputs=[], versions=[], args=[]):
+        hasher = hashlib.sha256()
+        for x in inputs:
+            if x and os.path.isfile(x):
+                hasher.update(self.digest(x))
+            else:
+                hasher.update('missing')
+        for x in versions:
+            hasher.update(str(x))
+        for x in args:
+            hasher.update(str(x))
+        return hasher.hexdigest()
+
+    def valid(self, stage, inputs=[], versions=[], args=[], outputs=[]):
+        '''return True if stage has been run with the same inputs/versions/args and its outputs exist'''
+        entry = self.data['stages'].get(stage)
+        if not entry:
+            return False
+        if entry['key'] != self.key(inputs, versions, args):
+            log.debug('Stage {:} inputs or parameters have changed, will rerun'.format(stage))
+            return False
+        for x in [os.path.join(self.folder, y) for y in entry['outputs']] + outputs:
+            if not checkannotations(x):
+                log.debug('Stage {:} output {:} is missing, will rerun'.format(stage, x))
+                return False
+        return True
+
+    def update(self, stage, inputs=[], versions=[], args=[], outputs=[]):
+        '''record a completed stage, outputs that weren't created are not recorded'''
+        self.data['stages'][stage] = {'key': self.key(inputs, versions, args),
+            'inputs': [os.path.basename(x) for x in inputs if x],
+            'versions': [str(x) for x in versions], 'args': [str(x) for x in args],
+            'outputs': [os.path.relpath(os.path.abspath(x), self.folder) for x in outputs if checkannotations(x)],
+            'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        self.save()
+
+    def invalidate(self, stage=None):
+        '''remove a stage from the manifest, or all stages if stage is None, returns the stages removed'''
+        if stage is None:
+            removed = list(self.data['stages'].keys())
+            self.data['stages'] = {}
+        elif stage in self.data['stages']:
+            removed = [stage]
+            del self.data['stages'][stage]
+        else:
+            removed = []
+        self.save()
+        return removed
+
+    def stages(self):
+        '''return list of (stage, entry) tuples in the order they were run'''
+        return sorted(self.data['stages'].items(), key=lambda x: x[1]['date'])
+
 def readBlocks(source, pattern):
     buffer = []
     for line in source:
@@ -1156,6 +1264,26 @@ def runMultiProgress(function, inputList, cpus):
     p.close()
     p.join()
 
+def runMultiProgressResults(function, inputList, cpus):
+    '''
+    same as runMultiProgress, but yields the return value of each task as it finishes
+    (in completion order) so results can be streamed into a single output by the parent
+    '''
+    p = multiprocessing.Pool(cpus)
+    tasks = len(inputList)
+    try:
+        for i, result in enumerate(p.imap_unordered(function, inputList)):
+            sys.stdout.write("     Progress: %.2f%% \r" % (float(i+1) / tasks * 100))
+            sys.stdout.flush()
+            yield result
+    except:
+        p.terminate()
+        raise
+    else:
+        p.close()
+    finally:
+        p.join()
+
 def runMultiNoProgress(function, inputList, cpus):
     #setup pool
     p = multiprocessing.Pool(cpus)
@@ -1167,6 +1295,83 @@ def runMultiNoProgress(function, inputList, cpus):
     p.close()
     p.join()
 
+def runThreads(function, inputList, cpus):
+    '''
+    same as runMultiNoProgress but with a pool of threads, for functions that just wait on an external
+    program, safe to call from a thread (forking a process pool from a thread is not)
+    '''
+    from multiprocessing.pool import ThreadPool
+    p = ThreadPool(cpus)
+    p.map(function, inputList, chunksize=1)
+    p.close()
+    p.join()
+
+class StageExecutor(object):
+    '''
+    run independent pipeline stages concurrently under a global CPU budget. Stages are added with the
+    number of CPUs they use and the names of the stages they must wait for; they start in the order they
+    were added as soon as their dependencies have finished and enough CPUs are free (a stage needing more
+    than the budget runs when nothing else is). Stages run in threads and are expected to spend their
+    time in external programs. If a stage fails, no new stages are started and the error is re-raised
+    once running stages have finished.
+    '''
+    def __init__(self, cpus):
+        self.cpus = max(1, cpus)
+        self.stages = []
+
+    def add(self, name, function, args=[], cpus=1, after=[]):
+        names = [x['name'] for x in self.stages]
+        for x in after:
+            if not x in names:
+                raise ValueError('Stage {:} depends on {:}, which has not been added'.format(name, x))
+        self.stages.append({'name': name, 'function': function, 'args': args, 'cpus': min(max(1, cpus), self.cpus), 'after': after})
+
+    def run(self):
+        import threading
+        cond = threading.Condition()
+        state = {'free': self.cpus, 'done': set(), 'running': 0, 'error': None}
+
+        def _run(stage):
+            try:
+                start = time.time()
+                stage['function'](*stage['args'])
+                log.debug('Stage {:} finished in {:.1f} minutes'.format(stage['name'], (time.time() - start) / 60))
+            except BaseException:
+                with cond:
+                    if not state['error']:
+                        state['error'] = (stage['name'], sys.exc_info())
+            finally:
+                with cond:
+                    state['free'] += stage['cpus']
+                    state['running'] -= 1
+                    state['done'].add(stage['name'])
+                    cond.notify_all()
+
+        pending = list(self.stages)
+        with cond:
+            while pending or state['running']:
+                if not state['error']:
+                    for stage in list(pending):
+                        if any(not x in state['done'] for x in stage['after']):
+                            continue
+                        if stage['cpus'] > state['free'] and state['running']:
+                            continue
+                        pending.remove(stage)
+                        state['free'] -= stage['cpus']
+                        state['running'] += 1
+                        log.debug('Starting stage {:} with {:} CPUs'.format(stage['name'], stage['cpus']))
+                        t = threading.Thread(target=_run, args=(stage,))
+                        t.daemon = True
+                        t.start()
+                elif not state['running']:
+                    break
+                cond.wait(1)
+        if state['error']:
+            name, exc = state['error']
+            if not isinstance(exc[1], SystemExit):
+                log.error('Stage {:} failed'.format(name))
+            raise exc[0], exc[1], exc[2]
+
 def cleanProteins(inputList, output):
     #expecting a list of protein fasta files for combining/cleaning headers
     #make sure you aren't duplicated sequences names
@@ -1208,12 +1413,13 @@ def gb2output(input, output1, output2, output3):
                 with open(input, 'rU') as gbk:
                     SeqRecords = SeqIO.parse(gbk, 'genbank')
                     for record in SeqRecords:
-                        scaffolds.write(">%s\n%s\n" % (record.id, record.seq))
+                        recordSeq = str(record.seq)
+                        scaffolds.write(">%s\n%s\n" % (record.id, recordSeq))
                         for f in record.features:
                             if f.type == "CDS":
                                 proteins.write(">%s\n%s\n" % (f.qualifiers['locus_tag'][0], softwrap(f.qualifiers['translation'][0].rstrip('*'))))
                             if f.type == "mRNA":
-                                feature_seq = f.extract(record.seq)
+                                feature_seq = featureSeq(f, record, recordSeq)
                                 transcripts.write(">%s\n%s\n" % (f.qualifiers['locus_tag'][0], softwrap(feature_seq)))
 
 def sortGFF(input, output, order):
@@ -1297,11 +1503,11 @@ def BamHeaderTest(genome, mapping):
     else:
         return True
 
-def mapCount(input, location_dict, output):
+def mapCount(input, location_dict, output, cpus=1):
     import pybam
     #parse with pybam and count coverage (pileup)
     Counts = {}
-    for aln in pybam.read(os.path.realpath(input)):
+    for aln in pybam.read(os.path.realpath(input), threads=cpus):
         if not aln.sam_rname in Counts:
             Counts[aln.sam_rname] = 1
         else:
@@ -1317,219 +1523,189 @@ def mapCount(input, location_dict, output):
             location = v[1]
             outfile.write('{:}\t{:}\t{:}\t{:.2f}\n'.format(k, geneID, location, float(tpm)))
 
-def tokenizeString(aString, separators):
-    #separators is an array of strings that are being used to split the the string.
-    #sort separators in order of descending length
-    separators.sort(key=len)
-    listToReturn = []
-    i = 0
-    while i < len(aString):
-        theSeparator = ""
-        for current in separators:
-            if current == aString[i:i+len(current)]:
-                theSeparator = current
-        if theSeparator != "":
-            listToReturn += [theSeparator]
-            i = i + len(theSeparator)
-        else:
-            if listToReturn == []:
-                listToReturn = [""]
-            if(listToReturn[-1] in separators):
-                listToReturn += [""]
-            listToReturn[-1] += aString[i]
-            i += 1
-    return listToReturn
-
-def bam2gff3(input, output):
-    import pybam
-    with open(output, 'w') as gffout:
-        gffout.write('##gff-version 3\n')
-        for aln in pybam.read(os.path.realpath(input)):
-            if aln.sam_flag == 0:
-                strand = '+'
-            elif aln.sam_flag == 16:
-                strand = '-'
+csTokens = re.compile('([:*+~=-])([^:*+~=-]*)')
+
+def parseCStag(cs, start, length, flag):
+    '''
+    walk the operations of a minimap2 cs tag, tokenized with a compiled regex, returns exon coordinate
+    tuples, query coordinate tuples, number of matches, number of gaps and a list of True/False for
+    whether each intron has canonical splice sites on the strand of the alignment
+    '''
+    matches = 0
+    gaps = 0
+    exons = [start]
+    position = start
+    query = [1]
+    querypos = 0
+    splices = []
+    for op, value in csTokens.findall(cs):
+        if op == ':':
+            matches += int(value)
+            position += int(value)
+            querypos += int(value)
+        elif op == '=':
+            matches += len(value)
+            position += len(value)
+            querypos += len(value)
+        elif op == '-':
+            gaps += 1
+        elif op == '+':
+            gaps += 1
+            querypos += len(value)
+        elif op == '~':
+            sites = value[:2]+value[-2:]
+            if flag == 0:
+                splices.append(sites == 'gtag' or sites == 'atac')
             else:
-                continue
-            cs = None
-            nm = None
-            tags = aln.sam_tags_string.split('\t')
-            for x in tags:
-                if x.startswith('cs:'):
-                    cs = x.replace('cs:Z:', '')
-                if x.startswith('NM:'):
-                    nm = int(x.split(':')[-1])
-            #print(aln.sam_qname, nm, cs)
-            if nm is None or cs is None:
-                continue
-            matches = 0
-            ProperSplice = True
-            splitter = []
-            exons = [int(aln.sam_pos1)]
-            position = int(aln.sam_pos1)
-            query = [1]
-            querypos = 0
-            num_exons = 1
-            gaps = 0
-            splitter = tokenizeString(cs, [':','*','+', '-', '~'])
-            for i,x in enumerate(splitter):
-                if x == ':':
-                    matches += int(splitter[i+1])
-                    position += int(splitter[i+1])
-                    querypos += int(splitter[i+1])
-                elif x == '-':
-                    gaps += 1
-                elif x == '+':
-                    gaps += 1
-                    querypos += len(splitter[i+1])
-                elif x == '~':
-                    if aln.sam_flag == 0:
-                        if splitter[i+1].startswith('gt') and splitter[i+1].endswith('ag'):
-                            ProperSplice = True
-                        elif splitter[i+1].startswith('at') and splitter[i+1].endswith('ac'):
-                            ProperSplice = True
-                        else:
-                            ProperSplice = False
-                    elif aln.sam_flag == 16:
-                        if splitter[i+1].startswith('ct') and splitter[i+1].endswith('ac'):
-                            ProperSplice = True
-                        elif splitter[i+1].startswith('gt') and splitter[i+1].endswith('at'):
-                            ProperSplice = True
-                        else:
-                            ProperSplice = False
-                    num_exons += 1
-                    exons.append(position)
-                    query.append(querypos)
-                    query.append(querypos+1)
-                    intronLen = int(splitter[i+1][2:-2])
-                    position += intronLen
-                    exons.append(position)
-            #add last Position
+                splices.append(sites == 'ctac' or sites == 'gtat')
             exons.append(position)
-            query.append(aln.sam_l_seq)
-            #convert exon list into list of exon tuples
-            exons = zip(exons[0::2], exons[1::2])
-            queries = zip(query[0::2], query[1::2])
-            if ProperSplice:
-                mismatches = nm - gaps
-                pident = 100 * (matches / (matches + mismatches))
-                if pident < 80:
-                    continue
-                for i,exon in enumerate(exons):
-                    start = exon[0]
-                    end = exon[1]-1
-                    if strand == '+':
-                        qstart = queries[i][0]
-                        qend = queries[i][1]
-                    else:
-                        qstart = aln.sam_l_seq - queries[i][1] + 1
-                        qend = aln.sam_l_seq - queries[i][0] + 1
-                    gffout.write('{:}\t{:}\t{:}\t{:}\t{:}\t{:.2f}\t{:}\t{:}\tID={:};Target={:} {:} {:}\n'.format(aln.sam_rname,'genome','cDNA_match',start,end,pident,strand,'.',aln.sam_qname,aln.sam_qname,qstart,qend))
+            query.append(querypos)
+            query.append(querypos+1)
+            position += int(value[2:-2])
+            exons.append(position)
+    #add last Position
+    exons.append(position)
+    query.append(length)
+    #convert exon list into list of exon tuples
+    return zip(exons[0::2], exons[1::2]), zip(query[0::2], query[1::2]), matches, gaps, splices
 
-def bam2ExonsHints(input, gff3, hints):
+def bamAlignments(input, cpus=1):
+    '''
+    parse forward/reverse alignments from a BAM file, yields tuples of (num, rname, pos1, flag, qname, l_seq, cs, NM)
+    where num is the record number in the file, only the cs and NM tags are decoded for each record, BGZF blocks
+    are inflated by cpus threads
+    '''
     import pybam
+    for num,aln in enumerate(pybam.read(os.path.realpath(input), threads=cpus)):
+        flag = aln.sam_flag
+        if flag != 0 and flag != 16:
+            continue
+        tags = aln.get_tags(['cs', 'NM'])
+        if not 'cs' in tags or not 'NM' in tags:
+            continue
+        yield (num, aln.sam_rname, aln.sam_pos1, flag, aln.sam_qname, aln.sam_l_seq, tags['cs'], tags['NM'])
+
+def alignmentBatch(input):
+    function, batch = input
+    return [function(x) for x in batch]
+
+def runAlignments(function, alignments, cpus, batch_size=10000):
+    '''
+    apply function to each alignment from bamAlignments and yield the results in BAM order, if cpus > 1
+    batches of alignments are processed in a pool while the parent keeps decompressing the BAM file,
+    only a few batches are kept in flight so memory use doesn't grow with the size of the BAM file
+    '''
+    if cpus < 2:
+        for aln in alignments:
+            yield function(aln)
+        return
+    p = multiprocessing.Pool(cpus)
+    pending = []
+    #terminate the pool if a worker raises or the consumer stops before the end
+    try:
+        for batch in batch_iterator(alignments, batch_size):
+            pending.append(p.apply_async(alignmentBatch, [(function, batch)]))
+            if len(pending) > cpus*2:
+                for result in pending.pop(0).get():
+                    yield result
+        for x in pending:
+            for result in x.get():
+                yield result
+        p.close()
+    finally:
+        p.terminate()
+        p.join()
+
+def alignment2gff3(aln):
+    num, rname, pos1, flag, qname, l_seq, cs, nm = aln
+    if flag == 0:
+        strand = '+'
+    else:
+        strand = '-'
+    exons, queries, matches, gaps, splices = parseCStag(cs, int(pos1), l_seq, flag)
+    #the last intron decides if the splicing is proper
+    if len(splices) > 0 and not splices[-1]:
+        return ''
+    mismatches = nm - gaps
+    pident = 100 * (matches / (matches + mismatches))
+    if pident < 80:
+        return ''
+    result = []
+    for i,exon in enumerate(exons):
+        start = exon[0]
+        end = exon[1]-1
+        if strand == '+':
+            qstart = queries[i][0]
+            qend = queries[i][1]
+        else:
+            qstart = l_seq - queries[i][1] + 1
+            qend = l_seq - queries[i][0] + 1
+        result.append('{:}\t{:}\t{:}\t{:}\t{:}\t{:.2f}\t{:}\t{:}\tID={:};Target={:} {:} {:}\n'.format(rname,'genome','cDNA_match',start,end,pident,strand,'.',qname,qname,qstart,qend))
+    return ''.join(result)
+
+def splitBAMcpus(cpus):
+    #share cpus between threads inflating BGZF blocks and processes parsing the alignments
+    inflate = max(1, cpus // 4)
+    return inflate, max(1, cpus - inflate)
+
+def bam2gff3(input, output, cpus=1):
+    inflate, workers = splitBAMcpus(cpus)
+    with open(output, 'w') as gffout:
+        gffout.write('##gff-version 3\n')
+        for result in runAlignments(alignment2gff3, bamAlignments(input, inflate), workers):
+            gffout.write(result)
+
+def alignment2hints(aln):
+    num, rname, pos1, flag, qname, l_seq, cs, nm = aln
+    if flag == 0:
+        strand = '+'
+    else:
+        strand = '-'
+    exons, queries, matches, gaps, splices = parseCStag(cs, int(pos1), l_seq, flag)
+    if not all(splices):
+        return None
+    introns = []
+    if len(exons) > 1:
+        for x,y in enumerate(exons):
+            try:
+                introns.append((y[1], exons[x+1][0]-1))
+            except IndexError:
+                pass
+    mismatches = nm - gaps
+    pident = 100 * (matches / (matches + mismatches))
+    if pident < 80:
+        return None
+    feature = 'EST_match'
+    if pident > 95:
+        feature = 'cDNA_match'
+    gff = []
+    hints = []
+    for i,exon in enumerate(exons):
+        start = exon[0]
+        end = exon[1]-1
+        qstart = queries[i][0]
+        qend = queries[i][1]
+        if i == 0 or i == len(exons)-1:
+            hint = 'ep'
+        else:
+            hint = 'exon'
+        gff.append('{:}\t{:}\t{:}\t{:}\t{:}\t{:.2f}\t{:}\t{:}\tID=minimap2_{:};Target={:} {:} {:} {:}\n'.format(rname, 'genome', feature, start, end, pident, strand, '.', num+1, qname, qstart, qend, strand))
+        hints.append('{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\tgrp=minimap2_{:};pri=4;src=E\n'.format(rname, 'b2h', hint, start, end, 0, strand, '.', num+1, qname))
+    for z in introns:
+        hints.append('{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\tgrp=minimap2_{:};pri=4;src=E\n'.format(rname, 'b2h', 'intron', z[0], z[1], 1, strand, '.', num+1, qname))
+    return ''.join(gff), ''.join(hints)
+
+def bam2ExonsHints(input, gff3, hints, cpus=1):
     count = 0
+    inflate, workers = splitBAMcpus(cpus)
     with open(gff3, 'w') as gffout:
         gffout.write('##gff-version 3\n')
         with open(hints, 'w') as hintsout:
-            for num,aln in enumerate(pybam.read(os.path.realpath(input))):
-                if aln.sam_flag == 0:
-                    strand = '+'
-                elif aln.sam_flag == 16:
-                    strand = '-'
-                else:
-                    continue
-                cs = None
-                nm = None
-                tags = aln.sam_tags_string.split('\t')
-                for x in tags:
-                    if x.startswith('cs:'):
-                        cs = x.replace('cs:Z:', '')
-                    if x.startswith('NM:'):
-                        nm = int(x.split(':')[-1])
-                if nm is None or cs is None:
-                    continue
-                matches = 0
-                ProperSplice = True
-                splitter = []
-                exons = [int(aln.sam_pos1)]
-                position = int(aln.sam_pos1)
-                query = [1]
-                querypos = 0
-                num_exons = 1
-                gaps = 0
-                splitter = tokenizeString(cs, [':','*','+', '-', '~'])
-                for i,x in enumerate(splitter):
-                    if x == ':':
-                        matches += int(splitter[i+1])
-                        position += int(splitter[i+1])
-                        querypos += int(splitter[i+1])
-                    elif x == '-':
-                        gaps += 1
-                    elif x == '+':
-                        gaps += 1
-                        querypos += len(splitter[i+1])
-                    elif x == '~':
-                        if aln.sam_flag == 0:
-                            if splitter[i+1].startswith('gt') and splitter[i+1].endswith('ag'):
-                                ProperSplice = True
-                            elif splitter[i+1].startswith('at') and splitter[i+1].endswith('ac'):
-                                ProperSplice = True
-                            else:
-                                ProperSplice = False
-                                break
-                        elif aln.sam_flag == 16:
-                            if splitter[i+1].startswith('ct') and splitter[i+1].endswith('ac'):
-                                ProperSplice = True
-                            elif splitter[i+1].startswith('gt') and splitter[i+1].endswith('at'):
-                                ProperSplice = True
-                            else:
-                                ProperSplice = False
-                                break
-                        num_exons += 1
-                        exons.append(position)
-                        query.append(querypos)
-                        query.append(querypos+1)
-                        intronLen = int(splitter[i+1][2:-2])
-                        position += intronLen
-                        exons.append(position)
-                #add last Position
-                exons.append(position)
-                query.append(aln.sam_l_seq)
-
-                #convert exon list into list of exon tuples
-                exons = zip(exons[0::2], exons[1::2])
-                queries = zip(query[0::2], query[1::2])
-                introns = []
-                if len(exons) > 1:
-                    for x,y in enumerate(exons):
-                        try:
-                            introns.append((y[1], exons[x+1][0]-1))
-                        except IndexError:
-                            pass
-                if ProperSplice:
-                    mismatches = nm - gaps
-                    pident = 100 * (matches / (matches + mismatches))
-                    if pident < 80:
-                        continue
-                    feature = 'EST_match'
-                    if pident > 95:
-                        feature = 'cDNA_match'
+            for result in runAlignments(alignment2hints, bamAlignments(input, inflate), workers):
+                if result:
                     count += 1
-                    for i,exon in enumerate(exons):
-                        start = exon[0]
-                        end = exon[1]-1
-                        qstart = queries[i][0]
-                        qend = queries[i][1]
-                        if i == 0 or i == len(exons)-1:
-                            gffout.write('{:}\t{:}\t{:}\t{:}\t{:}\t{:.2f}\t{:}\t{:}\tID=minimap2_{:};Target={:} {:} {:} {:}\n'.format(aln.sam_rname, 'genome', feature, start, end, pident, strand, '.', num+1, aln.sam_qname, qstart, qend, strand))
-                            hintsout.write('{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\tgrp=minimap2_{:};pri=4;src=E\n'.format(aln.sam_rname, 'b2h', 'ep', start, end, 0, strand, '.', num+1, aln.sam_qname))
-                        else:
-                            gffout.write('{:}\t{:}\t{:}\t{:}\t{:}\t{:.2f}\t{:}\t{:}\tID=minimap2_{:};Target={:} {:} {:} {:}\n'.format(aln.sam_rname, 'genome', feature, start, end, pident, strand, '.', num+1, aln.sam_qname, qstart, qend, strand))
-                            hintsout.write('{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\tgrp=minimap2_{:};pri=4;src=E\n'.format(aln.sam_rname, 'b2h', 'exon', start, end, 0, strand, '.', num+1, aln.sam_qname))
-                    if len(introns) > 0:
-                        for z in introns:
-                            hintsout.write('{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\tgrp=minimap2_{:};pri=4;src=E\n'.format(aln.sam_rname, 'b2h', 'intron', z[0], z[1], 1, strand, '.', num+1, aln.sam_qname))
+                    gffout.write(result[0])
+                    hintsout.write(result[1])
     return count
 
 def combineTranscripts(minimap, gmap, output):
@@ -1555,52 +1731,29 @@ def combineTranscripts(minimap, gmap, output):
                                 Target = y
                         out.write('{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\t{:}\tID=gmap_{:};{:}\n'.format(contig,source,feature,start,end,score,strand,phase,i+1,Target))
 
+#standard genetic code, built once: codon -> amino acid
+CODON_TABLE = dict((a+b+c, 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'[16*i+4*j+k])
+    for i,a in enumerate('TCAG') for j,b in enumerate('TCAG') for k,c in enumerate('TCAG'))
+
+#complement lookup for str.translate, IUPAC codes included
+REVCOMP_TABLE = string.maketrans('ACGTUMRWSYKVHDBXNacgtumrwsykvhdbxn', 'TGCAAKYWSRMBDHVXNTGCAAKYWSRMBDHVXN')
+
 def RevComp(s):
-    rev_comp_lib = {'A':'T','C':'G','G':'C','T':'A','U':'A','M':'K','R':'Y','W':'W','S':'S','Y':'R','K':'M','V':'B','H':'D','D':'H','B':'V','X':'X','N':'N'}
-    cseq = ''
-    n = len(s)
-    s = s.upper()
-    for i in range(0,n):
-        c = s[n-i-1]
-        cseq += rev_comp_lib[c]
-    return cseq
+    return str(s).translate(REVCOMP_TABLE)[::-1]
 
 def translate(cDNA, strand, phase):
     '''
     translate cDNA into protein sequence
     trying to see if I can speed this up over Biopython
     '''
-    def _split(str, num):
-        return [str[start:start+num] for start in range(0, len(str), num)]
-    codon_table = {'TTT': 'F', 'TTC': 'F', 'TTA': 'L', 'TTG': 'L', 'TCT': 'S',
-        'TCC': 'S', 'TCA': 'S', 'TCG': 'S', 'TAT': 'Y', 'TAC': 'Y',
-        'TGT': 'C', 'TGC': 'C', 'TGG': 'W', 'CTT': 'L', 'CTC': 'L',
-        'CTA': 'L', 'CTG': 'L', 'CCT': 'P', 'CCC': 'P', 'CCA': 'P',
-        'CCG': 'P', 'CAT': 'H', 'CAC': 'H', 'CAA': 'Q', 'CAG': 'Q',
-        'CGT': 'R', 'CGC': 'R', 'CGA': 'R', 'CGG': 'R', 'ATT': 'I',
-        'ATC': 'I', 'ATA': 'I', 'ATG': 'M', 'ACT': 'T', 'ACC': 'T',
-        'ACA': 'T', 'ACG': 'T', 'AAT': 'N', 'AAC': 'N', 'AAA': 'K',
-        'AAG': 'K', 'AGT': 'S', 'AGC': 'S', 'AGA': 'R', 'AGG': 'R',
-        'GTT': 'V', 'GTC': 'V', 'GTA': 'V', 'GTG': 'V', 'GCT': 'A',
-        'GCC': 'A', 'GCA': 'A', 'GCG': 'A', 'GAT': 'D', 'GAC': 'D',
-        'GAA': 'E', 'GAG': 'E', 'GGT': 'G', 'GGC': 'G', 'GGA': 'G',
-        'GGG': 'G', 'TAA': '*', 'TAG': '*', 'TGA': '*'}
     if strand == '-' or strand == -1:
         seq = RevComp(cDNA)
     else:
-        seq = cDNA
+        seq = str(cDNA).upper()
     seq = seq[phase:]
-    #map seq to proteins
-    protSeq = []
-    for i in _split(seq, 3):
-        if len(i) == 3:
-            iSeq = i.upper()
-            if iSeq in codon_table:
-                aa = codon_table[iSeq]
-                protSeq.append(aa)
-            else:
-                protSeq.append('X')
-    return ''.join(protSeq)
+    #map seq to proteins, codons that aren't ACGT are X, partial codon at the end is dropped
+    codon = CODON_TABLE.get
+    return ''.join([codon(seq[i:i+3], 'X') for i in range(0, len(seq)-2, 3)])
 
 def extend2stop(seqDict, header, coordinates, strand, phase, protLen):
     '''
@@ -1612,8 +1765,12 @@ def extend2stop(seqDict, header, coordinates, strand, phase, protLen):
     sorted_coordinates = sorted(coordinates, key=lambda tup: tup[0])
     if strand == '+':
         newStop = sorted_coordinates[-1][1]+60
-        if newStop > len(seqDict[header]):
-            newStop = len(seqDict[header])
+        if isinstance(seqDict, FastaIndex):
+            contigLength = seqDict.length(header)
+        else:
+            contigLength = len(seqDict[header])
+        if newStop > contigLength:
+            newStop = contigLength
         lastTup = (sorted_coordinates[-1][0], newStop)
         if len(sorted_coordinates) > 1:
             newCoords = sorted_coordinates[:-1]
@@ -1655,14 +1812,30 @@ def extend2stop(seqDict, header, coordinates, strand, phase, protLen):
             return False, coordinates
 
 def getSeqRegions(SeqRecordDict, header, coordinates):
-    #takes SeqRecord dictionary or Index, returns sequence string
+    #takes dictionary of sequence strings or SeqRecords, or a FastaIndex, returns sequence string
     #coordinates is a list of tuples [(1,10), (20,30)]
-    result = ''
     sorted_coordinates = sorted(coordinates, key=lambda tup: tup[0])
-    for x in sorted_coordinates:
-        partial = SeqRecordDict[header][x[0]-1:x[1]]
-        result += str(partial.seq)
-    return result
+    if isinstance(SeqRecordDict, FastaIndex):
+        return ''.join([SeqRecordDict.fetch(header, x[0]-1, x[1]) for x in sorted_coordinates])
+    seq = SeqRecordDict[header]
+    if hasattr(seq, 'seq'): #SeqRecord, slice the Seq rather than copying the record annotations
+        seq = seq.seq
+    return ''.join([str(seq[x[0]-1:x[1]]) for x in sorted_coordinates])
+
+def featureSeq(f, record, seq=None):
+    '''
+    sequence string of a GenBank feature, same as str(f.extract(record.seq)) but slices seq, a plain
+    string of the record sequence; callers looping over features should make it once per record and pass it in
+    '''
+    strands = set([x.strand for x in f.location.parts])
+    if len(strands) > 1: #mixed strand, ie trans-spliced, let Biopython sort it out
+        return str(f.extract(record.seq))
+    if seq is None:
+        seq = str(record.seq)
+    seq = getSeqRegions({record.id: seq}, record.id, [(x.nofuzzy_start+1, x.nofuzzy_end) for x in f.location.parts])
+    if strands.pop() == -1:
+        seq = RevComp(seq)
+    return seq
 
 def convertgff2tbl(gff, prefix, fasta, prots, trans, tblout):
     from collections import OrderedDict
@@ -1777,6 +1950,113 @@ def annotations2dict(input):
                     Annotations[geneID][refDB].append(description)
     return Annotations
 
+class AnnotationStore(object):
+    '''
+    functional annotations keyed by locus, the in-memory equivalent of annotations2dict(all.annotations.txt).
+    Annotation lines (ID, refDB, description) are deduplicated as they are added; name/product lines on a
+    transcript (-T) are stored on the gene. If IDs are given, lines for any other ID are dropped. For very
+    large genomes pass db to keep the annotations in an on-disk sqlite database instead of in memory.
+    get(locus) returns {refDB: [descriptions]}, so the store can be passed to updateTBL in place of the dict.
+    '''
+    def __init__(self, IDs=None, db=None):
+        self.IDs = IDs
+        self.db = None
+        self.count = 0
+        if db:
+            import sqlite3
+            if os.path.isfile(db):
+                os.remove(db)
+            self.db = sqlite3.connect(db)
+            self.db.text_factory = str
+            self.db.execute('CREATE TABLE annot (n INTEGER PRIMARY KEY, raw TEXT, locus TEXT, refdb TEXT, description TEXT, UNIQUE (raw, refdb, description))')
+            self.db.execute('CREATE INDEX locus_idx ON annot (locus)')
+        else:
+            self.seen = set()
+            self.lines = []
+            self.annotations = {}
+
+    def add(self, ID, refDB, description):
+        '''add a single annotation, returns True if it was new'''
+        if self.IDs is not None and not ID in self.IDs:
+            return False
+        if description == '': #there is nothing here, so skip
+            return False
+        if (refDB == 'name' or refDB == 'product') and '-T' in ID:
+            geneID = ID.split('-T')[0]
+        else:
+            geneID = ID
+        if self.db:
+            cur = self.db.execute('INSERT OR IGNORE INTO annot (raw, locus, refdb, description) VALUES (?,?,?,?)', (ID, geneID, refDB, description))
+            if cur.rowcount < 1:
+                return False
+        else:
+            line = (ID, refDB, description)
+            if line in self.seen:
+                return False
+            self.seen.add(line)
+            self.lines.append(line)
+            if not geneID in self.annotations:
+                self.annotations[geneID] = {refDB: [description]}
+            elif not refDB in self.annotations[geneID]:
+                self.annotations[geneID][refDB] = [description]
+            else:
+                self.annotations[geneID][refDB].append(description)
+        self.count += 1
+        return True
+
+    def load(self, input):
+        '''stream a 3 column annotation file into the store, returns (lines read, lines added)'''
+        total, added = 0, 0
+        with open(input, 'rU') as infile:
+            for line in infile:
+                total += 1
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) != 3: #make sure it is 3 columns
+                    continue
+                if self.add(*cols):
+                    added += 1
+        if self.db:
+            self.db.commit()
+        return total, added
+
+    def __contains__(self, locus):
+        if self.db:
+            return self.db.execute('SELECT 1 FROM annot WHERE locus=? LIMIT 1', (locus,)).fetchone() is not None
+        return locus in self.annotations
+
+    def get(self, locus, default=None):
+        if not self.db:
+            return self.annotations.get(locus, default)
+        result = {}
+        for refDB, description in self.db.execute('SELECT refdb, description FROM annot WHERE locus=? ORDER BY n', (locus,)):
+            result.setdefault(refDB, []).append(description)
+        if not result:
+            return default
+        return result
+
+    def replace(self, locus, refDB, descriptions):
+        '''replace (or with an empty list remove) the annotations of a type for a locus, ie --fix/--remove'''
+        if self.db:
+            self.db.execute('DELETE FROM annot WHERE locus=? AND refdb=?', (locus, refDB))
+            for x in descriptions:
+                self.db.execute('INSERT OR IGNORE INTO annot (raw, locus, refdb, description) VALUES (?,?,?,?)', (locus, locus, refDB, x))
+            self.db.commit()
+        elif locus in self.annotations:
+            if descriptions:
+                self.annotations[locus][refDB] = list(descriptions)
+            elif refDB in self.annotations[locus]:
+                del self.annotations[locus][refDB]
+
+    def write(self, output):
+        '''write the annotations as they were added to a 3 column file, ie all.annotations.txt'''
+        if self.db:
+            lines = self.db.execute('SELECT raw, refdb, description FROM annot ORDER BY n')
+        else:
+            lines = self.lines
+        with open(output, 'w') as outfile:
+            for line in lines:
+                outfile.write('%s\t%s\t%s\n' % tuple(line))
+
 def updateTBL(input, annotDict, output):
     '''
     general function to parse ncbi tbl format and add functional annotation
@@ -2119,7 +2399,7 @@ def tbl2dict(input, fasta, Genes):
                                 'db_xref': dbxref, 'go_terms': go_terms, 'EC_number': ECnum, 'note': note,
                                 'partialStart': fivepartial, 'partialStop': threepartial, 'pseudo': False}
     #now we need to sort coordinates, get protein/transcript sequences and capture UTRs
-    SeqRecords = SeqIO.to_dict(SeqIO.parse(fasta, 'fasta'))
+    SeqRecords = genomeStore(fasta)
     for k,v in Genes.items():
         for i in range(0,len(v['ids'])):
             if v['type'] == 'mRNA' or v['type'] == 'tRNA':
@@ -2170,11 +2450,10 @@ def dicts2tbl(genesDict, scaff2genes, scaffLen, SeqCenter, SeqRefNum, skipList,
     #to parse annotations, will need to have access to GO OBO dictionary
     goDict = {}
     if annotations:
-        from goatools import obo_parser
-        #location of go.obo
-        FUNDB = os.environ["FUNANNOTATE_DB"]
-        for item in obo_parser.OBOReader(os.path.join(os.environ["FUNANNOTATE_DB"], 'go.obo')):
-            goDict[item.id] = {'name': item.name, 'namespace': item.namespace}
+        #location of go.obo, pre-parsed lookup table
+        for ID, value in dbIndex(os.path.join(os.environ["FUNANNOTATE_DB"], 'go.obo')).items():
+            name, namespace = value.split('\t')
+            goDict[ID] = {'name': name, 'namespace': namespace}
     def _goFormat(id, goDict=goDict):
         #go_function    serine-type endopeptidase activity|0004252||IEA
         #go_process proteolysis|0006508||IEA
@@ -2617,9 +2896,10 @@ def gb2nucleotides(input, prots, trans, dna):
     with open(dna, 'w') as dnaout:
         with open(input, 'rU') as filein:
             for record in SeqIO.parse(filein, 'genbank'):
-                dnaout.write(">%s\n%s\n" % (record.id, softwrap(str(record.seq))))
+                recordSeq = str(record.seq)
+                dnaout.write(">%s\n%s\n" % (record.id, softwrap(recordSeq)))
                 for f in record.features:
-                    gb_feature_add2dict(f, record, genes)
+                    gb_feature_add2dict(f, record, genes, recordSeq)
     #write to protein and transcripts
     dict2nucleotides(genes, prots, trans)
     return len(genes)
@@ -2658,9 +2938,10 @@ def gb2gffnuc(input, gff, prots, trans, dna):
     with open(dna, 'w') as dnaout:
         with open(input, 'rU') as filein:
             for record in SeqIO.parse(filein, 'genbank'):
-                dnaout.write(">{:}\n{:}\n".format(record.id, softwrap(str(record.seq))))
+                recordSeq = str(record.seq)
+                dnaout.write(">{:}\n{:}\n".format(record.id, softwrap(recordSeq)))
                 for f in record.features:
-                    gb_feature_add2dict(f, record, genes)
+                    gb_feature_add2dict(f, record, genes, recordSeq)
     #write gff3 output
     dict2gff3(genes, gff)
     #write to protein and transcripts
@@ -2678,7 +2959,8 @@ def gb2parts(input, tbl, gff, prots, trans, dna):
     with open(dna, 'w') as dnaout:
         with open(input, 'rU') as filein:
             for record in SeqIO.parse(filein, 'genbank'):
-                dnaout.write(">{:}\n{:}\n".format(record.id, softwrap(str(record.seq))))
+                recordSeq = str(record.seq)
+                dnaout.write(">{:}\n{:}\n".format(record.id, softwrap(recordSeq)))
                 Contig = record.id
                 if not Contig in scaffLen:
                     scaffLen[Contig] = len(record.seq)
@@ -2689,7 +2971,7 @@ def gb2parts(input, tbl, gff, prots, trans, dna):
                             scaff2genes[Contig] = [locusTag]
                         else:
                             scaff2genes[Contig].append(locusTag)
-                    gb_feature_add2dict(f, record, genes)
+                    gb_feature_add2dict(f, record, genes, recordSeq)
 
     #write tbl output
     dicts2tbl(genes, scaff2genes, scaffLen, 'CFMR', '12345', [], tbl)
@@ -2699,7 +2981,7 @@ def gb2parts(input, tbl, gff, prots, trans, dna):
     dict2nucleotides(genes, prots, trans)
     return len(genes)
 
-def gb_feature_add2dict(f, record, genes):
+def gb_feature_add2dict(f, record, genes, seq=None):
     '''
     general function to take a genbank feature from flat file and add to funannotate standardized dictionary
     locustag: {
@@ -2772,7 +3054,7 @@ def gb_feature_add2dict(f, record, genes):
             if not genes[locusTag]['name']:
                 genes[locusTag]['name'] = name
     elif f.type == 'tRNA' or f.type == 'rRNA' or f.type == 'ncRNA':
-        feature_seq = f.extract(record.seq)
+        feature_seq = featureSeq(f, record, seq)
         try:
             name = f.qualifiers['gene'][0]
         except KeyError:
@@ -2824,7 +3106,7 @@ def gb_feature_add2dict(f, record, genes):
             if not genes[locusTag]['name']:
                 genes[locusTag]['name'] = name
     elif f.type == 'mRNA':
-        feature_seq = f.extract(record.seq)
+        feature_seq = featureSeq(f, record, seq)
         try:
             name = f.qualifiers['gene'][0]
         except KeyError:
@@ -2867,7 +3149,7 @@ def gb_feature_add2dict(f, record, genes):
     elif f.type == 'exon': #assuming need to overwrite mRNA feature then?
         genes[locusTag]['mRNA'] = []
         genes[locusTag]['transcript'] = []
-        feature_seq = f.extract(record.seq)
+        feature_seq = featureSeq(f, record, seq)
         try:
             name = f.qualifiers['gene'][0]
         except KeyError:
@@ -2905,7 +3187,7 @@ def gb_feature_add2dict(f, record, genes):
             genes[locusTag]['partialStart'].append(Fivepartial)
             genes[locusTag]['partialStop'].append(Threepartial)
     elif f.type == 'CDS' and 'codon_start' in f.qualifiers:
-        feature_seq = f.extract(record.seq)
+        feature_seq = featureSeq(f, record, seq)
         if not ID:
             try:
                 log.info("putative transcript from %s has no ID\n(%s %s %s)" % (locusTag, locusTag, ID, Parent))
@@ -2977,29 +3259,101 @@ def gb_feature_add2dict(f, record, genes):
                 genes[locusTag]['name'] = name
     return genes
 
+def genes2interlap(Genes, inter, strand=False):
+    '''
+    add gene locations from a funannotate standard annotation dictionary to a scaffold interlap dictionary,
+    items are (start, end, locus) or (start, end, strand, locus), one bulk add per contig
+    '''
+    byContig = defaultdict(list)
+    for k,v in Genes.items():
+        if strand:
+            byContig[v['contig']].append((v['location'][0], v['location'][1], v['strand'], k))
+        else:
+            byContig[v['contig']].append((v['location'][0], v['location'][1], k))
+    for contig, items in byContig.items():
+        inter[contig].add(items)
+    return inter
+
 def gff2interlap(input, fasta):
     '''
     function to parse GFF3 file, construct scaffold/gene interlap dictionary and funannotate standard annotation dictionary
     '''
-    inter = defaultdict(InterLap)
-    Genes = {}
-    Genes = gff2dict(input, fasta, Genes)
-    for k,v in natsorted(Genes.items()):
-        inter[v['contig']].add((v['location'][0],v['location'][1],k))
-    return inter, Genes
+    index = GFF3Index(input, fasta)
+    Genes = index.genes()
+    return index.interlap(), Genes
 
 def gff2interlapDict(input, fasta, inter, Dict):
     '''
     function to parse GFF3 file, construct scaffold/gene interlap dictionary and funannotate standard annotation dictionary
     '''
-    Genes = {}
-    Genes = gff2dict(input, fasta, Genes)
-    for k,v in natsorted(Genes.items()):
-        inter[v['contig']].add((v['location'][0], v['location'][1], v['strand'], k))
+    Genes = GFF3Index(input, fasta).genes()
+    inter = genes2interlap(Genes, inter, strand=True)
     #merge dictionary and return
     Dict = merge_dicts(Dict, Genes)
     return inter, Dict
 
+def batchAED(pairs):
+    '''
+    annotation edit distance of many (query, reference) exon coordinate lists at once
+    AED = 1 - (SN + SP / 2), exons of all pairs are flattened into numpy arrays and every query exon
+    is compared to the reference exons of its pair, overlap is summed per pair with bincount
+    returns numpy array of AED rounded like the old '{:.3f}' formatted values
+    '''
+    import numpy as np
+    num = len(pairs)
+    if num == 0:
+        return np.zeros(0)
+    qCount = np.array([len(q) for q,r in pairs], dtype=np.int64)
+    rCount = np.array([len(r) for q,r in pairs], dtype=np.int64)
+    qCoords = np.fromiter(itertools.chain.from_iterable(x for q,r in pairs for x in q), dtype=np.int64).reshape(-1, 2)
+    rCoords = np.fromiter(itertools.chain.from_iterable(x for q,r in pairs for x in r), dtype=np.int64).reshape(-1, 2)
+    qPair = np.repeat(np.arange(num), qCount)
+    rPair = np.repeat(np.arange(num), rCount)
+    qLen = np.bincount(qPair, weights=np.abs(qCoords[:,0] - qCoords[:,1]), minlength=num)
+    rLen = np.bincount(rPair, weights=np.abs(rCoords[:,0] - rCoords[:,1]), minlength=num)
+    #every query exon against each reference exon of the same pair
+    rFirst = np.cumsum(rCount) - rCount
+    perQuery = rCount[qPair]
+    qIdx = np.repeat(np.arange(len(qPair)), perQuery)
+    offset = np.arange(len(qIdx)) - np.repeat(np.cumsum(perQuery) - perQuery, perQuery)
+    rIdx = rFirst[qPair[qIdx]] + offset
+    qs, qe = qCoords[qIdx,0], qCoords[qIdx,1]
+    rs, re = rCoords[rIdx,0], rCoords[rIdx,1]
+    hit = (qs <= re) & (qe >= rs)
+    cov = np.minimum(qe[hit], re[hit]) - np.maximum(qs[hit], rs[hit])
+    overlap = np.bincount(qPair[qIdx[hit]], weights=cov, minlength=num)
+    AED = np.zeros(num)
+    ok = (qLen > 0) & (rLen > 0)
+    AED[ok] = 1 - ((overlap[ok] / rLen[ok] + overlap[ok] / qLen[ok]) / 2)
+    for i, (q, r) in enumerate(pairs):
+        if q == r:
+            AED[i] = 0
+    return np.array([float('{:.3f}'.format(x)) for x in AED])
+
+def lociAED(loci):
+    '''
+    takes list of (query transcripts, reference transcripts) for each locus, sums lowest AED from
+    the pairwise transcript comparisons and averages by number of query transcripts, all loci are
+    passed to batchAED in one go, returns numpy array of the average AED for each locus
+    '''
+    import numpy as np
+    pairs = []
+    for query, reference in loci:
+        pairs.extend(itertools.product(query, reference))
+    result = np.zeros(len(loci))
+    if not pairs:
+        return result
+    pAED = batchAED(pairs)
+    qCount = np.array([len(q) for q,r in loci], dtype=np.int64)
+    rCount = np.array([len(r) for q,r in loci], dtype=np.int64)
+    #product of each locus is split into rCount chunks of len(query), lowest AED of each chunk
+    chunkLocus = np.repeat(np.arange(len(loci)), rCount * (qCount > 0))
+    chunkStart = np.cumsum(qCount[chunkLocus]) - qCount[chunkLocus]
+    lowest = np.minimum.reduceat(pAED, chunkStart)
+    AEDsum = np.bincount(chunkLocus, weights=lowest, minlength=len(loci))
+    ok = qCount > 0
+    result[ok] = AEDsum[ok] / qCount[ok]
+    return result
 
 
 def gff2interlapDictOLD(file, inter, Dict):
@@ -3281,6 +3635,87 @@ def exonerate2hints(file, outfile):
                             pass
 
 
+#bump when anything that ends up in a pickled cache changes (parsers, sequence extraction, etc) so
+#caches written by older code are rebuilt rather than reused
+CACHE_VERSION = 1
+#folder for on-disk caches of parsed annotation, set by a script with setCacheDir, inside its own output
+#folder; when None parsed annotation is only cached in memory
+CACHEDIR = None
+
+def setCacheDir(folder):
+    global CACHEDIR
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    CACHEDIR = os.path.abspath(folder)
+
+def pickleCache(path, key, build):
+    '''
+    return data pickled at path if it was stored under the same key and CACHE_VERSION, otherwise
+    call build() and store the result, written to a temporary file and renamed so a partial cache
+    is never read. If path can't be written the data is just returned
+    '''
+    import cPickle
+    key = (CACHE_VERSION, key)
+    if os.path.isfile(path):
+        try:
+            with open(path, 'rb') as infile:
+                cachedKey, data = cPickle.load(infile)
+            if cachedKey == key:
+                return data
+        except Exception:
+            pass
+    data = build()
+    tmpout = path+'.'+str(os.getpid())
+    try:
+        with open(tmpout, 'wb') as outfile:
+            cPickle.dump((key, data), outfile, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmpout, path)
+    except (IOError, OSError):
+        SafeRemove(tmpout)
+    return data
+
+class GFF3Index(object):
+    '''
+    GFF3 annotation parsed once into the funannotate standardized dictionary (see gff2dict). The parsed
+    dictionary is kept pickled in memory, keyed on a SHA256 of the GFF3 and the path/size/mtime of the
+    FASTA, so loading an unchanged annotation again skips parsing and sequence extraction. If a cache
+    folder was set with setCacheDir it is also kept there (see pickleCache) for later runs. genes()
+    returns a fresh copy each time, so callers are free to modify it.
+    '''
+    loaded = OrderedDict()
+    maxLoaded = 4
+
+    def __init__(self, gff3, fasta):
+        import cPickle
+        self.gff3 = os.path.abspath(gff3)
+        self.fasta = os.path.abspath(fasta)
+        with open(self.gff3, 'rb') as infile:
+            key = hashfile(infile, hashlib.sha256()).encode('hex')
+        st = os.stat(self.fasta)
+        key = '{:}:{:}:{:}:{:}'.format(key, os.path.realpath(self.fasta), st.st_size, st.st_mtime)
+        cached = GFF3Index.loaded.get(self.gff3)
+        if cached and cached[0] == key:
+            self.data = cached[1]
+            return
+        def _parse():
+            return cPickle.dumps(_gff2dict(self.gff3, self.fasta, {}), cPickle.HIGHEST_PROTOCOL)
+        if CACHEDIR:
+            name = hashlib.sha1(os.path.realpath(self.gff3)).hexdigest()+'.gff3.pkl'
+            self.data = pickleCache(os.path.join(CACHEDIR, name), key, _parse)
+        else:
+            self.data = _parse()
+        GFF3Index.loaded[self.gff3] = (key, self.data)
+        while len(GFF3Index.loaded) > GFF3Index.maxLoaded:
+            GFF3Index.loaded.popitem(last=False)
+
+    def genes(self):
+        import cPickle
+        return cPickle.loads(self.data)
+
+    def interlap(self, strand=False):
+        '''return scaffold interlap dictionary of gene locations'''
+        return genes2interlap(self.genes(), defaultdict(InterLap), strand=strand)
+
 def gff2dict(file, fasta, Genes, debug=False):
     '''
     general function to take a GFF3 file and return a funannotate standardized dictionary
@@ -3308,6 +3743,15 @@ def gff2dict(file, fasta, Genes, debug=False):
     '5UTR': [[(),()]] #list of lists of tuples (start, end)
     '3UTR': [[(),()]] #list of lists of tuples (start, end)
     }
+    annotation is loaded through GFF3Index, if Genes is not empty the GFF3 is parsed and merged into it
+    '''
+    if Genes:
+        return _gff2dict(file, fasta, Genes)
+    return GFF3Index(file, fasta).genes()
+
+def _gff2dict(file, fasta, Genes):
+    '''
+    parse GFF3 file into funannotate standardized dictionary, see gff2dict
     '''
     idParent = {}
     with open(file, 'rU') as input:
@@ -3474,7 +3918,7 @@ def gff2dict(file, fasta, Genes, debug=False):
                                 i = Genes[GeneFeature]['ids'].index(p)
                                 Genes[GeneFeature]['3UTR'][i].append((start,end))
     #loop through and make sure CDS and exons are properly sorted and codon_start is correct, translate to protein space
-    SeqRecords = SeqIO.to_dict(SeqIO.parse(fasta, 'fasta'))
+    SeqRecords = genomeStore(fasta)
     for k,v in Genes.items():
         for i in range(0,len(v['ids'])):
             if v['type'] == 'mRNA' or v['type'] == 'tRNA':
@@ -4036,9 +4480,10 @@ def gb2allout(input, GFF, Proteins, Transcripts, DNA):
     with open(DNA, 'w') as scaffolds:
         with open(input, 'rU') as gbk:
             for record in SeqIO.parse(gbk, 'genbank'):
-                scaffolds.write(">{:}\n{:}\n".format(record.id, softwrap(str(record.seq))))
+                recordSeq = str(record.seq)
+                scaffolds.write(">{:}\n{:}\n".format(record.id, softwrap(recordSeq)))
                 for f in record.features:
-                    gb_feature_add2dict(f, record, genes)
+                    gb_feature_add2dict(f, record, genes, recordSeq)
     #write GFF
     dict2gff3_old(genes, GFF)
     #write to protein and transcripts
@@ -4328,7 +4773,7 @@ def fasta2chunks(input, chunks, tmpdir, output):
     with open(input, 'rU') as seqs:
         SeqCount = countfasta(input)
         SeqRecords = SeqIO.parse(seqs, 'fasta')
-        chunks = SeqCount / int(chunks)
+        chunks = max(1, SeqCount / int(chunks))
         #divide into chunks, store in tmp file
         folder = os.path.join(tmpdir, output)
         if not os.path.exists(folder):
@@ -4343,26 +4788,83 @@ def fasta2chunks(input, chunks, tmpdir, output):
             count = SeqIO.write(batch, handle, "fasta")
             handle.close()
 
-def signalP(input, tmpdir, output):
-    #split input file into chunks, 20 should mean < 200 proteins per chunk
-    fasta2chunks(input, 40, tmpdir, 'signalp_tmp')
-    for file in os.listdir(os.path.join(tmpdir, 'signalp_tmp')):
-        if file.startswith('chunk'):
-            file = os.path.join(tmpdir, 'signalp_tmp', file)
-            tmp_out = file.replace('.fa', '.signalp.out')
-            cmd = ['signalp', '-t', 'euk', '-f', 'short', file]
-            runSubprocess2(cmd, '.', log, tmp_out)
-    #now concatenate all outputs
-    if os.path.isfile(output):
-        os.remove(output)
-    with open(output, 'a') as finalout:
-        for file in os.listdir(os.path.join(tmpdir, 'signalp_tmp')):
-            if file.endswith('.signalp.out'):
-                file = os.path.join(tmpdir, 'signalp_tmp', file)
-                with open(file) as infile:
-                    finalout.write(infile.read())
+class ProductNames(object):
+    '''
+    gene name/product description normalization against the curated Gene2Product list. Names, products
+    and a case-folded index of the names are looked up in the DBIndex of the curated list (see
+    _curatedRecords) and the word replacement pattern is compiled once, so cleaning is an indexed lookup
+    and a single regex pass per gene.
+    '''
+    replace = {'potential': 'putative', 'possible': 'putative', 'probable': 'putative', 'predicted': 'putative',
+           'uncharacterized': 'putative', 'uncharacterised': 'putative', 'homolog': '', 'EC': '', 'COG': '',
+           'inactivated': '', 'related': '', 'family': '', 'gene': 'protein', 'homologue': '','open reading frame': '',
+           'frame': '', 'yeast': '', 'Drosophila': '', 'Yeast': '', 'drosophila': ''}
+
+    def __init__(self, curated):
+        self.db = dbIndex(curated)
+        # replace words in dictionary, from https://stackoverflow.com/questions/6116978/python-replace-multiple-strings
+        self.rep = dict((re.escape(k), v) for k, v in self.replace.iteritems())
+        self.pattern = re.compile("|".join(self.rep.keys()))
+
+    def __contains__(self, name):
+        return name in self.db
+
+    def fold(self, name):
+        '''return the curated name that matches name ignoring case, or None'''
+        return self.db.get('\t'+name.lower())
+
+    def lookup(self, names):
+        '''return (name, curated product) of the last name in the list found in the curated list, either
+        as is or ignoring case, or (None, None)'''
+        GeneName, GeneProduct = None, None
+        for x in names:
+            product = self.db.get(x)
+            if product is None:
+                folded = self.fold(x)
+                if folded:
+                    product = self.db.get(folded)
+            if product is not None:
+                GeneName, GeneProduct = x, product
+        return GeneName, GeneProduct
+
+    def clean(self, product):
+        '''swap the uninformative words in a product description'''
+        return self.pattern.sub(lambda m: self.rep[re.escape(m.group(0))], product)
+
+    def tidy(self, product):
+        '''fix spacing and unbalanced/empty parentheses'''
+        product = ' '.join(product.split())
+        product = product.replace('()', '')
+        if '(' in product and not ')' in product:
+            product = product.split('(')[0].rstrip()
+        return product.replace(' ,', ',')
+
+#most proteins sent to a single signalp run, SignalP 4 refuses more than 10,000
+SIGNALP_CHUNK = 2000
+
+def signalP(input, tmpdir, output, cpus=1):
+    #split input file into chunks, 4 per cpu so a slow chunk doesn't hold up the others,
+    #but never more than SIGNALP_CHUNK proteins in a chunk
+    chunks = max(cpus*4, int(math.ceil(countfasta(input) / SIGNALP_CHUNK)))
+    fasta2chunks(input, chunks, tmpdir, 'signalp_tmp')
+    folder = os.path.join(tmpdir, 'signalp_tmp')
+    chunks = [x for x in os.listdir(folder) if x.startswith('chunk') and x.endswith('.fa')]
+    chunks = sorted(chunks, key=lambda x: int(x.split('_')[1].split('.')[0]))
+    def _signalp(file):
+        file = os.path.join(folder, file)
+        tmp_out = file.replace('.fa', '.signalp.out')
+        cmd = ['signalp', '-t', 'euk', '-f', 'short', file]
+        runSubprocess2(cmd, '.', log, tmp_out)
+    #each thread just waits on its signalp process
+    runThreads(_signalp, chunks, cpus)
+    #now concatenate all outputs in chunk order
+    with open(output, 'w') as finalout:
+        for file in chunks:
+            file = os.path.join(folder, file.replace('.fa', '.signalp.out'))
+            with open(file) as infile:
+                shutil.copyfileobj(infile, finalout)
     #cleanup tmp directory
-    shutil.rmtree(os.path.join(tmpdir, 'signalp_tmp'))
+    shutil.rmtree(folder)
 
 def parseSignalP(sigP, secretome_annot):
     sigpDict = {}
@@ -4512,7 +5014,7 @@ def RepeatMaskSpecies(input, species, cpus, tmpdir, output, debug):
             os.rename(os.path.join(outdir, file), output)
 
 def n_lower_chars(string):
-    return sum(1 for c in string if c.islower())
+    return sum(len(x) for x in softmaskRun.findall(string))
 
 def CheckAugustusSpecies(input):
     #get the possible species from augustus
@@ -4554,6 +5056,24 @@ def list2groups(L):
     yield first, last # Yield the last group
 
 
+softmaskRun = re.compile('[a-z]+')
+
+def softmaskedRegions(Seq):
+    '''
+    return list of 0-based (first, last) coordinates of each run of lowercase (soft-masked) bases,
+    works on the runs directly so never builds a per-base list of positions
+    '''
+    return [(m.start(), m.end()-1) for m in softmaskRun.finditer(Seq)]
+
+def softmaskedBed(masked, bedfile):
+    #write repeat regions to bedfile in natural contig order, numbering each repeat
+    counter = 1
+    with open(bedfile, 'w') as bedout:
+        for k,v in natsorted(masked.items()):
+            for item in v:
+                bedout.write('{:}\t{:}\t{:}\tRepeat_{:}\n'.format(k,item[0], item[1], counter))
+                counter += 1
+
 def checkMask(genome, bedfile):
     from Bio.SeqIO.FastaIO import SimpleFastaParser
     #load contig names and sizes into dictionary, get masked repeat stats
@@ -4567,103 +5087,57 @@ def checkMask(genome, bedfile):
                 ID = header.split(' ')[0]
             else:
                 ID = header
-            if not ID in masked:
-                masked[ID] = []
             if not ID in ContigSizes:
                 ContigSizes[ID] = len(Seq)
             GenomeLength += len(Seq)
-            maskedSize += n_lower_chars(Seq)
-            for i,c in enumerate(Seq):
-                if c.islower():
-                    masked[ID].append(i) #0 based
+            regions = softmaskedRegions(Seq)
+            maskedSize += sum(x[1] - x[0] + 1 for x in regions)
+            if not ID in masked:
+                masked[ID] = []
+            masked[ID] += regions
+    softmaskedBed(masked, bedfile)
     if maskedSize == 0: #not softmasked, return False
-        with open(bedfile, 'w') as bedout:
-            bedout.write('')
         return ContigSizes, GenomeLength, maskedSize, 0.0
-    else:
-        counter = 1
-        with open(bedfile, 'w') as bedout:
-            for k,v in natsorted(masked.items()):
-                repeats = list(list2groups(v))
-                for item in repeats:
-                    if len(item) == 2:
-                        bedout.write('{:}\t{:}\t{:}\tRepeat_{:}\n'.format(k,item[0], item[1], counter))
-                        counter += 1
     percentMask = maskedSize / float(GenomeLength)
     return ContigSizes, GenomeLength, maskedSize, percentMask
 
-def maskingstats2bed(input, counter, alock):
-    from Bio.SeqIO.FastaIO import SimpleFastaParser
-    masked = []
-    maskedSize = 0
-    bedfilename = input.replace('.fasta', '.bed')
-    with open(input, 'rU') as infile:
-        for header, Seq in SimpleFastaParser(infile):
-            if ' ' in header:
-                ID = header.split(' ')[0]
-            else:
-                ID = header
-            for i,c in enumerate(Seq):
-                if c.islower():
-                    masked.append(i) #0 based
-                    maskedSize += 1
-    if maskedSize > 0: #not softmasked, return False
-        with open(bedfilename, 'w') as bedout:
-            repeats = list(list2groups(masked))
-            for item in repeats:
-                if len(item) == 2:
-                    bedout.write('{:}\t{:}\t{:}\tRepeat_\n'.format(ID, item[0], item[1]))
-    with alock:
-        counter.value += maskedSize
-
-def mask_safe_run(*args, **kwargs):
-    """Call run(), catch exceptions."""
-    try: maskingstats2bed(*args, **kwargs)
-    except Exception as e:
-        print("error: %s run(*%r, **%r)" % (e, args, kwargs))
+def maskIndexInit(fasta, index):
+    #pool initializer, each worker opens its own memory map of the genome
+    global maskIndex
+    maskIndex = FastaIndex(fasta, index=index)
+
+def maskedContig(name):
+    return name, softmaskedRegions(maskIndex.fetch(name))
 
 def checkMasklowMem(genome, bedfile, cpus):
-    from Bio.SeqIO.FastaIO import SimpleFastaParser
-    #load contig names and sizes into dictionary, get masked repeat stats
-    maskedSize = 0
-    masked = {}
-    ContigSizes = {}
-    tmpdir = os.path.join(os.path.dirname(genome), 'mask_'+str(os.getpid()))
-    os.makedirs(tmpdir)
-    file_list = []
-    with open(genome, 'rU') as input:
-        for header, Seq in SimpleFastaParser(input):
-            if ' ' in header:
-                ID = header.split(' ')[0]
-            else:
-                ID = header
-            if not ID in ContigSizes:
-                ContigSizes[ID] = len(Seq)
-            with open(os.path.join(tmpdir, ID+'.fasta'), 'w') as fastaout:
-                fastaout.write('>{:}\n{:}\n'.format(ID, Seq))
-            file_list.append(os.path.join(tmpdir, ID+'.fasta'))
-    #num = 1
-    p = multiprocessing.Pool(processes=cpus)
-    TotalMask = multiprocessing.Manager().Value('i', 0)
-    lock = multiprocessing.Manager().Lock()
-    result = []
-    for i in file_list:
-        result.append(p.apply_async(mask_safe_run, [i, TotalMask, lock]))
-    p.close()
-    p.join()
-    repeatNum = 1
-    with open(bedfile, 'w') as bedout:
-        for file in natsorted(os.listdir(tmpdir)):
-            if file.endswith('.bed'):
-                with open(os.path.join(tmpdir, file), 'rU') as infile:
-                    for line in infile:
-                        line = line.replace('Repeat_', 'Repeat_'+str(repeatNum))
-                        bedout.write(line)
-                        repeatNum += 1
-    SafeRemove(tmpdir)
+    '''
+    same as checkMask, but contigs are scanned in parallel by workers that slice them out of
+    a memory-mapped genome index, so only a contig at a time is held in memory per worker
+    '''
+    import tempfile
+    #index goes in a temp folder, the genome's own folder may not be writable
+    tmpdir = tempfile.mkdtemp(prefix='mask_')
+    try:
+        Genome = indexFasta(genome, tmpdir)
+        ContigSizes = Genome.lengths()
+        masked = {}
+        p = multiprocessing.Pool(processes=cpus, initializer=maskIndexInit, initargs=(Genome.fasta, os.path.join(tmpdir, 'genome.fai')))
+        try:
+            #send largest contigs first so a huge scaffold at the end doesn't leave everything else idle
+            order = sorted(Genome.names, key=lambda x: ContigSizes[x], reverse=True)
+            for name, regions in p.imap_unordered(maskedContig, order):
+                masked[name] = regions
+            p.close()
+        finally:
+            p.terminate()
+            p.join()
+    finally:
+        SafeRemove(tmpdir)
+    softmaskedBed(masked, bedfile)
+    maskedSize = sum(x[1] - x[0] + 1 for v in masked.values() for x in v)
     GenomeLength = sum(ContigSizes.values())
-    percentMask = TotalMask.value / float(GenomeLength)
-    return ContigSizes, GenomeLength, TotalMask.value, percentMask
+    percentMask = maskedSize / float(GenomeLength)
+    return ContigSizes, GenomeLength, maskedSize, percentMask
 
 
 def RunGeneMarkES(command, input, ini, maxintron, softmask, cpus, tmpdir, output, fungus):
@@ -4923,7 +5397,7 @@ def zff2gff3(input, fasta, output):
                     if end > Genes[ID]['location'][1]:
                         Genes[ID]['location'] = (Genes[ID]['location'][0], end)
     #translate, check partial, etc
-    SeqRecords = SeqIO.to_dict(SeqIO.parse(fasta, 'fasta'))
+    SeqRecords = genomeStore(fasta)
     Filtered = {}
     for k,v in Genes.items():
         i = 0
@@ -5857,36 +6331,108 @@ def splitFASTA(input, outputdir):
             with open(outputfile, 'w') as output:
                 SeqIO.write(record, output, 'fasta')
 
+gapRun = re.compile('[Nn]+')
+
+class AssemblyStats(object):
+    '''
+    streaming assembly statistics, contigs are added one at a time and only their lengths and
+    running base counts are kept, so memory is O(number of contigs) rather than O(assembly size)
+    '''
+    def __init__(self, lengths=[]):
+        self.lengths = list(lengths)
+        self.gc = 0
+        self.n = 0
+        self.masked = 0
+        self.gaps = 0
+
+    def add(self, Seq):
+        self.lengths.append(len(Seq))
+        #same definition as Bio.SeqUtils.GC, ambiguous S counts as G/C
+        self.gc += sum(Seq.count(x) for x in 'GCSgcs')
+        self.n += Seq.count('N') + Seq.count('n')
+        self.masked += sum(m.end() - m.start() for m in softmaskRun.finditer(Seq))
+        self.gaps += sum(1 for m in gapRun.finditer(Seq))
+
+    def size(self):
+        return sum(self.lengths)
+
+    def count(self):
+        return len(self.lengths)
+
+    def largest(self):
+        return max(self.lengths) if self.lengths else 0
+
+    def average(self):
+        if not self.lengths:
+            return 0
+        return int(round(self.size() / len(self.lengths)))
+
+    def nx(self, x=50):
+        '''return (Nx, Lx), the length of the contig at which x% of the assembly is reached and the number of contigs to get there'''
+        total = self.size()
+        cumulative = 0
+        for i, length in enumerate(sorted(self.lengths, reverse=True)):
+            cumulative += length
+            if cumulative * 100 >= total * x:
+                return length, i+1
+        return 0, 0
+
+    def pctGC(self):
+        if not self.size():
+            return 0.0
+        return self.gc * 100.0 / self.size()
+
+    def pctMasked(self):
+        if not self.size():
+            return 0.0
+        return self.masked * 100.0 / self.size()
+
+    def summary(self):
+        N50, L50 = self.nx(50)
+        N90, L90 = self.nx(90)
+        return 'num scaffolds: {:,}\nassembly size: {:,} bp\nlargest scaffold: {:,} bp\naverage scaffold: {:,} bp\nN50: {:,} bp (L50 {:,})\nN90: {:,} bp (L90 {:,})\nGC content: {:.2f}%\nN bases: {:,} in {:,} gaps\nmasked: {:,} bp ({:.2f}%)'.format(
+            self.count(), self.size(), self.largest(), self.average(), N50, L50, N90, L90, self.pctGC(), self.n, self.gaps, self.masked, self.pctMasked())
+
+def assemblyStats(fasta):
+    '''
+    return AssemblyStats for a FASTA file, streaming one contig at a time
+    '''
+    from Bio.SeqIO.FastaIO import SimpleFastaParser
+    stats = AssemblyStats()
+    with open(fasta, 'rU') as input:
+        for header, Seq in SimpleFastaParser(input):
+            stats.add(Seq)
+    return stats
+
 def genomeStats(input):
-    from Bio.SeqUtils import GC
-    lengths = []
-    GeeCee = []
-    Genes = 0
-    tRNA = 0
-    Prots = 0
-    locus_tag = ''
-    organism = None
-    isolate = None
-    strain = None
-    uniqueIso = None
+    stats = AssemblyStats()
+    counts = {'Genes': 0, 'tRNA': 0, 'Prots': 0, 'locus_tag': '', 'organism': None, 'isolate': None, 'strain': None}
     with open(input, 'rU') as gbk:
         SeqRecords = SeqIO.parse(gbk, 'genbank')
         for record in SeqRecords:
-            lengths.append(len(record.seq))
-            GeeCee.append(str(record.seq))
-            organism = record.annotations['organism'].replace(' Unclassified.', '')
-            for f in record.features:
-                if f.type == "source":
-                    isolate = f.qualifiers.get("isolate", [None])[0]
-                    strain = f.qualifiers.get("strain", [None])[0]
-                if f.type == "CDS":
-                    Prots += 1
-                if f.type == "gene":
-                    Genes += 1
-                    if Genes == 1:
-                        locus_tag = f.qualifiers.get("locus_tag")[0].split('_')[0]
-                if f.type == "tRNA":
-                    tRNA += 1
+            _genomeStatsRecord(record, stats, counts)
+    return _genomeStatsSummary(stats, counts)
+
+def _genomeStatsRecord(record, stats, counts):
+    #add a single GenBank record to the running genomeStats counts
+    stats.add(str(record.seq))
+    counts['organism'] = record.annotations['organism'].replace(' Unclassified.', '')
+    for f in record.features:
+        if f.type == "source":
+            counts['isolate'] = f.qualifiers.get("isolate", [None])[0]
+            counts['strain'] = f.qualifiers.get("strain", [None])[0]
+        if f.type == "CDS":
+            counts['Prots'] += 1
+        if f.type == "gene":
+            counts['Genes'] += 1
+            if counts['Genes'] == 1:
+                counts['locus_tag'] = f.qualifiers.get("locus_tag")[0].split('_')[0]
+        if f.type == "tRNA":
+            counts['tRNA'] += 1
+
+def _genomeStatsSummary(stats, counts):
+    organism, strain, isolate = counts['organism'], counts['strain'], counts['isolate']
+    uniqueIso = None
     if strain:
         log.info("working on %s %s" % (organism, strain))
         uniqueIso = strain.replace(' ', '')
@@ -5895,36 +6441,17 @@ def genomeStats(input):
         uniqueIso = isolate.replace(' ', '')
     else:
         log.info("working on %s" % organism)
-    GenomeSize = sum(lengths)
-    LargestContig = max(lengths)
-    ContigNum = len(lengths)
-    AvgContig = int(round(GenomeSize / ContigNum))
-    pctGC = round(GC("".join(GeeCee)), 2)
-
-    #now get N50
-    lengths.sort()
-    nlist = []
-    for x in lengths:
-        nlist += [x]*x
-    if len(nlist) % 2 == 0:
-        medianpos = int(len(nlist) / 2)
-        N50 = int((nlist[medianpos] + nlist[medianpos-1]) / 2)
-    else:
-        medianpos = int(len(nlist) / 2)
-        N50 = int(nlist[medianpos])
+    GenomeSize = stats.size()
+    LargestContig = stats.largest()
+    ContigNum = stats.count()
+    AvgContig = stats.average()
+    pctGC = round(stats.pctGC(), 2)
+    N50 = stats.nx(50)[0]
     #return values in a list
-    return [organism, uniqueIso, locus_tag, "{0:,}".format(GenomeSize)+' bp', "{0:,}".format(LargestContig)+' bp', "{0:,}".format(AvgContig)+' bp', "{0:,}".format(ContigNum), "{0:,}".format(N50)+' bp', "{:.2f}".format(pctGC)+'%', "{0:,}".format(Genes), "{0:,}".format(Prots), "{0:,}".format(tRNA)]
+    return [organism, uniqueIso, counts['locus_tag'], "{0:,}".format(GenomeSize)+' bp', "{0:,}".format(LargestContig)+' bp', "{0:,}".format(AvgContig)+' bp', "{0:,}".format(ContigNum), "{0:,}".format(N50)+' bp', "{:.2f}".format(pctGC)+'%', "{0:,}".format(counts['Genes']), "{0:,}".format(counts['Prots']), "{0:,}".format(counts['tRNA'])]
 
 def MEROPS2dict(input):
-    dict = {}
-    with open(input, 'rU') as fasta:
-        for line in fasta:
-            if line.startswith('>'):
-                cols = line.split(' ')
-                ID = cols[0].replace('>', '')
-                family = cols[1].replace('\n', '')
-                dict[ID] = family
-    return dict
+    return dict(dbIndex(input).items())
 
 def getEggNogfromNote(input):
     dict = {}
@@ -5993,29 +6520,40 @@ def getSMBackbones(input):
     return dict
 
 def parseGOterms(input, folder, genome):
+    GOterms = []
+    with open(input, 'rU') as gbk:
+        SeqRecords = SeqIO.parse(gbk, 'genbank')
+        for record in SeqRecords:
+            for f in record.features:
+                _featureGOterms(f, GOterms)
+    writeGOterms(GOterms, folder, genome)
+
+def _featureGOterms(f, GOterms):
+    #append (locus_tag, [GO terms]) of a CDS feature to GOterms
+    if f.type == 'CDS':
+        try:
+            ID = f.qualifiers['locus_tag'][0]
+        except KeyError:
+            log.debug("%s has no locus_tag, skipping")
+            return
+        GOS = []
+        for k,v in f.qualifiers.items():
+            if k == 'note':
+                notes = v[0].split('; ')
+                for i in notes:
+                    if i.startswith('GO'):
+                        go_term = i.split(' ')[1]
+                        GOS.append(go_term)
+        if GOS:
+            GOterms.append((ID, GOS))
+
+def writeGOterms(GOterms, folder, genome):
+    #append to the GO associations file and write the genome population file for GO enrichment
     with open(os.path.join(folder, 'associations.txt'), 'a') as assoc:
         with open(os.path.join(folder, genome+'.txt'), 'w') as terms:
-            with open(input, 'rU') as gbk:
-                SeqRecords = SeqIO.parse(gbk, 'genbank')
-                for record in SeqRecords:
-                    for f in record.features:
-                        if f.type == 'CDS':
-                            try:
-                                ID = f.qualifiers['locus_tag'][0]
-                            except KeyError:
-                                log.debug("%s has no locus_tag, skipping")
-                                continue
-                            GOS = []
-                            for k,v in f.qualifiers.items():
-                                if k == 'note':
-                                    notes = v[0].split('; ')
-                                    for i in notes:
-                                        if i.startswith('GO'):
-                                            go_term = i.split(' ')[1]
-                                            GOS.append(go_term)
-                            if GOS:
-                                assoc.write("%s\t%s\n" % (ID, ";".join(GOS)))
-                                terms.write("%s\n" % ID)
+            for ID, GOS in GOterms:
+                assoc.write("%s\t%s\n" % (ID, ";".join(GOS)))
+                terms.write("%s\n" % ID)
 
 def getStatsfromDbxref(input, word):
     dict = {}
@@ -6047,100 +6585,94 @@ def getGBKannotation(input, Database):
     '''
     #convert merops on the fly, need database
     meropsDict = MEROPS2dict(os.path.join(Database, 'merops.formatted.fa'))
-    SMs = {'NRPS': 0, 'PKS': 0, 'Hybrid': 0}
-    pfams = {}
-    iprs = {}
-    nogs = {}
-    cogs = {}
-    merops = {}
-    cazys = {}
-    secreted = {}
-    membrane = {}
-    buscos = {}
-    secmet = {}
+    annotation = [{}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {'NRPS': 0, 'PKS': 0, 'Hybrid': 0}]
     with open(input, 'rU') as infile:
         for record in SeqIO.parse(infile, 'genbank'):
             for f in record.features:
-                locusTag,ID,Parent = (None,)*3
-                if f.type == 'CDS':
-                    locusTag,ID,Parent = getID(f, f.type)
-                    if not ID:
-                        continue
-                    product = f.qualifiers['product'][0]
-                    if product == "Hybrid PKS-NRPS":
-                        SMs['Hybrid'] += 1
-                    if product == "Nonribosomal Peptide Synthase (NRPS)":
-                        SMs['NRPS'] += 1
-                    if 'Polyketide synthase (PKS)' in product:
-                        SMs['PKS'] += 1
-                    for k,v in f.qualifiers.items():
-                        if k == 'db_xref':
-                            for i in v:
-                                if i.startswith('PFAM:'):
-                                    hit = i.replace('PFAM:', '')
-                                    if not hit in pfams:
-                                        pfams[hit] = [ID]
-                                    else:
-                                        pfams[hit].append(ID)
-                                elif i.startswith('InterPro:'):
-                                    hit = i.replace('InterPro:', '')
-                                    if not hit in iprs:
-                                        iprs[hit] = [ID]
-                                    else:
-                                        iprs[hit].append(ID)
-                        if k == 'note':
-                            notes = v[0].split('; ')
-                            for i in notes:
-                                if i.startswith('EggNog:'):
-                                    hit = i.replace('EggNog:', '')
-                                    if not ID in nogs:
-                                        nogs[ID] = hit
-                                elif i.startswith('BUSCO:'):
-                                    hit = i.replace('BUSCO:', '')
-                                    if not hit in buscos:
-                                        buscos[hit] = [ID]
-                                    else:
-                                        buscos[hit].append(ID)
-                                elif i.startswith('MEROPS:'): #change to family name
-                                    hit = i.replace('MEROPS:', '')
-                                    hit = meropsDict.get(hit)
-                                    if not hit in merops:
-                                        merops[hit] = [ID]
-                                    else:
-                                        merops[hit].append(ID)
-                                elif i.startswith('CAZy:'):
-                                    hit = i.replace('CAZy:', '')
-                                    if not hit in cazys:
-                                        cazys[hit] = [ID]
-                                    else:
-                                        cazys[hit].append(ID)
-                                elif i.startswith('COG:'):
-                                    hit = i.replace('COG:', '')
-                                    hits = hit.split(',')
-                                    for x in hits:
-                                        if not x in cogs:
-                                            cogs[x] = [ID]
-                                        else:
-                                            cogs[x].append(ID)
-                                elif i.startswith('SECRETED:'):
-                                    hit = i.replace('SECRETED:', '')
-                                    if not hit in secreted:
-                                        secreted[hit] = [ID]
-                                    else:
-                                        secreted[hit].append(ID)
-                                elif i.startswith('TransMembrane:'):
-                                    hit = i.replace('TransMembrane:', '')
-                                    if not hit in membrane:
-                                        membrane[hit] = [ID]
-                                    else:
-                                        membrane[hit].append(ID)
-                                elif i.startswith('antiSMASH:'):
-                                    hit = i.replace('antiSMASH:', '')
-                                    if not hit in secmet:
-                                        secmet[hit] = [ID]
-                                    else:
-                                        secmet[hit].append(ID)
-    return [pfams, iprs, nogs, buscos, merops, cazys, cogs, secreted, membrane, secmet, SMs]
+                _featureGBKannotation(f, meropsDict, annotation)
+    return annotation
+
+def _featureGBKannotation(f, meropsDict, annotation):
+    #add the functional annotation of a CDS feature to the getGBKannotation list of dictionaries
+    pfams, iprs, nogs, buscos, merops, cazys, cogs, secreted, membrane, secmet, SMs = annotation
+    if f.type == 'CDS':
+        locusTag,ID,Parent = getID(f, f.type)
+        if not ID:
+            return
+        product = f.qualifiers['product'][0]
+        if product == "Hybrid PKS-NRPS":
+            SMs['Hybrid'] += 1
+        if product == "Nonribosomal Peptide Synthase (NRPS)":
+            SMs['NRPS'] += 1
+        if 'Polyketide synthase (PKS)' in product:
+            SMs['PKS'] += 1
+        for k,v in f.qualifiers.items():
+            if k == 'db_xref':
+                for i in v:
+                    if i.startswith('PFAM:'):
+                        hit = i.replace('PFAM:', '')
+                        if not hit in pfams:
+                            pfams[hit] = [ID]
+                        else:
+                            pfams[hit].append(ID)
+                    elif i.startswith('InterPro:'):
+                        hit = i.replace('InterPro:', '')
+                        if not hit in iprs:
+                            iprs[hit] = [ID]
+                        else:
+                            iprs[hit].append(ID)
+            if k == 'note':
+                notes = v[0].split('; ')
+                for i in notes:
+                    if i.startswith('EggNog:'):
+                        hit = i.replace('EggNog:', '')
+                        if not ID in nogs:
+                            nogs[ID] = hit
+                    elif i.startswith('BUSCO:'):
+                        hit = i.replace('BUSCO:', '')
+                        if not hit in buscos:
+                            buscos[hit] = [ID]
+                        else:
+                            buscos[hit].append(ID)
+                    elif i.startswith('MEROPS:'): #change to family name
+                        hit = i.replace('MEROPS:', '')
+                        hit = meropsDict.get(hit)
+                        if not hit in merops:
+                            merops[hit] = [ID]
+                        else:
+                            merops[hit].append(ID)
+                    elif i.startswith('CAZy:'):
+                        hit = i.replace('CAZy:', '')
+                        if not hit in cazys:
+                            cazys[hit] = [ID]
+                        else:
+                            cazys[hit].append(ID)
+                    elif i.startswith('COG:'):
+                        hit = i.replace('COG:', '')
+                        hits = hit.split(',')
+                        for x in hits:
+                            if not x in cogs:
+                                cogs[x] = [ID]
+                            else:
+                                cogs[x].append(ID)
+                    elif i.startswith('SECRETED:'):
+                        hit = i.replace('SECRETED:', '')
+                        if not hit in secreted:
+                            secreted[hit] = [ID]
+                        else:
+                            secreted[hit].append(ID)
+                    elif i.startswith('TransMembrane:'):
+                        hit = i.replace('TransMembrane:', '')
+                        if not hit in membrane:
+                            membrane[hit] = [ID]
+                        else:
+                            membrane[hit].append(ID)
+                    elif i.startswith('antiSMASH:'):
+                        hit = i.replace('antiSMASH:', '')
+                        if not hit in secmet:
+                            secmet[hit] = [ID]
+                        else:
+                            secmet[hit].append(ID)
 
 def annotationtable(input, Database, output):
     '''
@@ -6306,15 +6838,19 @@ def convert2counts(input):
     return df
 
 def gb2proteinortho(input, folder, name):
-    gffOut = os.path.join(folder, name+'.gff')
-    FastaOut = os.path.join(folder, name+'.faa')
-    Transcripts = os.path.join(folder, name+'.transcripts.fa')
     genes = {}
     with open(input, 'rU') as gbk:
         for record in SeqIO.parse(gbk, 'genbank'):
+            recordSeq = str(record.seq)
             for f in record.features:
-                gb_feature_add2dict(f, record, genes)
-    #now output the files you need
+                gb_feature_add2dict(f, record, genes, recordSeq)
+    writeProteinortho(genes, folder, name)
+
+def writeProteinortho(genes, folder, name):
+    #write the proteinortho gff/protein/transcript inputs from a funannotate gene dictionary
+    gffOut = os.path.join(folder, name+'.gff')
+    FastaOut = os.path.join(folder, name+'.faa')
+    Transcripts = os.path.join(folder, name+'.transcripts.fa')
     with open(gffOut, 'w') as gff:
         with open(FastaOut, 'w') as fasta:
             with open(Transcripts, 'w') as transcripts:
@@ -6326,6 +6862,29 @@ def gb2proteinortho(input, folder, name):
                             fasta.write(">%s %s\n%s\n" % (item, k, v['protein'][i]))
                             gff.write("{:}\t{:}\tCDS\t{:}\t{:}\t.\t{:}\t.\tID={:};Parent={:};product={:};\n".format(v['contig'], v['source'], v['location'][0], v['location'][1], v['strand'], item, k, v['product'][i]))
 
+def compareGBK(input, Database, folder, name):
+    '''
+    single pass over a GenBank file collecting everything funannotate compare needs from it: returns the
+    genomeStats list, the getGBKannotation list of dictionaries and the parseGOterms (locus_tag, [GO terms])
+    list, and writes the gb2proteinortho inputs to folder as name.gff/.faa/.transcripts.fa
+    '''
+    meropsDict = MEROPS2dict(os.path.join(Database, 'merops.formatted.fa'))
+    stats = AssemblyStats()
+    counts = {'Genes': 0, 'tRNA': 0, 'Prots': 0, 'locus_tag': '', 'organism': None, 'isolate': None, 'strain': None}
+    annotation = [{}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {'NRPS': 0, 'PKS': 0, 'Hybrid': 0}]
+    GOterms = []
+    genes = {}
+    with open(input, 'rU') as gbk:
+        for record in SeqIO.parse(gbk, 'genbank'):
+            recordSeq = str(record.seq)
+            _genomeStatsRecord(record, stats, counts)
+            for f in record.features:
+                _featureGBKannotation(f, meropsDict, annotation)
+                _featureGOterms(f, GOterms)
+                gb_feature_add2dict(f, record, genes, recordSeq)
+    writeProteinortho(genes, folder, name)
+    return _genomeStatsSummary(stats, counts), annotation, GOterms
+
 def drawStackedBar(panda, type, labels, ymax, output, colors=False):
     with warnings.catch_warnings():
         warnings.simplefilter('ignore')
@@ -6514,10 +7073,14 @@ def distance2mds(df, distance, type, output):
     fig.savefig(output, format='pdf', dpi=1000, bbox_inches='tight')
     plt.close(fig)
 
-def ReciprocalBlast(filelist, protortho, cpus):
+def ReciprocalBlast(filelist, protortho, cpus, combined=True):
     '''
-    function to run reciprocal diamond blast for generating proteinortho input
+    function to run reciprocal diamond blast for generating proteinortho input, by default all proteomes are
+    searched in a single all-vs-all run (see AllvsAllBlast), combined=False runs diamond for each pair
     '''
+    if combined:
+        AllvsAllBlast(filelist, protortho, cpus)
+        return
     #generate dmnd databases for each input
     for x in filelist:
         base = os.path.basename(x)
@@ -6548,6 +7111,72 @@ def ReciprocalBlast(filelist, protortho, cpus):
         if not checkannotations(os.path.join(protortho, outname)):
             runSubprocess(cmd, protortho, log)
 
+def AllvsAllBlast(filelist, protortho, cpus, evalue=1e-5, max_target_seqs=25):
+    '''
+    build a single diamond database from all proteomes with IDs tagged by proteome, run one all-vs-all
+    blastp and split the hits into the target.vs.query.bla files proteinortho expects. To approximate separate
+    per-pair searches, e-values are rescaled to the size of the target proteome before applying the cutoff,
+    and the search itself has no target limit so at most max_target_seqs hits per query for each target
+    proteome are kept while splitting (a limit on the combined search would let a large paralog family in
+    one proteome crowd out the hits to the others)
+    '''
+    from Bio.SeqIO.FastaIO import SimpleFastaParser
+    expected = [t+'.vs.'+q+'.bla' for q in filelist for t in filelist]
+    if all(checkannotations(os.path.join(protortho, x)) for x in expected):
+        return
+    #write combined proteome, IDs are index|ID so hits can be traced back to their proteome
+    combinedFA = os.path.join(protortho, 'all-vs-all.faa')
+    letters = []
+    with open(combinedFA, 'w') as output:
+        for i, x in enumerate(filelist):
+            total = 0
+            with open(os.path.join(protortho, x), 'rU') as infile:
+                for header, Seq in SimpleFastaParser(infile):
+                    output.write('>{:}|{:}\n{:}\n'.format(i, header.split(' ')[0], Seq))
+                    total += len(Seq)
+            letters.append(total)
+    allLetters = sum(letters)
+    scale = [x / float(allLetters) for x in letters]
+    #loosen the cutoff for the combined search so no hit that passes for the smallest proteome is lost
+    searchEvalue = evalue / min(x for x in scale if x > 0)
+    runSubprocess(['diamond', 'makedb', '--in', 'all-vs-all.faa', '--db', 'all-vs-all.dmnd'], protortho, log)
+    hits = os.path.join(protortho, 'all-vs-all.bla')
+    cmd = ['diamond', 'blastp', '--query', 'all-vs-all.faa', '--db', 'all-vs-all.dmnd', '--outfmt', '6', '--out', 'all-vs-all.bla', '--evalue', str(searchEvalue), '--more-sensitive', '--max-target-seqs', '0', '--threads', str(cpus)]
+    runSubprocess(cmd, protortho, log)
+    #demultiplex, hits for each query are contiguous so only the files for the current query proteome are open
+    for x in expected:
+        open(os.path.join(protortho, x), 'w').close()
+    handles = {}
+    currentQuery = None
+    counts = defaultdict(int)
+    with open(hits, 'rU') as infile:
+        for line in infile:
+            cols = line.rstrip('\n').split('\t')
+            q, qID = cols[0].split('|', 1)
+            t, tID = cols[1].split('|', 1)
+            q, t = int(q), int(t)
+            if cols[0] != currentQuery:
+                currentQuery = cols[0]
+                counts = defaultdict(int)
+            if counts[t] >= max_target_seqs:
+                continue
+            pairEvalue = float(cols[10]) * scale[t]
+            if pairEvalue > evalue:
+                continue
+            counts[t] += 1
+            if not (q, t) in handles:
+                if handles and list(handles.keys())[0][0] != q:
+                    for h in handles.values():
+                        h.close()
+                    handles = {}
+                handles[(q, t)] = open(os.path.join(protortho, filelist[t]+'.vs.'+filelist[q]+'.bla'), 'a')
+            cols[0], cols[1], cols[10] = qID, tID, '{:.2e}'.format(pairEvalue)
+            handles[(q, t)].write('\t'.join(cols)+'\n')
+    for h in handles.values():
+        h.close()
+    for x in [combinedFA, hits, os.path.join(protortho, 'all-vs-all.dmnd')]:
+        SafeRemove(x)
+
 
 def singletons(poff, name):
     with open(poff, 'rU') as input:
@@ -6579,34 +7208,166 @@ def orthologs(poff, name):
                 count += 1
         return count
 
-def iprxml2dict(xmlfile, terms):
+class DBIndex(object):
+    '''
+    key/value lookup table for a funannotate database source file (see DBINDEX). The parsed records are
+    kept in a hidden sqlite file next to the source (.name.idx), built by funannotate setup or on first use,
+    and rebuilt automatically when the source file changes (size/mtime), so lookups do not need to re-read
+    the source. If the database folder is not writable the table is built in memory for this run.
+    '''
+    def __init__(self, source, parser):
+        import sqlite3
+        self.source = os.path.abspath(source)
+        self.index = os.path.join(os.path.dirname(self.source), '.'+os.path.basename(self.source)+'.idx')
+        st = os.stat(self.source)
+        key = '{:}:{:}'.format(st.st_size, st.st_mtime)
+        self.db = None
+        if os.path.isfile(self.index):
+            try:
+                self.db = sqlite3.connect(self.index)
+                self.db.text_factory = str
+                if self.db.execute('SELECT value FROM meta WHERE key=?', ('source',)).fetchone() != (key,):
+                    self.db.close()
+                    self.db = None
+            except sqlite3.Error:
+                self.db = None
+        if not self.db:
+            tmpout = self.index+'.'+str(os.getpid())
+            try:
+                self.db = self._build(sqlite3.connect(tmpout), parser, key)
+                self.db.close()
+                os.rename(tmpout, self.index)
+                self.db = sqlite3.connect(self.index)
+            except (IOError, OSError, sqlite3.OperationalError):
+                SafeRemove(tmpout)
+                self.db = self._build(sqlite3.connect(':memory:'), parser, key)
+            self.db.text_factory = str
+
+    def _build(self, db, parser, key):
+        db.text_factory = str
+        db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        db.execute('CREATE TABLE lookup (key TEXT PRIMARY KEY, value TEXT)')
+        db.executemany('INSERT OR REPLACE INTO lookup VALUES (?,?)', parser(self.source))
+        db.execute('INSERT INTO meta VALUES (?,?)', ('source', key))
+        db.commit()
+        return db
+
+    def get(self, key, default=None):
+        result = self.db.execute('SELECT value FROM lookup WHERE key=?', (key,)).fetchone()
+        if result is None:
+            return default
+        return result[0]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        result = self.get(key)
+        if result is None:
+            raise KeyError(key)
+        return result
+
+    def lookup(self, keys):
+        '''return dictionary of key: value for the keys found'''
+        keys = list(keys)
+        results = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            query = 'SELECT key, value FROM lookup WHERE key IN ({:})'.format(','.join(['?']*len(chunk)))
+            results.update(self.db.execute(query, chunk))
+        return results
+
+    def items(self):
+        return self.db.execute('SELECT key, value FROM lookup')
+
+def _iprxmlRecords(xmlfile):
+    #yield (InterPro ID, name) from interpro.xml
     import xml.etree.cElementTree as cElementTree
-    iprDict = {}
     for event, elem in cElementTree.iterparse(xmlfile):
         if elem.tag == 'interpro':
             ID = elem.attrib['id']
-            if ID in terms:
-                for x in elem.getchildren():
-                    if x.tag == 'name':
-                        description = x.text
-                iprDict[ID] = description
-                elem.clear()
-            else:
-                elem.clear()
-    return iprDict
-
-
-def pfam2dict(file):
-    pfamDict = {}
+            description = None
+            for x in elem.getchildren():
+                if x.tag == 'name':
+                    description = x.text
+            elem.clear()
+            if description:
+                yield ID, description.encode('utf-8')
+
+def _pfamRecords(file):
+    #yield (PFAM ID, description) from Pfam-A.clans.tsv
     with open(file, 'rU') as input:
         for line in input:
             if line.startswith('PF'): #just check to be sure
                 line = line.replace('\n', '')
                 cols = line.split('\t')
-                ID = cols[0]
-                desc = cols[4]
-                pfamDict[ID] = desc
-    return pfamDict
+                yield cols[0], cols[4]
+
+def _meropsRecords(file):
+    #yield (MEROPS ID, family) from the merops.formatted.fa headers
+    with open(file, 'rU') as fasta:
+        for line in fasta:
+            if line.startswith('>'):
+                cols = line.split(' ')
+                yield cols[0].replace('>', ''), cols[1].replace('\n', '')
+
+def _goRecords(file):
+    #yield (GO ID, name<tab>namespace) for each term and its alt_ids in go.obo
+    def _term(IDs, name, namespace):
+        for ID in IDs:
+            yield ID, name+'\t'+namespace
+    IDs, name, namespace, inTerm = [], '', '', False
+    with open(file, 'rU') as obo:
+        for line in obo:
+            line = line.rstrip()
+            if line.startswith('['):
+                if inTerm and IDs:
+                    for x in _term(IDs, name, namespace):
+                        yield x
+                IDs, name, namespace, inTerm = [], '', '', line == '[Term]'
+            elif inTerm:
+                if line.startswith('id: ') or line.startswith('alt_id: '):
+                    IDs.append(line.split(': ', 1)[1])
+                elif line.startswith('name: '):
+                    name = line.split(': ', 1)[1]
+                elif line.startswith('namespace: '):
+                    namespace = line.split(': ', 1)[1]
+    if inTerm and IDs:
+        for x in _term(IDs, name, namespace):
+            yield x
+
+def _curatedRecords(file):
+    #yield (name, product) from ncbi_cleaned_gene_products.txt, first entry of a name wins, and
+    #(tab + lower case name, name) for case-folded lookups, an all lower case curated name wins
+    names = {}
+    folded = {}
+    with open(file, 'rU') as input:
+        for line in input:
+            line = line.strip()
+            if line.startswith('#'):
+                continue
+            ID, product = line.split('\t')
+            if not ID in names:
+                names[ID] = product
+            if not ID.lower() in folded or ID == ID.lower():
+                folded[ID.lower()] = ID
+    for x in names.iteritems():
+        yield x
+    for k, v in folded.iteritems():
+        yield '\t'+k, v
+
+DBINDEX = {'interpro.xml': _iprxmlRecords, 'ncbi_cleaned_gene_products.txt': _curatedRecords, 'Pfam-A.clans.tsv': _pfamRecords, 'merops.formatted.fa': _meropsRecords, 'go.obo': _goRecords}
+
+def dbIndex(file):
+    '''return the DBIndex lookup table of a database source file, building it if missing or out of date'''
+    return DBIndex(file, DBINDEX[os.path.basename(file)])
+
+def iprxml2dict(xmlfile, terms):
+    return dbIndex(xmlfile).lookup(terms)
+
+
+def pfam2dict(file):
+    return dict(dbIndex(file).items())
 
 def flipKeyValues(input):
     flipped = {}
@@ -6693,16 +7454,181 @@ def download_buscos(name, Database):
         sys.exit(1)
 
 def fasta2dict(Fasta):
+    from Bio.SeqIO.FastaIO import SimpleFastaParser
     answer = dict()
     with open(Fasta, 'rU') as gbk:
-        SeqRecords = SeqIO.parse(gbk, 'fasta')
-        for record in SeqRecords:
-            if record.id in answer:
+        for title, seq in SimpleFastaParser(gbk):
+            ID = title.split(None, 1)[0] if title else ''
+            if ID in answer:
                 print("WARNING - duplicate key!")
             else:
-                answer[record.id] = str(record.seq)
+                answer[ID] = seq
     return answer
 
+def faidx(fasta, output):
+    '''
+    build a samtools style faidx index (name, length, offset, linebases, linewidth) for
+    a multi-fasta file in a single pass, raise ValueError if a record has ragged lines
+    as the offsets can't be computed from the line width in that case
+    '''
+    #write to a temporary file and rename, so a partially written index is never read
+    tmpout = output+'.'+str(os.getpid())+'.tmp'
+    with open(tmpout, 'w') as out:
+        with open(fasta, 'rb') as infile:
+            name = None
+            offset = 0
+            for line in infile:
+                offset += len(line)
+                if line.startswith('>'):
+                    if name:
+                        out.write('%s\t%i\t%i\t%i\t%i\n' % (name, length, seqstart, linebases, linewidth))
+                    name = line[1:].strip().split()[0]
+                    seqstart = offset
+                    length = 0
+                    linebases = 0
+                    linewidth = 0
+                    short = False
+                    continue
+                if name is None:
+                    continue
+                bases = len(line.rstrip('\r\n'))
+                if bases == 0:
+                    if linebases == 0:
+                        seqstart = offset
+                    else:
+                        short = True
+                    continue
+                if linebases == 0:
+                    linebases = bases
+                    linewidth = len(line)
+                elif short or bases > linebases:
+                    out.close()
+                    os.remove(tmpout)
+                    raise ValueError('%s has lines of unequal length, can not be indexed' % name)
+                #only the last line of a record is allowed to be shorter
+                if bases < linebases or len(line) != linewidth:
+                    short = True
+                length += bases
+            if name:
+                out.write('%s\t%i\t%i\t%i\t%i\n' % (name, length, seqstart, linebases, linewidth))
+    os.rename(tmpout, output)
+
+class FastaIndex(object):
+    '''
+    Random access to a multi-fasta file using a faidx style offset index and a read-only
+    memory map, so sub-regions can be sliced without parsing the whole file. The index is
+    (re)built if missing or older than the fasta file. The memory map is opened lazily in
+    each process so the object can be created before forking a multiprocessing pool.
+    '''
+    def __init__(self, fasta, index=None):
+        self.fasta = os.path.abspath(fasta)
+        if not index:
+            index = self.fasta+'.fai'
+        if not os.path.isfile(index) or os.path.getmtime(index) < os.path.getmtime(self.fasta):
+            faidx(self.fasta, index)
+        self.index = {}
+        self.names = []
+        with open(index, 'rU') as infile:
+            for line in infile:
+                cols = line.rstrip().split('\t')
+                self.index[cols[0]] = (int(cols[1]), int(cols[2]), int(cols[3]), int(cols[4]))
+                self.names.append(cols[0])
+        self._pid = None
+        self._handle = None
+        self._mmap = None
+
+    def _open(self):
+        import mmap
+        if self._pid != os.getpid():
+            self._handle = open(self.fasta, 'rb')
+            self._mmap = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._pid = os.getpid()
+        return self._mmap
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+            self._handle.close()
+        self._pid = None
+        self._handle = None
+        self._mmap = None
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def length(self, name):
+        return self.index[name][0]
+
+    def lengths(self):
+        return dict((k, v[0]) for k,v in self.index.items())
+
+    def fetch(self, name, start=0, end=None):
+        '''
+        return sequence of name[start:end], ie 0-based half-open coordinates that behave
+        exactly like slicing the sequence string, including clipping at the contig ends
+        '''
+        length, offset, linebases, linewidth = self.index[name]
+        start, end, stride = slice(start, end).indices(length)
+        if end <= start:
+            return ''
+        byte_start = offset + (start // linebases) * linewidth + start % linebases
+        byte_end = offset + ((end-1) // linebases) * linewidth + (end-1) % linebases + 1
+        region = self._open()[byte_start:byte_end]
+        return region.replace('\n', '').replace('\r', '')
+
+def indexFasta(fasta, folder):
+    '''
+    FastaIndex of fasta with the index written to folder/genome.fai; a fasta with ragged lines can't
+    be indexed, so in that case a wrapped copy is written to folder/genome.fa and indexed instead
+    '''
+    index = os.path.join(folder, 'genome.fai')
+    try:
+        return FastaIndex(fasta, index=index)
+    except ValueError:
+        from Bio.SeqIO.FastaIO import SimpleFastaParser
+        flat = os.path.join(folder, 'genome.fa')
+        with open(flat, 'w') as output:
+            with open(fasta, 'rU') as input:
+                for header, Sequence in SimpleFastaParser(input):
+                    output.write('>%s\n%s\n' % (header.split()[0], softwrap(Sequence)))
+        return FastaIndex(flat, index=index)
+
+GENOMES = {}
+GENOMEDIR = None
+
+def genomeStore(fasta):
+    '''
+    indexed, memory-mapped genome shared by everything in a run that pulls sequence out of the same fasta
+    (gff2dict, tbl2dict, etc), in place of loading every scaffold into a dictionary. Made once per process,
+    workers forked afterwards reuse it (each opens its own map). Index files go in a temp folder that is
+    removed when the process exits, nothing is written next to the fasta.
+    '''
+    global GENOMEDIR
+    import tempfile, atexit
+    fasta = os.path.realpath(fasta)
+    st = os.stat(fasta)
+    key = (fasta, st.st_size, st.st_mtime)
+    if key in GENOMES:
+        return GENOMES[key]
+    if not GENOMEDIR:
+        GENOMEDIR = tempfile.mkdtemp(prefix='genome_')
+        atexit.register(_removeGenomeStore, os.getpid())
+    folder = os.path.join(GENOMEDIR, hashlib.sha1(repr(key)).hexdigest())
+    os.makedirs(folder)
+    GENOMES[key] = indexFasta(fasta, folder)
+    return GENOMES[key]
+
+def _removeGenomeStore(pid):
+    #only the process that made the folder removes it
+    if pid != os.getpid() or not GENOMEDIR:
+        return
+    for store in GENOMES.values():
+        store.close()
+    SafeRemove(GENOMEDIR)
+
 def ortho2phylogeny(folder, df, num, dict, cpus, bootstrap, tmpdir, outgroup, sp_file, name, sc_buscos, ml_method):
     import random, pylab
     from Bio import Phylo
@@ -6987,20 +7913,98 @@ def trainAugustus(AUGUSTUS_BASE, train_species, trainingset, genome, outdir, cpu
 def sortList(input, col):
     return natsorted(input, key=operator.itemgetter(col))
 
-def sortHints(input, output):
+def sortHints(input, output, join=False, chunk=2000000):
+    '''
+    sort Augustus hints file by contig, feature, end, start with natural sort of contig and feature,
+    same as sort -n -k 4,4 | sort -s -n -k 5,5 | sort -s -n -k 3,3 | sort -s -k 1,1
+    lines are sorted in chunks on a precomputed key and written to temporary runs, which are then
+    merged, so memory use is set by chunk size rather than file size. join=True collapses identical
+    intron hints into one line summing mult= (as join_mult_hints.pl does)
+    '''
+    import heapq, tempfile
+    from natsort import natsort_keygen
+    natkey = natsort_keygen()
+    names = {}
+    def _key(line):
+        cols = line.split('\t', 5)
+        if not cols[0] in names:
+            names[cols[0]] = natkey(cols[0])
+        if not cols[2] in names:
+            names[cols[2]] = natkey(cols[2])
+        return (names[cols[0]], names[cols[2]], int(cols[4]), int(cols[3]))
+    def _run(file, i):
+        with open(file, 'rU') as infile:
+            for line in infile:
+                line = line.rstrip('\n')
+                yield _key(line), i, line
+    folder = os.path.dirname(os.path.abspath(output))
+    runs = []
     data = []
-    with open(input, 'rU') as infile:
-        for line in infile:
-            line = line.rstrip()
-            data.append(line.split('\t'))
-    #replicate this: sort -n -k 4,4 | sort -s -n -k 5,5 | sort -s -n -k 3,3 | sort -s -k 1,1
-    sort1 = sortList(data, 3)
-    sort2 = sortList(sort1, 4)
-    sort3 = sortList(sort2, 2)
-    sort4 = sortList(sort3, 0)
-    with open(output, 'w') as sort_out:
-        for line in sort4:
-            sort_out.write('%s\n' % '\t'.join(line))
+    try:
+        with open(input, 'rU') as infile:
+            for line in infile:
+                line = line.rstrip()
+                if not line:
+                    continue
+                data.append(line)
+                if len(data) >= chunk:
+                    data.sort(key=_key)
+                    fd, tmp = tempfile.mkstemp(prefix='.hints.', dir=folder)
+                    runs.append(tmp)
+                    with os.fdopen(fd, 'w') as runout:
+                        runout.write('\n'.join(data)+'\n')
+                    data = []
+        data.sort(key=_key)
+        merged = ((_key(x), len(runs), x) for x in data)
+        if runs:
+            merged = heapq.merge(*[_run(x, i) for i, x in enumerate(runs)]+[merged])
+        with open(output, 'w') as sort_out:
+            if join:
+                for line in joinHints(x[2] for x in merged):
+                    sort_out.write('%s\n' % line)
+            else:
+                for key, i, line in merged:
+                    sort_out.write('%s\n' % line)
+    finally:
+        for x in runs:
+            SafeRemove(x)
+
+def joinHints(lines):
+    '''
+    takes sorted hints lines and yields them back with identical intron hints (only differing by mult=)
+    collapsed into the first one, with mult= set to their sum
+    '''
+    def _collapse(group):
+        if len(group) == 1:
+            return [group[0][1]]
+        joined = OrderedDict()
+        for cols, line in group:
+            attributes = cols[8] if len(cols) > 8 else ''
+            mult = re.search(r'mult=(\d+)', attributes)
+            rest = re.sub(r'mult=\d+;?', '', attributes)
+            ident = tuple(cols[1:3]+cols[5:8]+[rest])
+            if not ident in joined:
+                joined[ident] = [cols, rest, 0]
+            joined[ident][2] += int(mult.group(1)) if mult else 1
+        result = []
+        for cols, rest, total in joined.values():
+            if total > 1:
+                rest = 'mult=%i;%s' % (total, rest)
+            result.append('\t'.join(cols[:8]+[rest]))
+        return result
+    group = []
+    for line in lines:
+        cols = line.split('\t')
+        if group and (cols[2] != 'intron' or group[0][0][0] != cols[0] or group[0][0][3:5] != cols[3:5]):
+            for x in _collapse(group):
+                yield x
+            group = []
+        if cols[2] == 'intron':
+            group.append((cols, line))
+        else:
+            yield line
+    for x in _collapse(group):
+        yield x
 
 def checkgoatools(input):
     with open(input, 'rU') as goatools:
@@ -107,6 +107,9 @@ Github:     http://github.com/JohnLonginotto/pybam
 [ Force Internal bgzip Decompressor ]
   my_bam = pybam.read('/my/data.bam',decompressor='internal')
 
+[ Parallel bgzip Decompression (BAM file path or file object only) ]
+  my_bam = pybam.read('/my/data.bam',threads=8)
+
 [ Parse Words (hah) ]'''
 wat += '\n'+''.join([('\n===============================================================================================\n\n  ' if code is 'file_alignments_read' or code is 'sam' else '  ')+(code+' ').ljust(25,'-')+description+'\n' for code,description in sorted(parse_codes.items())]) + '\n'
 
@@ -137,11 +140,14 @@ class read:
     [ Force Internal bgzip Decompressor ]
     my_bam = pybam.read('/my/data.bam',decompressor='internal')
 
+    [ Parallel bgzip Decompression (BAM file path or file object only) ]
+    my_bam = pybam.read('/my/data.bam',threads=8)
+
     "print pybam.wat" in the python terminal to see the possible parsable values,
     or visit http://github.com/JohnLonginotto/pybam for the latest info.
     '''
 
-    def __init__(self,f,fields=False,decompressor=False):
+    def __init__(self,f,fields=False,decompressor=False,threads=1):
         self.file_bytes_read         = 0
         self.file_chromosomes        = []
         self.file_alignments_read    = 0
@@ -196,8 +202,18 @@ class read:
                 raise StopIteration
 
             elif magic == "\x1f\x8b\x08\x04":  # The user has passed us compressed gzip/bgzip data, which is typical for a BAM file
+                # inflate blocks in parallel if asked to and the input is a regular file we can memory map:
+                if threads > 1 and decompressor is False and os.path.isfile(self._file.name):
+                    self.file_decompressor = 'parallel'
+                    for data, compressed in parallel_inflate(self._file, threads):
+                        self.file_bytes_read += compressed
+                        yield data
+                    self._file.close()
+                    DEVNULL.close()
+                    raise StopIteration
+
                 # use custom decompressor if provided:
-                if decompressor is not False and decompressor is not 'internal':
+                elif decompressor is not False and decompressor is not 'internal':
                     if type(f) is str: self._subprocess = subprocess.Popen(                                    decompressor.replace('{}',f),    shell=True, stdout=subprocess.PIPE, stderr=DEVNULL)
                     else:              self._subprocess = subprocess.Popen('{ printf "'+magic+'"; cat; } | ' + decompressor, stdin=self._file, shell=True, stdout=subprocess.PIPE, stderr=DEVNULL)
                     self.file_decompressor = decompressor
@@ -694,7 +710,10 @@ class read:
         return result
     @property
     def sam_tags_string(self):
-        return '\t'.join(A + ':' + ('i' if B in 'cCsSI' else B)  + ':' + ((C.typecode + ',' + ','.join(map(str,C))) if type(C)==array else str(C)) for A,B,C in self.sam_tags_list)    
+        return '\t'.join(A + ':' + ('i' if B in 'cCsSI' else B)  + ':' + ((C.typecode + ',' + ','.join(map(str,C))) if type(C)==array else str(C)) for A,B,C in self.sam_tags_list)
+    def get_tags(self, names):
+        ## Lazy tag lookup - returns a dictionary of only the requested tags (i.e. ['cs','NM']), other tags are skipped over without being decoded.
+        return get_tags(self.bam, self._end_of_qual, names)
 
     ## BONUS methods - methods that mimic how samtools works.
     @property
@@ -732,9 +751,75 @@ class read:
     def _end_of_qual(self):      return self._end_of_seq       + self.sam_l_seq            # qual has the same length as seq
 
     def __del__(self):
-        if self._subprocess.returncode is None: self._subprocess.kill()
+        if hasattr(self,'_subprocess') and self._subprocess.returncode is None: self._subprocess.kill()
         self._file.close()
 
 
+def bgzf_blocks(data, start=0):
+    ## Scan the BGZF block boundaries of data (a string or memory map) from start, using the BSIZE stored in the BC extra
+    ## subfield of each block header. Yields (start, end) of the raw deflate data of each block, and the size of the block.
+    end = len(data)
+    while start < end:
+        if data[start:start+4] != "\x1f\x8b\x08\x04": raise PybamError('\n\nThe input file is not in a format I understand. First four bytes: ' + repr(data[start:start+4]) + '\n')
+        xlen = unpack("<H", data[start+10:start+12])[0]
+        block_size = None
+        p = start + 12
+        while p < start + 12 + xlen:
+            subfield_len = unpack("<H", data[p+2:p+4])[0]
+            if data[p:p+2] == 'BC': block_size = unpack("<H", data[p+4:p+6])[0] + 1
+            p += 4 + subfield_len
+        if block_size is None: raise PybamError('\n\nThe input file is gzip but not BGZF compressed, no BC subfield in block at byte ' + str(start) + '\n')
+        yield start + 12 + xlen, start + block_size - 8, block_size
+        start += block_size
+
+def parallel_inflate(f, threads, blocks_per_thread=32):
+    ## Inflate the BGZF blocks of a regular file with a pool of threads - zlib releases the GIL while it inflates, so this
+    ## scales with cores. Block boundaries are read from a memory map of the file, and batches of blocks are inflated while
+    ## the previous batch is being consumed. Yields (decompressed data, compressed bytes) in file order.
+    import mmap
+    from multiprocessing.pool import ThreadPool
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    pool = ThreadPool(threads)
+    def inflate(block): return zlib.decompress(data[block[0]:block[1]],-15)
+    try:
+        pending = None
+        batch = []
+        for block in bgzf_blocks(data):
+            batch.append(block)
+            if len(batch) == threads*blocks_per_thread:
+                job = (pool.map_async(inflate, batch), sum(x[2] for x in batch))
+                if pending is not None: yield ''.join(pending[0].get()), pending[1]
+                pending = job
+                batch = []
+        if pending is not None: yield ''.join(pending[0].get()), pending[1]
+        if batch: yield ''.join(pool.map(inflate, batch)), sum(x[2] for x in batch)
+    finally:
+        pool.close()
+        pool.join()
+        data.close()
+
+def get_tags(bam, offset, names):
+    ## Walk the tags of a raw alignment from offset (the end of the qual field), only decoding the ones in names and
+    ## stopping as soon as they have all been found. Integer types are returned as int, Z/H as str, B as an array.
+    result = {}
+    wanted = len(names)
+    end = len(bam)
+    while offset < end and len(result) < wanted:
+        tag_name = bam[offset:offset+2]
+        tag_type = bam[offset+2]
+        if tag_type == 'Z' or tag_type == 'H':
+            offset_end = bam.index('\x00',offset+3)+1
+            if tag_name in names: result[tag_name] = bam[offset+3:offset_end-1]
+        elif tag_type in CtoPy:
+            offset_end = offset+3+py4py[tag_type]
+            if tag_name in names: result[tag_name] = unpack(CtoPy[tag_type],bam[offset+3:offset_end])[0]
+        elif tag_type == 'B':
+            offset_end = offset+8+(unpack('<i',bam[offset+4:offset+8])[0]*py4py[bam[offset+3]])
+            if tag_name in names: result[tag_name] = array(bam[offset+3] , bam[offset+8:offset_end] )
+        else:
+            raise PybamError('\n\nI dont know how to parse BAM tags in this format: ' + repr(tag_type) + '\n')
+        offset = offset_end
+    return result
+
 class PybamWarn(Exception): pass
 class PybamError(Exception): pass
\ No newline at end of file
@@ -16,8 +16,9 @@ parser = argparse.ArgumentParser(prog='bam2gff3.py',
     formatter_class = MyFormatter)
 parser.add_argument('-i', '--bam', required=True, help='input BAM')
 parser.add_argument('-o', '--output', required=True, help='Output GFF3')
+parser.add_argument('--cpus', default=1, type=int, help='Number of CPUs')
 args=parser.parse_args()
 
 #convert BAM to gff3
-lib.bam2gff3(args.bam, args.output)
+lib.bam2gff3(args.bam, args.output, cpus=args.cpus)
 
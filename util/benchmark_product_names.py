@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import sys, argparse, os, inspect, re, random, time
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+import lib.library as lib
+
+#setup menu with argparse
+parser = argparse.ArgumentParser(prog='benchmark_product_names.py',
+    description = '''Script to time gene name/product cleanup with lib.ProductNames against the old per-gene loop.''',
+    epilog = """Written by Jon Palmer (2018) nextgenusfs@gmail.com""")
+parser.add_argument('-c', '--curated', required=True, help='Curated gene products file, ie ncbi_cleaned_gene_products.txt')
+parser.add_argument('-i', '--input', help='Names to test, tab delimited name and product (ie from UniProt)')
+parser.add_argument('-n', '--num', default=100000, type=int, help='Number of genes to simulate if no --input')
+args=parser.parse_args()
+
+def oldLoop(genes, curatedFile):
+    #the gene name/product cleanup as it was done in funannotate-functional
+    CuratedNames = {}
+    with open(curatedFile, 'rU') as input:
+        for line in input:
+            line = line.strip()
+            if line.startswith('#'):
+                continue
+            ID, product = line.split('\t')
+            if not ID in CuratedNames:
+                CuratedNames[ID] = product
+    result = []
+    thenots = []
+    for name, product in genes:
+        GeneName, GeneProduct = None, None
+        if name in CuratedNames:
+            GeneName, GeneProduct = name, CuratedNames.get(name)
+        elif name.lower() in CuratedNames:
+            GeneName, GeneProduct = name, CuratedNames.get(name.lower())
+        if not GeneName:
+            GeneName, GeneProduct = name, product
+            thenots.append(GeneName)
+        rep = dict(lib.ProductNames.replace)
+        rep = dict((re.escape(k), v) for k, v in rep.iteritems())
+        pattern = re.compile("|".join(rep.keys()))
+        GeneProduct = pattern.sub(lambda m: rep[re.escape(m.group(0))], GeneProduct)
+        GeneProduct = ' '.join(GeneProduct.split())
+        result.append((GeneName, GeneProduct, GeneName in thenots))
+    return result
+
+def newLoop(genes, curatedFile):
+    CuratedNames = lib.ProductNames(curatedFile)
+    result = []
+    thenots = set()
+    for name, product in genes:
+        GeneName, GeneProduct = CuratedNames.lookup([name])
+        if not GeneName:
+            GeneName, GeneProduct = name, product
+            thenots.add(GeneName)
+        GeneProduct = ' '.join(CuratedNames.clean(GeneProduct).split())
+        result.append((GeneName, GeneProduct, GeneName in thenots))
+    return result
+
+#test names, either from file or half curated names (some with changed case) and half made up
+genes = []
+if args.input:
+    with open(args.input, 'rU') as input:
+        for line in input:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) > 1:
+                genes.append((cols[0], cols[1]))
+else:
+    random.seed(1)
+    curated = [x for x in lib.dbIndex(args.curated).items() if not x[0].startswith('\t')]
+    for i in range(args.num):
+        if i % 2 and curated:
+            name, product = random.choice(curated)
+            if i % 3 == 0:
+                name = name.upper()
+        else:
+            name, product = 'Gene%i' % i, 'probable uncharacterized protein family %i homolog' % i
+        genes.append((name, product))
+
+#build the lookup table first, as funannotate setup does, so only the per-gene cleanup is timed
+lib.dbIndex(args.curated)
+
+start = time.time()
+old = oldLoop(genes, args.curated)
+oldTime = time.time() - start
+start = time.time()
+new = newLoop(genes, args.curated)
+newTime = time.time() - start
+#a name that is only in the curated list with different case is found by the new case-folded lookup
+pn = lib.ProductNames(args.curated)
+folded, other = 0, 0
+for gene, x, y in zip(genes, old, new):
+    if x != y:
+        if not gene[0] in pn and pn.fold(gene[0]):
+            folded += 1
+        else:
+            other += 1
+print("%i genes: old loop %.2f s, ProductNames %.2f s (%.0fx)" % (len(genes), oldTime, newTime, oldTime / max(newTime, 1e-6)))
+print("%i genes differ from names only matched by the case-folded index, %i genes differ otherwise" % (folded, other))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import sys, argparse, os, inspect, random, time
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+import lib.library as lib
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+#setup menu with argparse
+parser = argparse.ArgumentParser(prog='benchmark_sequence_kernels.py',
+    description = '''Script to time lib.RevComp, lib.translate and lib.getSeqRegions against the old implementations.''',
+    epilog = """Written by Jon Palmer (2018) nextgenusfs@gmail.com""")
+parser.add_argument('-f', '--fasta', help='Genome FASTA to pull regions from')
+parser.add_argument('-n', '--num', default=2000, type=int, help='Number of sequences/regions to test')
+parser.add_argument('-l', '--length', default=1500, type=int, help='Length of simulated sequences')
+args=parser.parse_args()
+
+#the sequence helpers as they were before the table-driven versions
+def oldRevComp(s):
+    rev_comp_lib = {'A':'T','C':'G','G':'C','T':'A','U':'A','M':'K','R':'Y','W':'W','S':'S','Y':'R','K':'M','V':'B','H':'D','D':'H','B':'V','X':'X','N':'N'}
+    cseq = ''
+    n = len(s)
+    s = s.upper()
+    for i in range(0,n):
+        c = s[n-i-1]
+        cseq += rev_comp_lib[c]
+    return cseq
+
+def oldTranslate(cDNA, strand, phase):
+    def _split(str, num):
+        return [str[start:start+num] for start in range(0, len(str), num)]
+    codon_table = {'TTT': 'F', 'TTC': 'F', 'TTA': 'L', 'TTG': 'L', 'TCT': 'S',
+        'TCC': 'S', 'TCA': 'S', 'TCG': 'S', 'TAT': 'Y', 'TAC': 'Y',
+        'TGT': 'C', 'TGC': 'C', 'TGG': 'W', 'CTT': 'L', 'CTC': 'L',
+        'CTA': 'L', 'CTG': 'L', 'CCT': 'P', 'CCC': 'P', 'CCA': 'P',
+        'CCG': 'P', 'CAT': 'H', 'CAC': 'H', 'CAA': 'Q', 'CAG': 'Q',
+        'CGT': 'R', 'CGC': 'R', 'CGA': 'R', 'CGG': 'R', 'ATT': 'I',
+        'ATC': 'I', 'ATA': 'I', 'ATG': 'M', 'ACT': 'T', 'ACC': 'T',
+        'ACA': 'T', 'ACG': 'T', 'AAT': 'N', 'AAC': 'N', 'AAA': 'K',
+        'AAG': 'K', 'AGT': 'S', 'AGC': 'S', 'AGA': 'R', 'AGG': 'R',
+        'GTT': 'V', 'GTC': 'V', 'GTA': 'V', 'GTG': 'V', 'GCT': 'A',
+        'GCC': 'A', 'GCA': 'A', 'GCG': 'A', 'GAT': 'D', 'GAC': 'D',
+        'GAA': 'E', 'GAG': 'E', 'GGT': 'G', 'GGC': 'G', 'GGA': 'G',
+        'GGG': 'G', 'TAA': '*', 'TAG': '*', 'TGA': '*'}
+    if strand == '-' or strand == -1:
+        seq = oldRevComp(cDNA)
+    else:
+        seq = cDNA
+    seq = seq[phase:]
+    protSeq = []
+    for i in _split(seq, 3):
+        if len(i) == 3:
+            iSeq = i.upper()
+            if iSeq in codon_table:
+                aa = codon_table[iSeq]
+                protSeq.append(aa)
+            else:
+                protSeq.append('X')
+    return ''.join(protSeq)
+
+def oldGetSeqRegions(SeqRecordDict, header, coordinates):
+    result = ''
+    sorted_coordinates = sorted(coordinates, key=lambda tup: tup[0])
+    for x in sorted_coordinates:
+        partial = SeqRecordDict[header][x[0]-1:x[1]]
+        result += str(partial.seq)
+    return result
+
+def timeit(func, items):
+    start = time.time()
+    result = [func(*x) for x in items]
+    return result, time.time() - start
+
+def report(name, old, new):
+    oldResult, oldTime = old
+    newResult, newTime = new
+    diffs = sum(1 for x, y in zip(oldResult, newResult) if x != y)
+    print("%s: old %.3f s, new %.3f s (%.0fx), %i differ" % (name, oldTime, newTime, oldTime / max(newTime, 1e-6), diffs))
+
+random.seed(1)
+if args.fasta:
+    records = SeqIO.to_dict(SeqIO.parse(args.fasta, 'fasta'))
+else:
+    records = {}
+    for i in range(10):
+        records['contig_%i' % i] = SeqRecord(Seq(''.join([random.choice('ACGTacgtN') for x in range(200000)])), id='contig_%i' % i)
+strings = dict((k, str(v.seq)) for k, v in records.items())
+contigs = [k for k, v in records.items() if len(v) > 1000]
+
+#simulated sequences, mixed case with some N, and exon-like regions from the genome
+seqs = [(''.join([random.choice('ACGTacgtN') for x in range(args.length)]),) for i in range(args.num)]
+cdna = [(x[0], random.choice(['+', '-']), random.randint(0, 2)) for x in seqs]
+regions = []
+for i in range(args.num):
+    contig = random.choice(contigs)
+    length = len(strings[contig])
+    coords = []
+    for x in range(random.randint(1, 6)):
+        start = random.randint(1, length - 300)
+        coords.append((start, start + random.randint(50, 299)))
+    regions.append((contig, coords))
+
+report('RevComp', timeit(oldRevComp, seqs), timeit(lib.RevComp, seqs))
+report('translate', timeit(oldTranslate, cdna), timeit(lib.translate, cdna))
+report('getSeqRegions', timeit(oldGetSeqRegions, [(records, h, c) for h, c in regions]),
+    timeit(lib.getSeqRegions, [(strings, h, c) for h, c in regions]))
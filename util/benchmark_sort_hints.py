@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import sys, argparse, os, inspect, random, time, operator, subprocess, shutil, tempfile
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+import lib.library as lib
+from natsort import natsorted
+from collections import Counter
+
+#setup menu with argparse
+parser = argparse.ArgumentParser(prog='benchmark_sort_hints.py',
+    description = '''Script to time lib.sortHints against the old sortHints and join_mult_hints.pl.''',
+    epilog = """Written by Jon Palmer (2018) nextgenusfs@gmail.com""")
+parser.add_argument('-n', '--num', default=400000, type=int, help='Number of hints to simulate')
+parser.add_argument('-c', '--chunk', default=2000000, type=int, help='Lines per sorted run in lib.sortHints')
+parser.add_argument('-j', '--join_mult', help='Path to join_mult_hints.pl, default from PATH or $AUGUSTUS_CONFIG_PATH')
+args=parser.parse_args()
+
+#sortHints as it was, four stable natural sorts of the split lines held in memory
+def sortList(input, col):
+    return natsorted(input, key=operator.itemgetter(col))
+
+def oldSortHints(input, output):
+    data = []
+    with open(input, 'rU') as infile:
+        for line in infile:
+            line = line.rstrip()
+            data.append(line.split('\t'))
+    #replicate this: sort -n -k 4,4 | sort -s -n -k 5,5 | sort -s -n -k 3,3 | sort -s -k 1,1
+    sort1 = sortList(data, 3)
+    sort2 = sortList(sort1, 4)
+    sort3 = sortList(sort2, 2)
+    sort4 = sortList(sort3, 0)
+    with open(output, 'w') as sort_out:
+        for line in sort4:
+            sort_out.write('%s\n' % '\t'.join(line))
+
+def simulate(output, num, features):
+    #hints as bam2hints/exonerate2hints write them, with repeated introns so there is something to join
+    with open(output, 'w') as out:
+        for i in range(num):
+            contig = 'scaffold_%i' % random.randint(1, 200)
+            start = random.randint(1, 500) * 100
+            end = start + random.randint(1, 20) * 10
+            feature = random.choice(features)
+            strand = random.choice(['+', '-'])
+            if feature == 'intron':
+                attributes = 'pri=4;src=E'
+                if random.random() < 0.5:
+                    attributes = 'mult=%i;%s' % (random.randint(2, 50), attributes)
+            else:
+                attributes = 'grp=prot%i;pri=4;src=P' % random.randint(1, 5000)
+            out.write('%s\tb2h\t%s\t%i\t%i\t0\t%s\t.\t%s\n' % (contig, feature, start, end, strand, attributes))
+
+def differ(file1, file2, ordered=True):
+    #lines that differ by position, or if not ordered lines found in only one of the files
+    with open(file1, 'rU') as a:
+        with open(file2, 'rU') as b:
+            A = a.read().splitlines()
+            B = b.read().splitlines()
+    if not ordered:
+        A, B = Counter(A), Counter(B)
+        return sum(((A - B) + (B - A)).values())
+    return sum(1 for x, y in zip(A, B) if x != y) + abs(len(A) - len(B))
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+joinMult = args.join_mult
+if not joinMult:
+    joinMult = lib.which_path('join_mult_hints.pl')
+if not joinMult and 'AUGUSTUS_CONFIG_PATH' in os.environ:
+    joinMult = os.path.join(os.path.dirname(os.environ['AUGUSTUS_CONFIG_PATH'].rstrip(os.sep)), 'scripts', 'join_mult_hints.pl')
+
+random.seed(1)
+tmpdir = tempfile.mkdtemp(prefix='sorthints_')
+try:
+    hints = os.path.join(tmpdir, 'hints.gff')
+    simulate(hints, args.num, ['intron', 'exonpart', 'CDSpart', 'start', 'stop'])
+    oldTime = timed(oldSortHints, hints, os.path.join(tmpdir, 'old.gff'))
+    newTime = timed(lib.sortHints, hints, os.path.join(tmpdir, 'new.gff'), False, args.chunk)
+    print("sortHints, %i hints: old %.2f s, new %.2f s (%.1fx), %i lines differ" % (args.num, oldTime, newTime,
+        oldTime / max(newTime, 1e-6), differ(os.path.join(tmpdir, 'old.gff'), os.path.join(tmpdir, 'new.gff'))))
+
+    #intron only hints, as from bam2hints, sorted and joined
+    introns = os.path.join(tmpdir, 'introns.gff')
+    simulate(introns, args.num, ['intron'])
+    if joinMult and os.path.isfile(joinMult):
+        start = time.time()
+        oldSortHints(introns, os.path.join(tmpdir, 'old.sorted.gff'))
+        with open(os.path.join(tmpdir, 'old.sorted.gff'), 'rU') as infile:
+            with open(os.path.join(tmpdir, 'old.joined.gff'), 'w') as outfile:
+                subprocess.call([joinMult], stdin=infile, stdout=outfile)
+        oldTime = time.time() - start
+        newTime = timed(lib.sortHints, introns, os.path.join(tmpdir, 'new.joined.gff'), True, args.chunk)
+        print("sortHints join=True, %i introns: old + join_mult_hints.pl %.2f s, new %.2f s (%.1fx), %i lines differ" % (args.num,
+            oldTime, newTime, oldTime / max(newTime, 1e-6), differ(os.path.join(tmpdir, 'old.joined.gff'), os.path.join(tmpdir, 'new.joined.gff'), False)))
+    else:
+        print("join_mult_hints.pl not found, skipping join=True comparison (pass it with --join_mult)")
+finally:
+    shutil.rmtree(tmpdir)
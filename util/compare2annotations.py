@@ -739,6 +739,7 @@ def compareAnnotations(old, oldformat, new, newformat, fasta, measure_pident, ou
     result = {}
     global no_change, identicalCDS, refUnique, queryUnique
     no_change, identicalCDS, refUnique, queryUnique, totalmatches, totallength = (0,)*6
+    matched = []
     if oldformat == 'gff':
         oldInter, oldGenes = gff2interlap(old, fasta)
     else:
@@ -793,12 +794,12 @@ def compareAnnotations(old, oldformat, new, newformat, fasta, measure_pident, ou
                 #get the old annotation
                 hitInfo = oldGenes.get(besthit[1])
                 
-                #calculate AED
-                exonAED = pairwiseAED(newGenes[gene[2]]['mRNA'], hitInfo['mRNA'])
+                #AED of all matches is calculated in one batch after the loop
                 if newGenes[gene[2]]['type'] == 'mRNA' and hitInfo['type'] == 'mRNA':
-                    cdsAED = pairwiseAED(newGenes[gene[2]]['CDS'], hitInfo['CDS'])
+                    cdsPair = (newGenes[gene[2]]['CDS'], hitInfo['CDS'])
                 else:
-                    cdsAED = '0.000'
+                    cdsPair = None
+                matched.append((None if besthit[1] in result else besthit[1], (newGenes[gene[2]]['mRNA'], hitInfo['mRNA']), cdsPair))
                 
                 #check translation, to deal with multiple transcripts, lets loop through new
                 if measure_pident:
@@ -822,14 +823,22 @@ def compareAnnotations(old, oldformat, new, newformat, fasta, measure_pident, ou
                 if not besthit[1] in result:
                     result[besthit[1]] = {'contig': newGenes[gene[2]]['contig'], 'location': hitInfo['location'], 'ref_type': hitInfo['type'], 'ref_location': hitInfo['location'], 
                                 'query_location': newGenes[gene[2]]['location'], 'query_id': gene[2], 'query_type': newGenes[gene[2]]['type'], 'pident': protMatches,
-                                'cdsAED': cdsAED, 'exonAED': exonAED, 'ref_transcripts': len(hitInfo['ids']), 'query_transcripts': len(newGenes[gene[2]]['ids']),
+                                'cdsAED': None, 'exonAED': None, 'ref_transcripts': len(hitInfo['ids']), 'query_transcripts': len(newGenes[gene[2]]['ids']),
                                 'ref_strand': hitInfo['strand'], 'query_strand': newGenes[gene[2]]['strand'], 'ref_id': besthit[1]}
-                #get some summary stats as you loop through
-                if float(exonAED) == 0 and float(cdsAED) == 0:
-                    no_change += 1
-                elif float(cdsAED) == 0:
-                    identicalCDS += 1
-                    
+
+    #calculate AED of the matched models and get some summary stats
+    exonAEDs = lociAED([x[1] for x in matched])
+    cdsAEDs = iter(lociAED([x[2] for x in matched if x[2]]))
+    for x, y in zip(matched, exonAEDs):
+        exonAED = '{:.3f}'.format(y)
+        cdsAED = '{:.3f}'.format(next(cdsAEDs)) if x[2] else '0.000'
+        if x[0]:
+            result[x[0]]['exonAED'] = exonAED
+            result[x[0]]['cdsAED'] = cdsAED
+        if float(exonAED) == 0 and float(cdsAED) == 0:
+            no_change += 1
+        elif float(cdsAED) == 0:
+            identicalCDS += 1
          
     total_cdsAED = []
     total_exonAED = []   
@@ -914,69 +923,66 @@ def findUTRs(cds, mrna, strand):
         UTRs.append((Fiveprime,Threeprime))
     return UTRs
 
-def pairwiseAED(query, reference):
+def batchAED(pairs):
     '''
-    takes a multiple transcripts and sums AED from lowest pairwise comparison and then calculates
-    the average based on number of transcripts in the query
+    annotation edit distance of many (query, reference) exon coordinate lists at once
+    AED = 1 - (SN + SP / 2), exons of all pairs are flattened into numpy arrays and every query exon
+    is compared to the reference exons of its pair, overlap is summed per pair with bincount
+    returns numpy array of AED rounded like the old '{:.3f}' formatted values
     '''
-    AEDsum = []
-    pAED = [float(getAED(a,b)) for a, b in itertools.product(query, reference)]
-    #split into parts to get lowest AED
-    splitAED = [pAED[i:i+len(query)] for i  in range(0, len(pAED), len(query))]
-    for pair in splitAED:
-        AEDsum.append(min(pair))
-    AEDavg = sum(AEDsum) / len(query)
-    return '{:.3f}'.format(AEDavg)
-
+    num = len(pairs)
+    if num == 0:
+        return np.zeros(0)
+    qCount = np.array([len(q) for q,r in pairs], dtype=np.int64)
+    rCount = np.array([len(r) for q,r in pairs], dtype=np.int64)
+    qCoords = np.fromiter(itertools.chain.from_iterable(x for q,r in pairs for x in q), dtype=np.int64).reshape(-1, 2)
+    rCoords = np.fromiter(itertools.chain.from_iterable(x for q,r in pairs for x in r), dtype=np.int64).reshape(-1, 2)
+    qPair = np.repeat(np.arange(num), qCount)
+    rPair = np.repeat(np.arange(num), rCount)
+    qLen = np.bincount(qPair, weights=np.abs(qCoords[:,0] - qCoords[:,1]), minlength=num)
+    rLen = np.bincount(rPair, weights=np.abs(rCoords[:,0] - rCoords[:,1]), minlength=num)
+    #every query exon against each reference exon of the same pair
+    rFirst = np.cumsum(rCount) - rCount
+    perQuery = rCount[qPair]
+    qIdx = np.repeat(np.arange(len(qPair)), perQuery)
+    offset = np.arange(len(qIdx)) - np.repeat(np.cumsum(perQuery) - perQuery, perQuery)
+    rIdx = rFirst[qPair[qIdx]] + offset
+    qs, qe = qCoords[qIdx,0], qCoords[qIdx,1]
+    rs, re = rCoords[rIdx,0], rCoords[rIdx,1]
+    hit = (qs <= re) & (qe >= rs)
+    cov = np.minimum(qe[hit], re[hit]) - np.maximum(qs[hit], rs[hit])
+    overlap = np.bincount(qPair[qIdx[hit]], weights=cov, minlength=num)
+    AED = np.zeros(num)
+    ok = (qLen > 0) & (rLen > 0)
+    AED[ok] = 1 - ((overlap[ok] / rLen[ok] + overlap[ok] / qLen[ok]) / 2)
+    for i, (q, r) in enumerate(pairs):
+        if q == r:
+            AED[i] = 0
+    return np.array([float('{:.3f}'.format(x)) for x in AED])
 
-def getAED(query, reference):
+def lociAED(loci):
     '''
-    function to calcuate annotation edit distance between two mRNA transcript coordinates
-    AED = 1 - (SN + SP / 2)
-    SN = fraction of ref predicted
-    SP = fraction prediction overlapping the ref
+    takes list of (query transcripts, reference transcripts) for each locus, sums lowest AED from
+    the pairwise transcript comparisons and averages by number of query transcripts, all loci are
+    passed to batchAED in one go, returns numpy array of the average AED for each locus
     '''
-    def _length(listTup):
-        len = 0
-        for i in listTup:
-            l = abs(i[0] - i[1])
-            len += l
-        return len
-    #check if identical
-    if query == reference:
-       return '0.000'
-    #make sure sorted
-    rLen = _length(reference)
-    refInterlap = InterLap(reference)
-    RefPred = 0
-    QueryOverlap = 0
-    qLen = 0
-    for exon in query:
-        qLen += abs(exon[0] - exon[1])
-        if exon in refInterlap: #exon overlaps at least partially with reference
-            hit = list(refInterlap.find(exon))
-            for h in hit:
-                diff = np.subtract(exon,h) #will return array of exon minus hit at each pos
-                if diff[0] <= 0 and diff[1] >= 0: #then query exon covers ref exon
-                    cov = abs(h[0] - h[1])
-                    QueryOverlap += cov
-                elif diff[0] <= 0 and diff[1] < 0: # means query partial covers ref
-                    cov = abs(h[0] - exon[1])
-                    QueryOverlap += cov
-                elif diff[0] > 0 and diff[1] >= 0: #means query partial covers ref
-                    cov = abs(exon[0] - h[1])
-                    QueryOverlap += cov        
-                elif diff[0] > 0 and diff[1] < 1:
-                    cov = abs(exon[0] - exon[1])
-                    QueryOverlap += cov
-    #calculate AED
-    if qLen > 0 and rLen > 0:
-        SP = QueryOverlap / float(qLen)
-        SN = QueryOverlap / float(rLen)
-        AED = 1 - ((SN + SP) / 2)
-    else:
-        AED = 0.000
-    return '{:.3f}'.format(AED)
+    pairs = []
+    for query, reference in loci:
+        pairs.extend(itertools.product(query, reference))
+    result = np.zeros(len(loci))
+    if not pairs:
+        return result
+    pAED = batchAED(pairs)
+    qCount = np.array([len(q) for q,r in loci], dtype=np.int64)
+    rCount = np.array([len(r) for q,r in loci], dtype=np.int64)
+    #product of each locus is split into rCount chunks of len(query), lowest AED of each chunk
+    chunkLocus = np.repeat(np.arange(len(loci)), rCount * (qCount > 0))
+    chunkStart = np.cumsum(qCount[chunkLocus]) - qCount[chunkLocus]
+    lowest = np.minimum.reduceat(pAED, chunkStart)
+    AEDsum = np.bincount(chunkLocus, weights=lowest, minlength=len(loci))
+    ok = qCount > 0
+    result[ok] = AEDsum[ok] / qCount[ok]
+    return result
     
 def main():
     parser = argparse.ArgumentParser(prog='compare2annotations.py', usage="%(prog)s [options] -q query_annotation -r ref_annotation -o output",
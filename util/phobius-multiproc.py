@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import sys, os, time, multiprocessing, subprocess, inspect, argparse, shutil
 from Bio import SeqIO
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
@@ -18,6 +19,7 @@ parser.add_argument('-i','--input', required=True, help='whole proteome')
 parser.add_argument('-o','--out', required=True, help='Phobius results')
 parser.add_argument('-e','--email', help='Email address for IPRSCAN server')
 parser.add_argument('-l','--logfile', default='phobius-multiproc.log', help='Logfile')
+parser.add_argument('--cpus', default=multiprocessing.cpu_count(), type=int, help='Number of CPUs for local phobius')
 parser.add_argument('--debug',action='store_true', help='Keep intermediate files')
 args=parser.parse_args()
 
@@ -31,12 +33,29 @@ def runPhobiusRemote(Input):
     os.rename(OUTPATH+'.out.txt', OUTPATH+'.phobius')
     os.remove(OUTPATH+'.sequence.txt')
 
-def runPhobiusLocal(Input):
-    base = Input.split('/')[-1]
-    base = base.split('.fa')[0]
-    OUTPATH = os.path.join(TMPDIR, base+'.phobius')
-    cmd = ['phobius.pl', '-short', Input]
-    lib.runSubprocess2(cmd, TMPDIR, lib.log, OUTPATH)
+def runPhobiusLocal(batch):
+    #batch is a tuple of (index, fasta string), phobius.pl reads the sequences from stdin
+    i, records = batch
+    proc = subprocess.Popen(['phobius.pl', '-short'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate(records)
+    if proc.returncode != 0:
+        return i, [], stderr
+    return i, stdout.splitlines(), stderr
+
+def phobiusBatches(input, cpus):
+    '''
+    group the proteome into batches of fasta text, about 4 batches per cpu so that perl/phobius
+    startup is paid once per batch rather than once per protein
+    '''
+    records = []
+    with open(input, 'rU') as infile:
+        for title, seq in SimpleFastaParser(infile):
+            records.append('>%s\n%s\n' % (title.split()[0], seq))
+    size = max(1, len(records) // (cpus*4) + 1)
+    batches = []
+    for i in range(0, len(records), size):
+        batches.append((len(batches), ''.join(records[i:i+size])))
+    return batches
 
 #create log file
 log_name = args.logfile
@@ -49,49 +68,51 @@ FNULL = open(os.devnull, 'w')
 cmd_args = " ".join(sys.argv)+'\n'
 lib.log.debug(cmd_args)
 
-#create tmpdir to store fasta files and output files
-TMPDIR = 'phobius_' + str(os.getpid())
-
-#split fasta
-lib.splitFASTA(args.input, TMPDIR)
-
-#now get list of files in tmpdir
-proteins = []
-for file in os.listdir(TMPDIR):
-    if file.endswith('.fa'):
-        proteins.append(file)
-
-#now run the script
+phobius = []
 if lib.which('phobius.pl'):
-    lib.runMultiProgress(runPhobiusLocal, proteins, multiprocessing.cpu_count())
+    #batched local run, results are collected in memory
+    batches = phobiusBatches(args.input, args.cpus)
+    results = {}
+    for i, lines, stderr in lib.runMultiProgressResults(runPhobiusLocal, batches, args.cpus):
+        if stderr:
+            lib.log.debug(stderr)
+        if not lines:
+            lib.log.error("phobius.pl failed on batch %i" % i)
+        results[i] = lines
+    for i in range(len(batches)):
+        phobius += results.get(i, [])
 else:
+    #remote server only takes one sequence per job, so split into single fasta files
+    TMPDIR = 'phobius_' + str(os.getpid())
+    lib.splitFASTA(args.input, TMPDIR)
+    proteins = []
+    for file in os.listdir(TMPDIR):
+        if file.endswith('.fa'):
+            proteins.append(file)
     lib.runMultiProgress(runPhobiusRemote, proteins, 29) #max is 30 jobs at a time
-
-#collect all results
-phobius = []
-for file in os.listdir(TMPDIR):
-    if file.endswith('.phobius'):
-        phobius.append(os.path.join(TMPDIR,file))
+    for file in os.listdir(TMPDIR):
+        if file.endswith('.phobius'):
+            with open(os.path.join(TMPDIR,file), 'rU') as input:
+                phobius += input.readlines()[1:2]
+    if not args.debug:
+        shutil.rmtree(TMPDIR)
 
 #write output
 TMdomain = 0
 SigPep = 0
+total = 0
 with open(args.out, 'w') as output:
     output.write("%s\t%s\t%s\t%s\n" % ('ID', 'TM', 'SP', 'Prediction'))
-    for x in phobius:
-        with open(x, 'rU') as input:
-            line = input.readlines()
-            result = line[1].split(' ')
-            result = [x for x in result if x]
-            if result[1] == 'prediction':
-                continue
-            if int(result[1]) > 0:
-                TMdomain += 1
-            if result[2] == 'Y':
-                SigPep += 1
-            output.write("%s\t%s\t%s\t%s\n" % (result[0], result[1], result[2], result[3].replace('\n', '')))
+    for line in phobius:
+        result = line.split()
+        #skip the header line(s)
+        if len(result) < 4 or not result[1].isdigit():
+            continue
+        total += 1
+        if int(result[1]) > 0:
+            TMdomain += 1
+        if result[2] == 'Y':
+            SigPep += 1
+        output.write("%s\t%s\t%s\t%s\n" % (result[0], result[1], result[2], result[3]))
 
-#clean
-if not args.debug:      
-    shutil.rmtree(TMPDIR)
-lib.log.debug("%i total proteins, %i TMdomain, %i Signal Peptide" % (len(phobius), TMdomain, SigPep))
+lib.log.debug("%i total proteins, %i TMdomain, %i Signal Peptide" % (total, TMdomain, SigPep))
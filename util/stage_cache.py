@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import sys, argparse, os, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+import lib.library as lib
+
+#setup menu with argparse
+parser = argparse.ArgumentParser(prog='stage_cache.py',
+    description = '''Script to list or invalidate cached pipeline stages in a funannotate output folder.''',
+    epilog = """Written by Jon Palmer (2018) nextgenusfs@gmail.com""")
+parser.add_argument('-i', '--input', required=True, help='funannotate output folder')
+parser.add_argument('--invalidate', nargs='+', help='Stage(s) to invalidate, ie p2g augustus')
+parser.add_argument('--all', action='store_true', help='Invalidate all stages')
+args=parser.parse_args()
+
+#stage manifests are written by predict, train, and update
+manifests = []
+for x in ['predict_misc', 'training', 'update_misc']:
+    if os.path.isfile(os.path.join(args.input, x, 'stages.json')):
+        manifests.append(os.path.join(args.input, x, 'stages.json'))
+if len(manifests) < 1:
+    print("No stage manifests found in %s" % args.input)
+    sys.exit(1)
+
+#StageCache logs to lib.log, which is normally created by setupLogging in the main scripts
+lib.log = lib.logging.getLogger(__name__)
+
+for m in manifests:
+    cache = lib.StageCache(m)
+    folder = os.path.basename(os.path.dirname(m))
+    if args.all:
+        for x in cache.invalidate():
+            print("Invalidated %s/%s" % (folder, x))
+    elif args.invalidate:
+        for stage in args.invalidate:
+            for x in cache.invalidate(stage):
+                print("Invalidated %s/%s" % (folder, x))
+    else:
+        print("%s:" % folder)
+        for stage, entry in cache.stages():
+            print("  %-18s %s" % (stage, entry['date']))
+            print("    outputs:  %s" % ', '.join(entry['outputs']))
+            if entry['inputs']:
+                print("    inputs:   %s" % ', '.join(entry['inputs']))
+            if entry['args']:
+                print("    args:     %s" % ', '.join(entry['args']))
+            if any(x != 'None' for x in entry['versions']):
+                print("    versions: %s" % ', '.join(entry['versions']))